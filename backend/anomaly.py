@@ -0,0 +1,195 @@
+import os
+import pickle
+import threading
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from cache import LRUCache
+from metrics import timed
+
+ROLLING_WINDOW = 30
+Z_THRESHOLD = 2.5
+CONTAMINATION = 0.05
+
+# Rolling mean/std (sample std, like pandas .rolling().std()) over the last
+# axis using cumulative sums, so any number of equal-length series can be
+# processed in one call. The first window-1 positions are NaN.
+def rolling_stats(values, window=ROLLING_WINDOW):
+    values = np.asarray(values, dtype=np.float64)
+    shape = values.shape
+    mean = np.full(shape, np.nan)
+    std = np.full(shape, np.nan)
+    if shape[-1] < window:
+        return mean, std
+    padding = [(0, 0)] * (values.ndim - 1) + [(1, 0)]
+    sums = np.pad(np.cumsum(values, axis=-1), padding)
+    squares = np.pad(np.cumsum(values * values, axis=-1), padding)
+    window_sum = sums[..., window:] - sums[..., :-window]
+    window_squares = squares[..., window:] - squares[..., :-window]
+    mean[..., window - 1:] = window_sum / window
+    variance = (window_squares - window_sum * window_sum / window) / (window - 1)
+    std[..., window - 1:] = np.sqrt(np.maximum(variance, 0))
+    return mean, std
+
+# Rolling z-score of each point against its trailing window
+def rolling_zscore(values, window=ROLLING_WINDOW):
+    mean, std = rolling_stats(values, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_score = (np.asarray(values, dtype=np.float64) - mean) / std
+    return mean, std, z_score
+
+# O(1)-per-point streaming version of rolling_zscore: a ring buffer plus
+# running sum and sum of squares over the last `window` observations.
+class StreamingZScore:
+    def __init__(self, window=ROLLING_WINDOW, threshold=Z_THRESHOLD):
+        self.window = window
+        self.threshold = threshold
+        self._buffer = np.zeros(window)
+        self._position = 0
+        self._count = 0
+        self._sum = 0.0
+        self._squares = 0.0
+
+    # Add one observation; returns (rolling_mean, rolling_std, z_score, is_anomaly)
+    def update(self, value):
+        value = float(value)
+        if self._count >= self.window:
+            old = self._buffer[self._position]
+            self._sum -= old
+            self._squares -= old * old
+        else:
+            self._count += 1
+        self._buffer[self._position] = value
+        self._position = (self._position + 1) % self.window
+        self._sum += value
+        self._squares += value * value
+        if self._count < self.window:
+            return np.nan, np.nan, np.nan, False
+        mean = self._sum / self.window
+        std = np.sqrt(max((self._squares - self._sum * mean) / (self.window - 1), 0.0))
+        z_score = (value - mean) / std if std > 0 else np.nan
+        return mean, std, z_score, bool(abs(z_score) > self.threshold)
+
+    def extend(self, values):
+        return [self.update(value) for value in values]
+
+# Feature matrix [NDVI, rolling_mean, rolling_std] with NaNs replaced by
+# column means (what SimpleImputer(strategy='mean') did)
+def anomaly_features(ndvi, rolling_mean, rolling_std):
+    features = np.column_stack([ndvi, rolling_mean, rolling_std])
+    column_means = np.nanmean(features, axis=0)
+    missing = np.isnan(features)
+    features[missing] = np.take(column_means, np.nonzero(missing)[1])
+    return features
+
+def fit_isolation_forest(features):
+    with timed('sat', 'anomaly_fit'):
+        return IsolationForest(contamination=CONTAMINATION, random_state=42).fit(features)
+
+# Per-AOI IsolationForest models, fitted once, pickled to disk and refit
+# only when the AOI's history has observations newer than the last fit.
+# Each AOI is one <key>.entry.pkl holding the model and its metadata,
+# published with a single rename so other workers never read a partial
+# entry or a model paired with another fit's metadata. Recently used
+# models are also kept unpickled in memory.
+class AnomalyModelStore:
+    def __init__(self, root, cache_size=256):
+        self.root = root
+        self._memory = LRUCache(cache_size)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self.fits = 0
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.entry.pkl')
+
+    def _lock_for(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _load(self, key):
+        entry = self._memory.get(key)
+        if entry is not None:
+            return entry
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            # A missing or unreadable entry is fitted (again) and replaced
+            return None
+        self._memory.set(key, entry)
+        return entry
+
+    # Model for `key`, refit on `features` only if `last_date` is newer
+    # than the data the stored model was fitted on
+    def model_for(self, key, features, last_date):
+        last_date = str(last_date)
+        with self._lock_for(key):
+            entry = self._load(key)
+            if entry is not None and entry[1]["last_date"] >= last_date:
+                return entry[0]
+            model = fit_isolation_forest(features)
+            self.fits += 1
+            meta = {"last_date": last_date, "observations": len(features)}
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(key)
+            # Per process and thread, so concurrent fits never share a temp file
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                pickle.dump((model, meta), f)
+            os.replace(tmp, path)
+            self._memory.set(key, (model, meta))
+            return model
+
+    def stats(self):
+        return {"fits": self.fits, "memory": self._memory.stats()}
+
+# Fill the anomaly columns of `df` from precomputed rolling statistics and
+# return the IsolationForest used (the AOI's stored model when a store and
+# key are given, otherwise one fitted for this call)
+def _score_frame(df, ndvi, rolling_mean, rolling_std, z_score, store=None, key=None):
+    df['rolling_mean'] = rolling_mean
+    df['rolling_std'] = rolling_std
+    df['z_score'] = z_score
+    df['z_anomaly'] = np.abs(np.nan_to_num(z_score)) > Z_THRESHOLD
+
+    features = anomaly_features(ndvi, rolling_mean, rolling_std)
+    if store is not None and key is not None:
+        model = store.model_for(key, features, df.index[-1].date())
+    else:
+        model = fit_isolation_forest(features)
+    df['if_anomaly'] = model.predict(features) == -1
+
+    df['anomaly'] = df['z_anomaly'] | df['if_anomaly']
+    return model
+
+# Score one daily NDVI series (a DataFrame indexed by date with an 'NDVI'
+# column), adding the columns detect_anomalies always produced.
+# Returns (df, model).
+def score_series(df, store=None, key=None):
+    ndvi = df['NDVI'].to_numpy(dtype=np.float64)
+    rolling_mean, rolling_std, z_score = rolling_zscore(ndvi)
+    model = _score_frame(df, ndvi, rolling_mean, rolling_std, z_score, store, key)
+    return df, model
+
+# Batch API: score many AOIs ({key: df}) in one call. Series of equal
+# length share a single vectorized rolling-statistics pass.
+def score_many(series_by_key, store=None):
+    by_length = {}
+    for key, df in series_by_key.items():
+        by_length.setdefault(len(df), []).append(key)
+    for keys in by_length.values():
+        stacked = np.vstack([series_by_key[key]['NDVI'].to_numpy(dtype=np.float64) for key in keys])
+        rolling_mean, rolling_std, z_score = rolling_zscore(stacked)
+        for row, key in enumerate(keys):
+            _score_frame(series_by_key[key], stacked[row], rolling_mean[row], rolling_std[row], z_score[row], store, key)
+    return series_by_key
+
+# Flag anomalies in future values that continue `history`: rolling stats
+# come from a streaming detector primed with the last window of history,
+# and the history's model is reused instead of fitting on the new values.
+def score_future(history_ndvi, future_ndvi, model):
+    detector = StreamingZScore()
+    detector.extend(np.asarray(history_ndvi)[-detector.window:])
+    stats = np.array(detector.extend(future_ndvi), dtype=np.float64).reshape(-1, 4)
+    features = anomaly_features(np.asarray(future_ndvi, dtype=np.float64), stats[:, 0], stats[:, 1])
+    return (model.predict(features) == -1) | stats[:, 3].astype(bool)
@@ -0,0 +1,388 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.datastructures import FormData
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from startup import lazy_module, preload, startup_report
+from iot import get_iot_data, iot_history
+from iot_ingest import INGEST_MAX_BYTES, ingest_readings
+from stream import TickBroadcaster
+from cd import analyze_crop_disease, analyze_crop_disease_batch, interpreter_pool, micro_batcher, prediction_cache
+from metrics import (CONTENT_TYPE, PROFILE_HEADER, finish_profile, load_profile, profiling_requested, record_error,
+                     record_request, register_queue, registry, start_profile)
+
+# Async serving mode with the same routes as main_app.py:
+#
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+#
+# Handlers never block the event loop. Remote calls (Earth Engine, weather)
+# run on a large I/O thread pool and are awaited; CPU work (TFLite, sklearn,
+# pandas, matplotlib) runs on a small pool sized to the cores. Each route
+# has its own concurrency limit and a bounded wait queue: when the queue is
+# full the request is refused with 429 straight away instead of piling up.
+
+IO_WORKERS = int(os.environ.get('ASGI_IO_WORKERS', 32))
+CPU_WORKERS = int(os.environ.get('ASGI_CPU_WORKERS', os.cpu_count() or 1))
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='asgi-io')
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='asgi-cpu')
+register_queue('asgi_io', lambda: io_executor._work_queue.qsize())
+register_queue('asgi_cpu', lambda: cpu_executor._work_queue.qsize())
+logger = logging.getLogger(__name__)
+
+# Per-route (concurrent, queued) limits; override with e.g.
+# ASGI_LIMITS="satellite=2:4,chat=16:64"
+ROUTE_LIMITS = {
+    "crop_disease": (4, 32),
+    "crop_disease_batch": (1, 4),
+    "iot": (8, 64),
+    "iot_ingest": (1, 8),
+    "chat": (32, 128),
+    "satellite": (4, 16),
+}
+for item in filter(None, os.environ.get('ASGI_LIMITS', '').split(',')):
+    name, _, limits = item.partition('=')
+    concurrent, _, queued = limits.partition(':')
+    ROUTE_LIMITS[name.strip()] = (int(concurrent), int(queued or 0))
+
+class Overloaded(Exception):
+    pass
+
+# Concurrency limit for one route: up to `concurrent` requests run at once,
+# up to `queued` more wait for a slot, and anything beyond that is shed
+class RouteLimiter:
+    def __init__(self, name, concurrent, queued):
+        self.name = name
+        self.concurrent = concurrent
+        self.queued = queued
+        self._semaphore = None
+        self.waiting = 0
+        self.running = 0
+        self.served = 0
+        self.shed = 0
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            # Created lazily so it binds to the server's event loop
+            self._semaphore = asyncio.Semaphore(self.concurrent)
+        if self._semaphore.locked() and self.waiting >= self.queued:
+            self.shed += 1
+            raise Overloaded(self.name)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.running -= 1
+        self.served += 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {
+            "concurrent": self.concurrent,
+            "queued": self.queued,
+            "running": self.running,
+            "waiting": self.waiting,
+            "served": self.served,
+            "shed": self.shed,
+        }
+
+limiters = {name: RouteLimiter(name, *limits) for name, limits in ROUTE_LIMITS.items()}
+for name, limiter in limiters.items():
+    register_queue(f'route_{name}', lambda limiter=limiter: limiter.waiting)
+registry.gauge("route_shed_requests", "Requests refused with 429 by each route's limiter.",
+               lambda: {(name,): limiter.shed for name, limiter in limiters.items()}, ("route",))
+
+async def run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(io_executor, fn, *args)
+
+async def run_cpu(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, fn, *args)
+
+def too_many_requests(route):
+    return JSONResponse(
+        {"error": f"Too many {route} requests in progress, try again shortly."},
+        status_code=429, headers={"Retry-After": "1"},
+    )
+
+# Wrap a handler in its route's limiter, turning shed requests into 429s
+def limited(route):
+    def decorate(handler):
+        async def endpoint(request):
+            try:
+                async with limiters[route]:
+                    return await handler(request)
+            except Overloaded:
+                return too_many_requests(route)
+        return endpoint
+    return decorate
+
+# Optionally load heavy subsystems up front, e.g. PRELOAD=iot,cd,sat,chat
+if os.environ.get('PRELOAD'):
+    print(f"Startup report: {preload(os.environ['PRELOAD'].split(','))}")
+
+# Shared IoT stream producer, as in main_app.py
+IOT_STREAM_INTERVAL = float(os.environ.get('IOT_STREAM_INTERVAL', 5))
+IOT_STREAM_KEEPALIVE = 15
+iot_broadcaster = TickBroadcaster(get_iot_data, interval=IOT_STREAM_INTERVAL, name='iot-stream')
+registry.gauge("iot_stream_subscribers", "Open IoT stream connections.", lambda: iot_broadcaster.stats()["subscribers"])
+
+# Count and log an exception caught by a route handler
+def report_error(request, error):
+    record_error(route_paths.get(request.scope.get("endpoint"), "unmatched"), error)
+    logger.exception("Error handling %s %s", request.method, request.url.path)
+
+# Starlette uploads in the shape cd.py expects from Flask/werkzeug file storage
+class Upload:
+    def __init__(self, upload):
+        self.filename = upload.filename or ''
+        self.stream = upload.file
+
+    def read(self):
+        return self.stream.read()
+
+# A body that isn't valid form data reads as an empty form, as in Flask,
+# so the handlers answer with their usual 400 instead of a 500
+async def form_uploads(request, *names):
+    try:
+        form = await request.form()
+    except HTTPException:
+        form = FormData()
+    uploads = [Upload(item) for name in names for item in form.getlist(name) if hasattr(item, 'filename')]
+    return form, uploads
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except json.JSONDecodeError:
+        return None
+
+# Route for Crop Disease Analysis
+@limited("crop_disease")
+async def analyze_crop(request):
+    try:
+        form, uploads = await form_uploads(request, 'file')
+        if not uploads:
+            return JSONResponse({"error": "No file part"}, status_code=400)
+        crop_type = form.get('cropType')
+        if not crop_type:
+            return JSONResponse({"error": "Crop type is required"}, status_code=400)
+        result = await run_cpu(analyze_crop_disease, uploads[0], crop_type)
+        return JSONResponse(result)
+    except Exception as e:
+        report_error(request, e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# Route for analyzing many images of one plot at once
+@limited("crop_disease_batch")
+async def analyze_crop_batch(request):
+    try:
+        form, uploads = await form_uploads(request, 'files', 'file')
+        if not uploads:
+            return JSONResponse({"error": "No files provided"}, status_code=400)
+        crop_type = form.get('cropType')
+        if not crop_type:
+            return JSONResponse({"error": "Crop type is required"}, status_code=400)
+        result = await run_cpu(analyze_crop_disease_batch, uploads, crop_type)
+        return JSONResponse(result)
+    except Exception as e:
+        report_error(request, e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def analyze_crop_stats(request):
+    return JSONResponse({
+        "interpreters": interpreter_pool.stats(),
+        "batching": micro_batcher.stats(),
+        "cache": prediction_cache.stats(),
+    })
+
+# Route for IoT Data
+@limited("iot")
+async def iot_data(request):
+    try:
+        return JSONResponse(await run_cpu(get_iot_data))
+    except Exception as e:
+        report_error(request, e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# Route for stored IoT readings: raw readings or hourly/daily aggregates
+@limited("iot")
+async def iot_history_endpoint(request):
+    try:
+        return JSONResponse(await run_cpu(iot_history, dict(request.query_params)))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        report_error(request, e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# Route for bulk gateway uploads: NDJSON, CSV or .npz columns, validated,
+# scored in one pass and stored
+@limited("iot_ingest")
+async def iot_ingest_endpoint(request):
+    try:
+        if int(request.headers.get('content-length') or 0) > INGEST_MAX_BYTES:
+            return JSONResponse({"error": f"Payload is larger than {INGEST_MAX_BYTES} bytes."}, status_code=413)
+        body = await request.body()
+        return JSONResponse(await run_cpu(ingest_readings, body, request.headers.get('content-type'),
+                                          dict(request.query_params)))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        report_error(request, e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# Route for streaming IoT Data (Server-Sent Events). The broadcaster wakes
+# the stream's event when it publishes a tick, so open streams hold no
+# threads and do no work between ticks.
+async def iot_stream(request):
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    subscription = iot_broadcaster.subscribe(notify=lambda: loop.call_soon_threadsafe(wake.set))
+
+    async def events():
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), IOT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                wake.clear()
+                data = subscription.get(timeout=0)
+                if data is not None:
+                    yield f"data: {json.dumps(data)}\n\n"
+        finally:
+            # Runs when the client disconnects
+            subscription.close()
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Route for Chatbot Handling. The chatbot's satellite and weather fetches
+# are network-bound (and already concurrent), so it runs on the I/O pool.
+@limited("chat")
+async def handle_chat(request):
+    try:
+        data = await json_body(request) or {}
+        user_input = data.get("message", "").strip()
+        if not user_input:
+            return JSONResponse({"error": "Message cannot be empty."}, status_code=400)
+        bot_response = await run_io(lambda: lazy_module('cb').chatbot(user_input))
+        return JSONResponse({"response": bot_response})
+    except Exception as e:
+        report_error(request, e)
+        return JSONResponse({"error": f"An error occurred: {str(e)}"}, status_code=500)
+
+# Route for Satellite Data Analysis: the Earth Engine/cache fetch is awaited
+# on the I/O pool, then the analysis and chart run on the CPU pool
+@limited("satellite")
+async def analyze_satellite(request):
+    try:
+        data = await json_body(request) or {}
+        sat = await run_io(lazy_module, 'sat')
+        try:
+            inputs = await run_io(sat.fetch_satellite_inputs, data)
+            result = await run_cpu(sat.satellite_result, inputs)
+        except Exception as e:
+            raise Exception(f"Error during satellite analysis: {str(e)}")
+        return JSONResponse(result)
+    except Exception as e:
+        report_error(request, e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def startup_report_endpoint(request):
+    return JSONResponse(startup_report())
+
+# Per-route concurrency, queue and load-shedding counters
+async def limits_endpoint(request):
+    return JSONResponse({name: limiter.stats() for name, limiter in limiters.items()})
+
+# Route for Prometheus metrics: request latency, stage timings, caches and queues
+async def metrics_endpoint(request):
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+# Route for a profiled request's collapsed stacks (flamegraph input)
+async def profile_endpoint(request):
+    if not profiling_requested(request.headers.get(PROFILE_HEADER)):
+        return JSONResponse({"error": "Profiling is not enabled"}, status_code=403)
+    stacks = load_profile(request.path_params['profile_id'])
+    if stacks is None:
+        return JSONResponse({"error": "Unknown profile id"}, status_code=404)
+    return PlainTextResponse(stacks)
+
+routes = [
+    Route('/api/analyze-crop-disease', analyze_crop, methods=['POST']),
+    Route('/api/analyze-crop-disease/batch', analyze_crop_batch, methods=['POST']),
+    Route('/api/analyze-crop-disease/stats', analyze_crop_stats, methods=['GET']),
+    Route('/api/iot-data', iot_data, methods=['GET']),
+    Route('/api/iot-stream', iot_stream, methods=['GET']),
+    Route('/api/iot-history', iot_history_endpoint, methods=['GET']),
+    Route('/api/iot-ingest', iot_ingest_endpoint, methods=['POST']),
+    Route('/api/chat', handle_chat, methods=['POST']),
+    Route('/api/analyze-satellite', analyze_satellite, methods=['POST']),
+    Route('/api/startup-report', startup_report_endpoint, methods=['GET']),
+    Route('/api/limits', limits_endpoint, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/debug/profile/{profile_id}', profile_endpoint, methods=['GET']),
+]
+route_paths = {route.endpoint: route.path for route in routes}
+
+# Per-route latency (to the start of the response) for every request. With
+# PROFILE_TOKEN set, a request carrying "X-Profile: <token>" also runs
+# under the sampling profiler; handlers run on executor threads, so all
+# threads are sampled. The profile id comes back in X-Profile-Id.
+class RequestMetrics:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        headers = dict(scope["headers"])
+        profile = start_profile(all_threads=True) if profiling_requested(
+            headers.get(PROFILE_HEADER.lower().encode(), b'').decode('latin-1')) else None
+        recorded = False
+
+        def record(status):
+            nonlocal recorded
+            recorded = True
+            route = route_paths.get(scope.get("endpoint"), "unmatched")
+            record_request(route, scope["method"], status, time.perf_counter() - started)
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start" and not recorded:
+                record(message["status"])
+                if profile is not None:
+                    finish_profile(*profile)
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile[0].encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            if not recorded:
+                record(500)
+                if profile is not None:
+                    finish_profile(*profile)
+
+app = Starlette(routes=routes, middleware=[
+    Middleware(RequestMetrics),
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+])
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,213 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import sat
+from anomaly import AnomalyModelStore
+from ndvi_cache import FakeNdviFetcher, NdviTimeSeriesCache
+
+# Batch satellite analysis for many fields. Remote fetches (NDVI history
+# through the local cache, plus the stress samples) run on a small thread
+# pool so Earth Engine sees at most --fetch-concurrency requests at once;
+# the CPU-bound stages (preprocess, anomaly detection, forecast, plot) run
+# on a process pool. Each field is written as one JSON line as soon as it
+# finishes, and its id is appended to a checkpoint file so an interrupted
+# run can be resumed with the same command.
+#
+#   python batch_sat.py fields.geojson --out results.jsonl --workers 4
+#   python batch_sat.py fields.csv --out results.jsonl --fake --no-plot
+#
+# --fake runs offline against synthetic NDVI series; its NDVI cache and
+# anomaly models live in a temporary directory that is removed afterwards,
+# so nothing it fits is ever read back by the server as real data.
+
+# Bounding box [min_lon, min_lat, max_lon, max_lat] of a GeoJSON geometry
+def geometry_bbox(geometry):
+    points = []
+
+    def collect(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            points.append(coords)
+        else:
+            for item in coords:
+                collect(item)
+
+    collect(geometry['coordinates'])
+    lons = [point[0] for point in points]
+    lats = [point[1] for point in points]
+    return [min(lons), min(lats), max(lons), max(lats)]
+
+# AOIs from a GeoJSON FeatureCollection; ids come from properties.id or
+# properties.name, falling back to the feature's position
+def read_geojson(path):
+    with open(path) as f:
+        collection = json.load(f)
+    features = collection['features'] if collection.get('type') == 'FeatureCollection' else [collection]
+    aois = []
+    for index, feature in enumerate(features):
+        properties = feature.get('properties') or {}
+        aoi_id = properties.get('id', properties.get('name', feature.get('id', index)))
+        bbox = feature.get('bbox') or geometry_bbox(feature['geometry'])
+        aois.append((str(aoi_id), [float(v) for v in bbox[:4]]))
+    return aois
+
+# AOIs from a CSV with min_lon,min_lat,max_lon,max_lat columns (and an
+# optional id column); rows without an id are numbered
+def read_csv(path):
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    return [
+        (str(row.get('id') or index), [float(row[name]) for name in ('min_lon', 'min_lat', 'max_lon', 'max_lat')])
+        for index, row in enumerate(rows)
+    ]
+
+def read_aois(path):
+    if path.lower().endswith(('.geojson', '.json')):
+        return read_geojson(path)
+    return read_csv(path)
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+# Remote part of one field (runs on the fetch thread pool)
+def fetch_field(bbox, start_date, end_date, with_stress):
+    ndvi_df = sat.fetch_ndvi_series(bbox)
+    stress_info = None
+    if with_stress:
+        stress_info = sat.fetch_stress_info(sat.ee.Geometry.Rectangle(bbox), start_date, end_date)
+    return ndvi_df, stress_info
+
+# CPU-bound part of one field (runs in a worker process)
+def analyze_field(aoi_id, bbox, ndvi_df, stress_info, with_plot):
+    started = time.perf_counter()
+    if stress_info is not None and stress_info['image_count'] == 0:
+        raise ValueError("No Sentinel-2 data found for the given date range and location.")
+    ndvi_df = sat.preprocess_data(ndvi_df)
+    ndvi_df, model = sat.score_series(ndvi_df, sat.anomaly_store, sat.aoi_key(bbox))
+    future_df = sat.predict_future_anomalies(ndvi_df, model=model)
+    result = {
+        "id": aoi_id,
+        "bbox": bbox,
+        "observations": len(ndvi_df),
+        "anomalies": ndvi_df.index[ndvi_df['anomaly']].strftime('%Y-%m-%d').tolist(),
+        "future_anomalies": future_df[future_df['anomaly']].index.strftime('%Y-%m-%d').tolist(),
+        "recommendations": sat.recommendations_from_samples(stress_info['samples']) if stress_info else [],
+    }
+    if with_plot:
+        result["ndvi_plot"] = sat.plot_ndvi_graph(ndvi_df, future_df)
+    result["analysis_seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+# Run the batch, calling `emit(result)` as each field finishes (failed
+# fields get an "error" entry). Fields whose ids are in `done` are skipped.
+def run_batch(aois, emit, done=(), workers=None, fetch_concurrency=4,
+              start_date="2023-01-01", end_date="2023-10-01", with_stress=True, with_plot=True):
+    pending_aois = [(aoi_id, bbox) for aoi_id, bbox in aois if aoi_id not in done]
+    if with_stress and pending_aois:
+        sat.ensure_earth_engine()
+
+    # Spawned workers import sat themselves instead of inheriting the fetch threads' state
+    context = multiprocessing.get_context('spawn')
+    with ThreadPoolExecutor(max_workers=fetch_concurrency) as fetchers, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context) as analyzers:
+        running = {}
+        for aoi_id, bbox in pending_aois:
+            future = fetchers.submit(fetch_field, bbox, start_date, end_date, with_stress)
+            running[future] = ('fetch', aoi_id, bbox)
+
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, aoi_id, bbox = running.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    emit({"id": aoi_id, "bbox": bbox, "error": f"{stage}: {e}"})
+                    continue
+                if stage == 'fetch':
+                    ndvi_df, stress_info = value
+                    analysis = analyzers.submit(analyze_field, aoi_id, bbox, ndvi_df, stress_info, with_plot)
+                    running[analysis] = ('analysis', aoi_id, bbox)
+                else:
+                    emit(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Satellite stress analysis for many fields")
+    parser.add_argument('aois', help="GeoJSON FeatureCollection or CSV of bounding boxes")
+    parser.add_argument('--out', default='-', help="JSON lines output file (default: stdout)")
+    parser.add_argument('--checkpoint', help="file of completed ids (default: <out>.checkpoint)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="analysis processes")
+    parser.add_argument('--fetch-concurrency', type=int, default=4, help="concurrent remote fetches")
+    parser.add_argument('--start-date', default="2023-01-01")
+    parser.add_argument('--end-date', default="2023-10-01")
+    parser.add_argument('--no-stress', action='store_true', help="skip the crop/water stress samples")
+    parser.add_argument('--no-plot', action='store_true', help="leave the base64 NDVI plot out of the output")
+    parser.add_argument('--fake', type=float, nargs='?', const=0.0, metavar='LATENCY',
+                        help="use the offline fake NDVI fetcher (implies --no-stress)")
+    args = parser.parse_args()
+
+    fake_dir = None
+    if args.fake is not None:
+        # Synthetic series and the models fitted on them stay out of the live stores
+        fake_dir = tempfile.TemporaryDirectory(prefix='batch-sat-fake-')
+        ndvi_dir = os.path.join(fake_dir.name, 'ndvi_cache')
+        model_dir = os.path.join(fake_dir.name, 'anomaly_models')
+        # Spawned analysis workers import sat afresh and read these
+        os.environ['NDVI_CACHE_DIR'] = ndvi_dir
+        os.environ['ANOMALY_MODEL_DIR'] = model_dir
+        sat.ndvi_series_cache = NdviTimeSeriesCache(ndvi_dir, FakeNdviFetcher(latency=args.fake))
+        sat.anomaly_store = AnomalyModelStore(model_dir)
+        args.no_stress = True
+
+    aois = read_aois(args.aois)
+    checkpoint = args.checkpoint or (None if args.out == '-' else args.out + '.checkpoint')
+    done = read_checkpoint(checkpoint) if checkpoint else set()
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'a')
+    checkpoint_file = open(checkpoint, 'a') if checkpoint else None
+    counts = {"ok": 0, "failed": 0}
+    started = time.perf_counter()
+
+    def emit(result):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        if "error" in result:
+            counts["failed"] += 1
+            return
+        counts["ok"] += 1
+        # Only successful fields are checkpointed, so failures are retried on resume
+        if checkpoint_file:
+            checkpoint_file.write(result["id"] + "\n")
+            checkpoint_file.flush()
+
+    try:
+        run_batch(
+            aois, emit, done=done, workers=args.workers, fetch_concurrency=args.fetch_concurrency,
+            start_date=args.start_date, end_date=args.end_date,
+            with_stress=not args.no_stress, with_plot=not args.no_plot,
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if checkpoint_file:
+            checkpoint_file.close()
+        if fake_dir is not None:
+            fake_dir.cleanup()
+
+    print(
+        f"{counts['ok']} done, {counts['failed']} failed, {len(done)} skipped "
+        f"in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr,
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.impute import SimpleImputer
+
+import anomaly
+
+# Benchmark NDVI anomaly detection for 3, 10 and 20 years of daily data:
+# the previous per-request code (pandas rolling + SimpleImputer + a fresh
+# IsolationForest fit) against the anomaly engine on a first request
+# (fit and persist) and on repeat requests (stored model reused).
+#
+#   python bench_anomaly.py --years 3 10 20
+
+# The detect_anomalies implementation sat.py used before
+def legacy_detect_anomalies(df):
+    df['rolling_mean'] = df['NDVI'].rolling(window=30).mean()
+    df['rolling_std'] = df['NDVI'].rolling(window=30).std()
+    df['z_score'] = (df['NDVI'] - df['rolling_mean']) / df['rolling_std']
+    df['z_anomaly'] = df['z_score'].abs() > 2.5
+    imputer = SimpleImputer(strategy='mean')
+    features = imputer.fit_transform(df[['NDVI', 'rolling_mean', 'rolling_std']].values)
+    clf = IsolationForest(contamination=0.05, random_state=42)
+    df['if_anomaly'] = clf.fit_predict(features) == -1
+    df['anomaly'] = df['z_anomaly'] | df['if_anomaly']
+    return df
+
+def make_series(years, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2000-01-01', periods=years * 365, freq='D')
+    days = np.arange(len(index))
+    ndvi = 0.45 + 0.25 * np.sin(2 * np.pi * days / 365.25) + rng.normal(0, 0.03, len(index))
+    return pd.DataFrame({'NDVI': ndvi}, index=index)
+
+# Median latency (ms) and peak traced allocation (MB) of fn over fresh copies of df
+def measure(fn, df, repeat):
+    timings, peak = [], 0
+    for _ in range(repeat):
+        frame = df.copy()
+        tracemalloc.start()
+        started = time.perf_counter()
+        fn(frame)
+        timings.append((time.perf_counter() - started) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return float(np.median(timings)), peak / 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, nargs='+', default=[3, 10, 20])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='anomaly-bench-')
+    try:
+        print(f"{'years':>5} {'legacy ms':>10} {'first ms':>10} {'repeat ms':>10} {'legacy MB':>10} {'repeat MB':>10}")
+        for years in args.years:
+            df = make_series(years)
+            store = anomaly.AnomalyModelStore(root)
+            key = f"bench-{years}"
+            legacy_ms, legacy_mb = measure(legacy_detect_anomalies, df, args.repeat)
+            first_ms, _ = measure(lambda frame: anomaly.score_series(frame, store, key), df, 1)
+            repeat_ms, repeat_mb = measure(lambda frame: anomaly.score_series(frame, store, key), df, args.repeat)
+            print(f"{years:>5} {legacy_ms:>10.1f} {first_ms:>10.1f} {repeat_ms:>10.1f} {legacy_mb:>10.1f} {repeat_mb:>10.1f}")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+import requests
+
+from loadtest import wait_until_up
+from stub_services import start_stub_server
+
+# Reproducible capacity benchmark for the whole backend. It starts the app
+# in a subprocess with local stand-ins for every external dependency:
+#
+# - Open-Meteo and the satellite context service: stub_services.py
+# - Earth Engine: a deterministic NDVI fetcher and stress sampler
+# - the crop disease models: small generated TFLite models with the real
+#   class counts, cached under --fixtures
+#
+# The IoT pickles are the repo's own. Each route then gets a fixed
+# workload with a fixed number of requests and clients and a deterministic
+# request sequence. Throughput, p50/p95/p99 latency, errors and the
+# server's resident and peak memory are written to JSON. Result caches are
+# off unless --caches is given, so repeated requests exercise the hot
+# paths rather than cache lookups.
+#
+#   python bench_backend.py run --out before.json
+#   python bench_backend.py run --out after.json --server asgi
+#   python bench_backend.py compare before.json after.json --tolerance 0.1
+#
+# compare exits with status 1 if any route regressed beyond the tolerance.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURES = os.path.join(BACKEND_DIR, 'bench_fixtures')
+CROPS = ("rice", "wheat", "corn")
+CROP_IMAGE_SIZE = (640, 480)
+CROP_IMAGES = 64
+SATELLITE_AOIS = [[76.5 + 0.1 * i, 13.2, 77.0 + 0.1 * i, 13.6] for i in range(8)]
+CHAT_MESSAGES = [
+    "Give me farm advice for rice in pune",
+    "What is the weather in nagpur for my cotton farm",
+    "Any pest problems expected for wheat near lucknow",
+    "How is the soil in mysore for sugarcane",
+]
+
+# Route workloads: (method, path, requests, clients)
+WORKLOADS = {
+    "iot": ("GET", "/api/iot-data", 400, 8),
+    "crop_disease": ("POST", "/api/analyze-crop-disease", 200, 8),
+    "chat": ("POST", "/api/chat", 200, 16),
+    "satellite": ("POST", "/api/analyze-satellite", 40, 4),
+}
+
+# Server settings that disable the result caches (see --caches)
+NO_CACHE_ENV = {
+    "CD_RESULT_CACHE_SIZE": "0",
+    "CHAT_SATELLITE_TTL": "0",
+    "CHAT_WEATHER_TTL": "0",
+    "SAT_CHART_CACHE_SIZE": "0",
+    "ANOMALY_MODEL_DIR": "",
+}
+
+# Request keyword arguments for the i-th request of a route
+def crop_image(index):
+    from PIL import Image
+    rng = np.random.default_rng(index)
+    width, height = CROP_IMAGE_SIZE
+    pixels = (rng.random((height // 8, width // 8, 3)) * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).resize(CROP_IMAGE_SIZE).save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+def request_factory(route):
+    if route == "crop_disease":
+        images = [crop_image(i) for i in range(CROP_IMAGES)]
+        return lambda i: {"files": {"file": (f"leaf{i % CROP_IMAGES}.jpg", images[i % CROP_IMAGES], "image/jpeg")},
+                          "data": {"cropType": CROPS[i % len(CROPS)]}}
+    if route == "chat":
+        return lambda i: {"json": {"message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)]}}
+    if route == "satellite":
+        return lambda i: {"json": {"coords": ",".join(map(str, SATELLITE_AOIS[i % len(SATELLITE_AOIS)])),
+                                   "format": "png" if i % 2 else "series"}}
+    return lambda i: {}
+
+# Small seeded crop disease models with the real input size and class counts
+def ensure_crop_models(model_dir):
+    missing = [crop for crop in CROPS if not os.path.exists(os.path.join(model_dir, f"{crop}.tflite"))]
+    if not missing:
+        return
+    import keras
+    from cd import CLASSES
+    from convert_models import convert
+    os.makedirs(model_dir, exist_ok=True)
+    for crop in missing:
+        keras.utils.set_random_seed(zlib.crc32(crop.encode()))
+        inputs = keras.Input((224, 224, 3))
+        x = keras.layers.Conv2D(16, 3, strides=2, activation='relu')(inputs)
+        x = keras.layers.Conv2D(32, 3, strides=2, activation='relu')(x)
+        x = keras.layers.GlobalAveragePooling2D()(x)
+        outputs = keras.layers.Dense(len(CLASSES[crop]), activation='softmax')(x)
+        source = os.path.join(model_dir, f"{crop}.keras")
+        keras.Model(inputs, outputs).save(source)
+        with open(os.path.join(model_dir, f"{crop}.tflite"), 'wb') as f:
+            f.write(convert(source, "float"))
+
+# Earth Engine stand-in for sat.py: NDVI history from FakeNdviFetcher (through
+# the normal NDVI cache) and ten deterministic stress samples per AOI, each
+# remote call sleeping `latency` seconds
+def install_earth_engine_standin(latency):
+    import sat
+    from ndvi_cache import FakeNdviFetcher
+
+    def fetch_stress_info(aoi, start_date, end_date, ndvi_query=None, stress_mode="samples", bbox=None):
+        time.sleep(latency)
+        rng = np.random.default_rng(zlib.crc32(repr(aoi).encode()))
+        min_lon, min_lat, max_lon, max_lat = aoi
+        features = [{
+            "geometry": {"coordinates": [float(rng.uniform(min_lon, max_lon)), float(rng.uniform(min_lat, max_lat))]},
+            "properties": {"CropStress": int(rng.integers(0, 3)), "WaterStress": int(rng.integers(0, 2))},
+        } for _ in range(10)]
+        return {"image_count": 12, "samples": {"features": features}}
+
+    sat.ee = SimpleNamespace(Geometry=SimpleNamespace(Rectangle=tuple))
+    sat.ensure_earth_engine = lambda: None
+    sat.fetch_stress_info = fetch_stress_info
+    sat.ndvi_series_cache.fetcher = FakeNdviFetcher(latency=latency)
+
+# Entry point of the server subprocess
+def serve(args):
+    install_earth_engine_standin(args.remote_latency)
+    if args.server == "asgi":
+        import uvicorn
+        from asgi_app import app
+        uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+    else:
+        from main_app import app
+        app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+def memory_mb(pid):
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                values[line.split(':')[0]] = int(line.split()[1]) / 1024
+    return round(values.get("VmRSS", 0.0), 1), round(values.get("VmHWM", 0.0), 1)
+
+def run_workload(base_url, route, total, clients, timeout=120):
+    method, path = WORKLOADS[route][:2]
+    make_request = request_factory(route)
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=clients))
+
+    def call(i):
+        started = time.perf_counter()
+        try:
+            status = session.request(method, base_url + path, timeout=timeout, **make_request(i)).status_code
+        except requests.RequestException:
+            status = "error"
+        return time.perf_counter() - started, status
+
+    # Warm-up: one request per client, not recorded
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(call, range(clients)))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, status in results if status == 200]) * 1000
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def percentile(q):
+        return round(float(np.percentile(latencies, q)), 2) if len(latencies) else None
+
+    return {
+        "requests": total,
+        "clients": clients,
+        "requests_per_s": round(total / elapsed, 2),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "errors": total - statuses.get("200", 0),
+        "statuses": statuses,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    routes = args.routes or list(WORKLOADS)
+    model_dir = os.path.join(args.fixtures, 'crop_disease_models')
+    if "crop_disease" in routes:
+        ensure_crop_models(model_dir)
+    # The stand-in NDVI history and the IoT reading store start empty every
+    # run, like a fresh deployment
+    ndvi_cache = tempfile.TemporaryDirectory(prefix='bench-ndvi-')
+    iot_history = tempfile.TemporaryDirectory(prefix='bench-iot-history-')
+
+    stub = start_stub_server(latency=args.remote_latency)
+    env = {**os.environ, **stub.environment(), "CD_MODEL_DIR": model_dir, "NDVI_CACHE_DIR": ndvi_cache.name,
+           "IOT_STORE_DIR": iot_history.name, "PYTHONWARNINGS": "ignore"}
+    if not args.caches:
+        env.update(NO_CACHE_ENV)
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--server", args.server, "--port", str(args.port),
+               "--remote-latency", str(args.remote_latency)]
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    try:
+        wait_until_up(base_url, server)
+        for route in routes:
+            total, clients = WORKLOADS[route][2:]
+            result = run_workload(base_url, route, max(int(total * args.scale), 1), clients)
+            result["rss_mb"], result["peak_rss_mb"] = memory_mb(server.pid)
+            results[route] = result
+            print(f"{route:>13}: {result['requests_per_s']:8.1f} req/s  p50 {result['p50_ms']} ms  "
+                  f"p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}  "
+                  f"peak {result['peak_rss_mb']} MB")
+        peak = memory_mb(server.pid)[1]
+    finally:
+        server.terminate()
+        server.wait()
+        stub.shutdown()
+        ndvi_cache.cleanup()
+        iot_history.cleanup()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "started": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "server": args.server,
+            "caches": args.caches,
+            "remote_latency": args.remote_latency,
+            "scale": args.scale,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "routes": results,
+        "peak_rss_mb": peak,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+# Relative change from `before` to `after` (positive = larger)
+def change(before, after):
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before
+
+# Per-route regressions: lower throughput, higher p95/p99 latency or peak
+# memory beyond `tolerance`, or new errors
+def compare(before, after, tolerance):
+    rows, regressions = [], []
+    for route in sorted(set(before["routes"]) & set(after["routes"])):
+        old, new = before["routes"][route], after["routes"][route]
+        deltas = {
+            "requests_per_s": change(old["requests_per_s"], new["requests_per_s"]),
+            "p95_ms": change(old["p95_ms"], new["p95_ms"]),
+            "p99_ms": change(old["p99_ms"], new["p99_ms"]),
+            "peak_rss_mb": change(old["peak_rss_mb"], new["peak_rss_mb"]),
+        }
+        worse = [name for name, delta in deltas.items() if delta is not None and
+                 (-delta if name == "requests_per_s" else delta) > tolerance]
+        if new["errors"] > old["errors"]:
+            worse.append("errors")
+        rows.append((route, old, new, deltas, worse))
+        regressions.extend(f"{route}.{name}" for name in worse)
+    return rows, regressions
+
+def print_comparison(rows, regressions, tolerance):
+    def pct(delta):
+        return f"{delta:+.1%}" if delta is not None else "n/a"
+
+    print(f"{'route':>13} {'req/s':>20} {'p95 ms':>22} {'p99 ms':>22} {'peak MB':>10}")
+    for route, old, new, deltas, worse in rows:
+        print(f"{route:>13} {old['requests_per_s']:>8} -> {new['requests_per_s']:<8} {pct(deltas['requests_per_s']):>7}"
+              f"  {old['p95_ms']} -> {new['p95_ms']} {pct(deltas['p95_ms']):>7}"
+              f"  {old['p99_ms']} -> {new['p99_ms']} {pct(deltas['p99_ms']):>7}"
+              f"  {pct(deltas['peak_rss_mb']):>7}" + ("  REGRESSION: " + ", ".join(worse) if worse else ""))
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {tolerance:.0%}: {', '.join(regressions)}")
+    else:
+        print(f"No regressions beyond {tolerance:.0%}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="benchmark every route and write the results")
+    run_parser.add_argument('--out', default='bench_results.json')
+    run_parser.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    run_parser.add_argument('--routes', nargs='+', choices=list(WORKLOADS))
+    run_parser.add_argument('--scale', type=float, default=1.0, help="multiply every workload's request count")
+    run_parser.add_argument('--remote-latency', type=float, default=0.05,
+                            help="seconds per stand-in Earth Engine / weather / satellite call")
+    run_parser.add_argument('--caches', action='store_true', help="keep the result caches on")
+    run_parser.add_argument('--fixtures', default=DEFAULT_FIXTURES)
+    run_parser.add_argument('--port', type=int, default=5111)
+
+    compare_parser = commands.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--tolerance', type=float, default=0.10)
+
+    serve_parser = commands.add_parser('serve', help=argparse.SUPPRESS)
+    serve_parser.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    serve_parser.add_argument('--port', type=int, required=True)
+    serve_parser.add_argument('--remote-latency', type=float, default=0.05)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'serve':
+        serve(args)
+    else:
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        differing = [key for key in ("server", "caches", "remote_latency", "scale", "cpus")
+                     if before["meta"].get(key) != after["meta"].get(key)]
+        if differing:
+            print(f"Note: the runs used different settings ({', '.join(differing)})")
+        rows, regressions = compare(before, after, args.tolerance)
+        print_comparison(rows, regressions, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
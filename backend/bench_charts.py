@@ -0,0 +1,82 @@
+import argparse
+import base64
+import io
+import json
+import time
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import charts
+
+# Benchmark NDVI chart output: the previous pyplot rendering against the
+# reused Agg figure (uncached and cached) and the compact series JSON,
+# reporting median render time and payload size.
+#
+#   python bench_charts.py --years 3 --repeat 20
+
+# The plot_ndvi_graph implementation sat.py used before
+def legacy_plot_ndvi_graph(ndvi_df, future_df=None):
+    plt.figure(figsize=(12, 6))
+    plt.plot(ndvi_df.index, ndvi_df['NDVI'], label='NDVI', color='green', linewidth=2)
+    anomalies = ndvi_df[ndvi_df['anomaly']]
+    plt.scatter(anomalies.index, anomalies['NDVI'], color='red', label='Anomalies', zorder=5)
+    if future_df is not None:
+        plt.plot(future_df.index, future_df['NDVI'], label='Future NDVI', color='blue', linestyle='--', linewidth=2)
+        future_anomalies = future_df[future_df['anomaly']]
+        plt.scatter(future_anomalies.index, future_anomalies['NDVI'], color='orange', label='Future Anomalies', zorder=5)
+    plt.title('NDVI Time Series with Anomalies')
+    plt.xlabel('Date')
+    plt.ylabel('NDVI')
+    plt.legend()
+    plt.grid(True)
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format='png')
+    buffer.seek(0)
+    plt.close()
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+def make_frames(years, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2020-01-01', periods=years * 365, freq='D')
+    ndvi = 0.45 + 0.25 * np.sin(2 * np.pi * np.arange(len(index)) / 365.25) + rng.normal(0, 0.03, len(index))
+    ndvi_df = pd.DataFrame({'NDVI': ndvi, 'anomaly': rng.random(len(index)) < 0.05}, index=index)
+    future_index = pd.date_range(index[-1] + pd.Timedelta(days=1), periods=30, freq='D')
+    future_df = pd.DataFrame({'NDVI': rng.normal(0.45, 0.03, 30), 'anomaly': rng.random(30) < 0.1}, index=future_index)
+    return ndvi_df, future_df
+
+def measure(fn, repeat, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        payload = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings)), len(json.dumps(payload))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    ndvi_df, future_df = make_frames(args.years)
+    # First render builds the per-thread figure; keep it out of the numbers
+    charts.render_ndvi_png(ndvi_df, future_df)
+
+    cases = [
+        ("pyplot (before)", lambda: legacy_plot_ndvi_graph(ndvi_df, future_df), None),
+        ("agg, uncached", lambda: charts.render_ndvi_png(ndvi_df, future_df), charts.chart_cache.clear),
+        ("agg, cached", lambda: charts.render_ndvi_png(ndvi_df, future_df), None),
+        ("series, uncached", lambda: charts.ndvi_series(ndvi_df, future_df), charts.chart_cache.clear),
+    ]
+    print(f"{args.years} years of daily NDVI")
+    for label, fn, before in cases:
+        median_ms, size = measure(fn, args.repeat, before)
+        print(f"{label:>18}: {median_ms:8.2f} ms median, {size / 1024:7.1f} KB JSON")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import os
+import time
+import numpy as np
+
+from stub_services import start_stub_server
+
+# Benchmark chatbot context fetching against the local stub services:
+# the previous serial analyze_farm + get_weather calls, a cold chat_context
+# fetch (both sources concurrently) and a warm one (served from the TTL
+# caches). Each stub request sleeps --latency seconds.
+#
+#   python bench_chat.py --latency 0.3 --repeat 10
+
+MESSAGE = "Give me farm advice for rice in pune"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    server = start_stub_server(latency=args.latency)
+    os.environ.update(server.environment())
+    import cb  # reads the service URLs at import time
+
+    location = {'lat': 18.5, 'lon': 73.8}
+    start_date, end_date = "2024-01-01", "2024-01-31"
+
+    def serial():
+        cb.analyze_farm(location, start_date, end_date)
+        cb.get_weather(location)
+
+    def cold():
+        cb.chat_context.satellite_cache.clear()
+        cb.chat_context.weather_cache.clear()
+        cb.chat_context.fetch(location, start_date, end_date)
+
+    def warm():
+        cb.chat_context.fetch(location, start_date, end_date)
+
+    def chat():
+        cb.chatbot(MESSAGE)
+
+    print(f"stub latency {args.latency * 1000:.0f} ms per request")
+    for label, fn in (("serial (before)", serial), ("cold", cold), ("warm", warm), ("chatbot, warm", chat)):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{label:>16}: {np.median(timings):8.2f} ms median")
+    print(f"stub requests: {server.requests}")
+    print(f"cache: {cb.chat_context.stats()}")
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
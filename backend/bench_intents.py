@@ -0,0 +1,82 @@
+import argparse
+import time
+import numpy as np
+
+from intents import MessageParser
+
+# Benchmark chat message parsing as the place-name gazetteer grows: the
+# previous substring scans over every city, crop and keyword against the
+# single-pass MessageParser. Reports messages/sec for each gazetteer size.
+#
+#   python bench_intents.py --sizes 5 1000 10000 100000
+
+CROPS = ["rice", "wheat", "maize", "cotton", "sugarcane", "soybean", "groundnut", "millet",
+         "barley", "mustard", "chickpea", "tomato", "onion", "potato", "banana", "mango"]
+KEYWORDS = ("advice", "farm", "weather", "rain", "soil", "pest", "bug", "scheme", "subsidy",
+            "yield", "improve", "resource", "manage", "latitude", "longitude")
+SYLLABLES = ["ka", "ra", "pur", "gaon", "wadi", "na", "sh", "ik", "ban", "gal", "ore", "del", "hi", "mu", "bai", "ta"]
+
+# The parsing chatbot() did before: substring scans in list order
+def legacy_parse(message, locations, crops):
+    location = crop = None
+    for city, coords in locations.items():
+        if city in message:
+            location = coords
+            break
+    for name in crops:
+        if name in message:
+            crop = name
+            break
+    keywords = {keyword for keyword in KEYWORDS if keyword in message}
+    return location, crop, keywords
+
+def make_locations(size, seed=0):
+    rng = np.random.default_rng(seed)
+    locations = {}
+    while len(locations) < size:
+        words = 1 + (rng.random() < 0.2)
+        name = " ".join("".join(rng.choice(SYLLABLES, rng.integers(3, 5))) for _ in range(words))
+        locations[name] = (round(float(rng.uniform(8, 35)), 2), round(float(rng.uniform(68, 97)), 2))
+    return locations
+
+def make_messages(locations, count, seed=1):
+    rng = np.random.default_rng(seed)
+    names = list(locations)
+    templates = [
+        "what is the weather in {place} for my {crop} farm",
+        "give me advice on pests for {crop} near {place}",
+        "is there any subsidy scheme for {crop} growers",
+        "soil moisture at {place} looks low, how do i improve yield",
+    ]
+    return [
+        templates[i % len(templates)].format(place=names[rng.integers(len(names))], crop=CROPS[rng.integers(len(CROPS))])
+        for i in range(count)
+    ]
+
+def throughput(fn, messages):
+    started = time.perf_counter()
+    for message in messages:
+        fn(message)
+    return len(messages) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 1000, 10000, 100000])
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'places':>8} {'build ms':>9} {'before msg/s':>13} {'parser msg/s':>13}")
+    for size in args.sizes:
+        locations = make_locations(size)
+        messages = make_messages(locations, args.messages)
+        started = time.perf_counter()
+        message_parser = MessageParser(locations, CROPS, KEYWORDS)
+        build_ms = (time.perf_counter() - started) * 1000
+        # The old scan is linear in the gazetteer, so give it fewer messages at large sizes
+        legacy_messages = messages[:max(20, args.messages * 1000 // max(size, 1000))]
+        before = throughput(lambda message: legacy_parse(message, locations, CROPS), legacy_messages)
+        after = throughput(message_parser.parse, messages)
+        print(f"{size:>8} {build_ms:>9.1f} {before:>13.0f} {after:>13.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import subprocess
+import sys
+import time
+import numpy as np
+
+import iot
+from compiled_forest import CompiledForest, compile_models, load_pickles, source_fingerprint
+
+# Benchmark IoT water/fertilizer scoring: the previous per-row path
+# (pipeline.transform on a Python list, then each model separately), the
+# fused bulk path over the pickled sklearn models and the compiled
+# array-backed forests, for 1, 100 and 100k readings. --memory compares
+# the resident memory of each loaded model set in a fresh interpreter.
+#
+#   python bench_iot.py
+#   python bench_iot.py --rows 1 100 100000 --legacy-max 500
+#   python bench_iot.py --memory
+#   python bench_iot.py --farms 5000 --months 24   # simulated fleet load test
+
+SOURCES = [iot.num_pipeline_path, iot.trained_model_1_path, iot.trained_model_2_path]
+
+# Random readings within the simulator's ranges
+def make_features(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(2004, 2030, n),
+        rng.integers(1, 13, n),
+        rng.normal(20, 3, n),
+        rng.normal(100, 30, n),
+        rng.normal(60, 10, n),
+        rng.uniform(10, 90, n),
+        rng.uniform(0, 1, n),
+        rng.uniform(5.5, 7.5, n),
+        rng.uniform(0.1, 1.5, n),
+    ]).astype(np.float64)
+
+# The scoring code get_iot_data used before, one reading per call
+def legacy_score(models, row):
+    pipeline, water_model, fertilizer_model = models
+    processed_data = pipeline.transform([list(row)])
+    water_needed = round(water_model.predict(processed_data)[0], 2)
+    fertilizer_needed = round(fertilizer_model.predict(processed_data)[0], 2)
+    return water_needed, fertilizer_needed
+
+# The fused path over the pickled models
+def sklearn_score(models, features):
+    pipeline, water_model, fertilizer_model = models
+    processed_data = np.ascontiguousarray(pipeline.transform(features))
+    return water_model.predict(processed_data), fertilizer_model.predict(processed_data)
+
+# The compiled models file if it is current, otherwise compiled in memory
+def load_compiled(models):
+    compiled = CompiledForest.load(iot.COMPILED_MODELS_PATH, source_fingerprint(SOURCES)) if iot.COMPILED_MODELS_PATH else None
+    return compiled if compiled is not None else compile_models(models[0], models[1:])
+
+def resident_kb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+
+# Resident memory (MB) added by importing sklearn and by loading one model
+# set, measured in a fresh interpreter so the two loaders don't share pages
+def load_memory_mb(kind):
+    code = (
+        "import bench_iot as b\n"
+        "before = b.resident_kb()\n"
+        f"if {kind!r} == 'sklearn': import sklearn.ensemble, sklearn.pipeline\n"
+        "imported = b.resident_kb()\n"
+        f"models = b.load_pickles(b.SOURCES) if {kind!r} == 'sklearn' else b.load_compiled(None)\n"
+        "print((imported - before) / 1024, (b.resident_kb() - imported) / 1024)\n"
+    )
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], capture_output=True, text=True, check=True)
+    return tuple(map(float, result.stdout.split()))
+
+def time_call(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100, 100000])
+    parser.add_argument('--legacy-max', type=int, default=1000,
+                        help="score at most this many rows with the legacy path and extrapolate")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--farms', type=int, help="score a simulated fleet of this many farms instead")
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true', help="compare resident memory of the loaded models")
+    args = parser.parse_args()
+
+    if args.memory:
+        if CompiledForest.load(iot.COMPILED_MODELS_PATH or '') is None:
+            sys.exit("No compiled models; run python compiled_forest.py compile first")
+        for kind in ('sklearn', 'compiled'):
+            imported, loaded = load_memory_mb(kind)
+            print(f"{kind:>9}: models {loaded:6.1f} MB resident (+{imported:.1f} MB to import sklearn)")
+        return
+
+    if args.farms:
+        simulator = iot.FarmSimulator(n_farms=args.farms, seed=args.seed)
+        started = time.perf_counter()
+        features = iot.simulated_features(simulator.run(args.months))
+        generated = time.perf_counter() - started
+        started = time.perf_counter()
+        iot.score_readings(features)
+        scored = time.perf_counter() - started
+        print(f"{len(features)} readings ({args.farms} farms x {args.months} months): "
+              f"generated {len(features) / generated:.0f} rows/s, scored {len(features) / scored:.0f} rows/s")
+        return
+
+    models = load_pickles(SOURCES)
+    compiled = load_compiled(models)
+    print(f"{'rows':>8} {'legacy rows/s':>14} {'fused rows/s':>14} {'compiled rows/s':>16} "
+          f"{'1-row compiled us':>18} {'vs fused':>9}")
+    for n in args.rows:
+        features = make_features(n)
+        legacy_rows = features[:min(n, args.legacy_max)]
+        legacy = len(legacy_rows) / time_call(lambda: [legacy_score(models, row) for row in legacy_rows], args.repeat)
+        fused_seconds = time_call(lambda: sklearn_score(models, features), args.repeat)
+        compiled_seconds = time_call(lambda: compiled.predict(features), args.repeat)
+        print(f"{n:>8} {legacy:>14.0f} {n / fused_seconds:>14.0f} {n / compiled_seconds:>16.0f} "
+              f"{compiled_seconds * 1e6 / n if n == 1 else float('nan'):>18.0f} {fused_seconds / compiled_seconds:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
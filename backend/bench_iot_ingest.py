@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# The reading store lives in a temporary directory for the run
+STORE_DIR = tempfile.mkdtemp(prefix='iot-ingest-bench-')
+os.environ['IOT_STORE_DIR'] = STORE_DIR
+
+import iot
+from iot_ingest import SENSOR_COLUMNS, encode_npz, ingest_readings
+from metrics import stage_seconds
+
+# Benchmark /api/iot-ingest in-process: a batch of simulated gateway
+# readings (1% with out-of-range values) encoded as NDJSON, CSV and .npz,
+# ingested end to end (parse, validate, score, store, JSON-encode the
+# response), with the time spent in each stage.
+#
+#   python bench_iot_ingest.py --rows 100000 --repeat 3
+#   python bench_iot_ingest.py --formats npz --no-store
+
+START = 1672531200  # 2023-01-01T00:00:00Z, inside the models' training years
+
+def make_batch(rows, seed=0):
+    readings = iot.FarmSimulator(n_farms=rows, seed=seed).step()
+    columns = {"time": START + np.arange(rows, dtype=np.int64) * 60}
+    columns.update({name: np.round(readings[name], 2) for name in SENSOR_COLUMNS})
+    bad = np.random.default_rng(seed).random(rows) < 0.01
+    columns["Soil_pH"][bad] = 15.0
+    return columns
+
+def encode(columns, source):
+    if source == "npz":
+        return encode_npz(columns)
+    frame = pd.DataFrame(columns)
+    if source == "csv":
+        return frame.to_csv(index=False).encode()
+    return frame.to_json(orient='records', lines=True).encode()
+
+# Seconds recorded so far per (subsystem, stage)
+def stage_totals():
+    return {labels: total for name, labels, _, total in stage_seconds.samples() if name.endswith('_sum')}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--formats', nargs='+', choices=['ndjson', 'csv', 'npz'], default=['ndjson', 'csv', 'npz'])
+    parser.add_argument('--no-store', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        columns = make_batch(args.rows)
+        params = {"store": "0" if args.no_store else "1", "farm": "bench"}
+        iot.score_readings(iot.simulated_features(iot.FarmSimulator(n_farms=10000).step()))  # load the models
+        for source in args.formats:
+            body = encode(columns, source)
+            best, best_stages = float('inf'), None
+            for _ in range(args.repeat):
+                before = stage_totals()
+                started = time.perf_counter()
+                response = ingest_readings(body, params={**params, "format": source})
+                encoded = json.dumps(response)
+                elapsed = time.perf_counter() - started
+                if elapsed < best:
+                    best = elapsed
+                    best_stages = {f"{subsystem}.{stage}": total - before.get((subsystem, stage), 0.0)
+                                   for (subsystem, stage), total in stage_totals().items()
+                                   if subsystem in ('iot', 'iot_ingest')}
+            breakdown = ", ".join(f"{name} {seconds * 1000:.0f}" for name, seconds in best_stages.items() if seconds > 0)
+            print(f"{source:>6}: {len(body) / 1e6:6.1f} MB, {response['accepted']} accepted, "
+                  f"{response['rejected']} rejected, {args.rows / best:9,.0f} readings/s "
+                  f"({best * 1000:.0f} ms: {breakdown}, response {len(encoded) / 1e6:.1f} MB)")
+    finally:
+        shutil.rmtree(STORE_DIR)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+import numpy as np
+
+from iot import FEATURE_COLUMNS, PREDICTION_COLUMNS, FarmSimulator
+from iot_store import DAY, HOUR, ReadingStore
+
+# Benchmark the IoT reading store on a year of per-minute readings for one
+# farm: ingest, single-reading appends, raw range queries and hourly/daily
+# aggregates (cold = rollups built from the readings, reopened = rollups
+# read back from disk, then with rollups in memory), and for comparison a
+# full scan of every reading.
+#
+#   python bench_iot_store.py --days 365 --repeat 20
+
+START = 1704067200  # 2024-01-01T00:00:00Z
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='iot-store-bench-')
+    try:
+        columns = FEATURE_COLUMNS + PREDICTION_COLUMNS
+        store = ReadingStore(root, columns)
+        # One simulated farm per minute of the day gives a (days, 1440) grid
+        readings = FarmSimulator(n_farms=1440, seed=0).run(args.days)
+        readings["Water_Needed_liters_ha_day"] = 4000 + 20 * readings["Rainfall_mm"]
+        readings["Fertilizer_Needed_kg_ha"] = 90 + 10 * readings["Soil_pH"]
+        minutes = START + np.arange(1440, dtype=np.int64) * 60
+
+        started = time.perf_counter()
+        for day in range(args.days):
+            store.append('farm-1', minutes + day * DAY, {name: readings[name][day] for name in columns})
+        elapsed = time.perf_counter() - started
+        total = args.days * 1440
+        print(f"{'ingest':>24}: {total} readings in {elapsed:.2f} s ({total / elapsed:,.0f} readings/s)")
+
+        end = START + args.days * DAY
+        reading = {name: 1.0 for name in columns}
+        single = median_ms(lambda: store.append_reading('farm-2', reading, end), args.repeat)
+        print(f"{'append one reading':>24}: {single:9.3f} ms")
+
+        cases = [
+            ("raw, 1 hour", lambda: store.query('farm-1', end - 30 * DAY, end - 30 * DAY + HOUR)),
+            ("raw, 1 day", lambda: store.query('farm-1', end - 30 * DAY, end - 29 * DAY)),
+            ("raw, 1 week", lambda: store.query('farm-1', end - 30 * DAY, end - 23 * DAY)),
+            ("hourly, 1 week", lambda: store.aggregate('farm-1', end - 30 * DAY, end - 23 * DAY, 'hour')),
+            ("hourly, year", lambda: store.aggregate('farm-1', START, end, 'hour')),
+            ("daily, year", lambda: store.aggregate('farm-1', START, end, 'day')),
+        ]
+        for label, fresh in (("daily, year (cold)", store), ("daily, year (reopened)", ReadingStore(root, columns))):
+            started = time.perf_counter()
+            fresh.aggregate('farm-1', START, end, 'day')
+            print(f"{label:>24}: {(time.perf_counter() - started) * 1000:9.3f} ms")
+        for label, fn in cases:
+            rows = len(fn()[0]) if label.startswith("raw") else len(fn()["time"])
+            print(f"{label:>24}: {median_ms(fn, args.repeat):9.3f} ms ({rows} rows)")
+
+        # What a store without a time index does: read everything, then filter
+        def scan():
+            times, values, _ = store.query('farm-1', START, end)
+            window = (times >= end - 30 * DAY) & (times < end - 29 * DAY)
+            return {name: column[window] for name, column in values.items()}
+        print(f"{'full scan, 1 day':>24}: {median_ms(scan, max(args.repeat // 4, 1)):9.3f} ms")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+from ndvi_cache import FakeNdviFetcher, NdviTimeSeriesCache
+
+# Benchmark the NDVI time-series cache against a fake Earth Engine fetcher
+# with a simulated round-trip latency: cold fetch, warm repeat and an
+# incremental query that only needs the newest days.
+#
+#   python bench_ndvi_cache.py --latency 2.0 --aois 20
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=1.0, help="simulated seconds per remote fetch")
+    parser.add_argument('--aois', type=int, default=10)
+    parser.add_argument('--years', type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='ndvi-cache-bench-')
+    try:
+        fetcher = FakeNdviFetcher(latency=args.latency)
+        cache = NdviTimeSeriesCache(root, fetcher)
+        bboxes = [[76.5 + i * 0.1, 13.2, 76.6 + i * 0.1, 13.3] for i in range(args.aois)]
+        start, end = f"{2024 - args.years}-01-01", "2024-01-01"
+
+        for label, end_date in (("cold", end), ("warm", end), ("incremental", "2024-01-15")):
+            calls = len(fetcher.calls)
+            started = time.perf_counter()
+            for bbox in bboxes:
+                cache.get(bbox, start, end_date)
+            elapsed = (time.perf_counter() - started) / len(bboxes)
+            print(f"{label:>12}: {elapsed * 1000:9.2f} ms/AOI, {len(fetcher.calls) - calls} remote fetches")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+from cd import decode_image, preprocess_image
+
+# Benchmark per-image preprocessing: the old disk round trip through
+# uploads/ + preprocess_image versus in-memory decode_image.
+# Each mode runs in its own process so peak RSS is measured in isolation.
+#
+#   python bench_preprocess.py                 # both modes, default photo size
+#   python bench_preprocess.py --width 4000 --height 3000 --iterations 50
+
+UPLOAD_FOLDER = 'uploads'
+
+# Build a noisy JPEG that looks like a phone photo (noise defeats compression)
+def make_photo(width, height, quality=90):
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+# Previous request path: save upload to disk, re-read it, delete it
+def run_disk(data, target_size):
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    file_path = os.path.join(UPLOAD_FOLDER, f"bench-{os.getpid()}.jpg")
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    img_array = preprocess_image(file_path, target_size=target_size)
+    os.remove(file_path)
+    return img_array
+
+def run_memory(data, target_size):
+    return decode_image(data, target_size)
+
+MODES = {"disk": run_disk, "memory": run_memory}
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_mode(mode, width, height, iterations, target_size):
+    data = make_photo(width, height)
+    run = MODES[mode]
+    rss_before = peak_rss_mb()
+    run(data, target_size)  # warm up
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run(data, target_size)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "mode": mode,
+        "image": f"{width}x{height}",
+        "jpeg_kb": round(len(data) / 1024, 1),
+        "iterations": iterations,
+        "median_ms": round(float(np.median(timings)), 3),
+        "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=3000)
+    parser.add_argument('--height', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--size', type=int, default=224, help="model input size")
+    parser.add_argument('--mode', choices=sorted(MODES), help="run a single mode in this process")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.width, args.height, args.iterations, (args.size, args.size))))
+        return
+
+    for mode in ("disk", "memory"):
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--width', str(args.width), '--height', str(args.height),
+             '--iterations', str(args.iterations), '--size', str(args.size)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        print(output.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Benchmark the local scene engine on a synthetic Sentinel-2 scene
+# (uint16 B3/B4/B8/B11, 10980x10980 by default, ~0.96 GB on disk). The
+# engine runs in its own process so its peak RSS is measured in isolation
+# and can be compared with the scene size.
+#
+#   python bench_scene.py                        # full-size scene
+#   python bench_scene.py --size 5490 --tile-rows 512 --workers 4
+
+BANDS = ("B3", "B4", "B8", "B11")
+
+# Write a reflectance-like scene strip by strip, so generating it does not need the whole scene in memory
+def make_scene(directory, size, strip=512):
+    rng = np.random.default_rng(0)
+    os.makedirs(directory, exist_ok=True)
+    arrays = {
+        name: np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode='w+', dtype=np.uint16, shape=(size, size))
+        for name in BANDS
+    }
+    for top in range(0, size, strip):
+        rows = slice(top, min(top + strip, size))
+        shape = (rows.stop - rows.start, size)
+        red = rng.integers(200, 2500, shape, dtype=np.uint16)
+        nir = rng.integers(1000, 5000, shape, dtype=np.uint16)
+        arrays["B4"][rows] = red
+        arrays["B8"][rows] = nir
+        arrays["B3"][rows] = rng.integers(300, 3000, shape, dtype=np.uint16)
+        arrays["B11"][rows] = (nir * rng.uniform(0.5, 2.2, shape)).clip(1, 10000).astype(np.uint16)
+    for array in arrays.values():
+        array.flush()
+
+# Peak RSS of this process in MB. VmHWM starts fresh at exec, unlike
+# ru_maxrss, which Linux carries over from the parent (here the process
+# that just wrote the scene through a memmap).
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_engine(scene, out, tile_rows, workers):
+    from scene_engine import find_bands, process_scene
+    baseline = peak_rss_mb()
+    result = process_scene(find_bands(scene), out, tile_rows, workers)
+    result["baseline_rss_mb"] = round(baseline, 1)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=10980)
+    parser.add_argument('--tile-rows', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--run', nargs=2, metavar=('SCENE', 'OUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_engine(args.run[0], args.run[1], args.tile_rows, args.workers)
+        return
+
+    root = tempfile.mkdtemp(prefix='scene-bench-')
+    try:
+        scene, out = os.path.join(root, 'scene'), os.path.join(root, 'out')
+        started = time.perf_counter()
+        make_scene(scene, args.size)
+        scene_mb = sum(os.path.getsize(os.path.join(scene, f"{name}.npy")) for name in BANDS) / 1e6
+        print(f"scene: {args.size}x{args.size}, {scene_mb:.0f} MB of bands, generated in {time.perf_counter() - started:.1f}s")
+
+        output = subprocess.run(
+            [sys.executable, __file__, '--run', scene, out,
+             '--tile-rows', str(args.tile_rows), '--workers', str(args.workers)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        output_mb = sum(os.path.getsize(path) for path in result["outputs"].values()) / 1e6
+        print(f"tiles: {result['tiles']} x {args.tile_rows} rows, {args.workers} workers")
+        print(f"time: {result['seconds']:.2f}s, {result['input_mb_per_s']:.0f} MB/s, {result['megapixels_per_s']:.0f} Mpx/s")
+        print(f"output: {output_mb:.0f} MB (float16 indices, uint8 classes)")
+        print(f"peak RSS: {result['peak_rss_mb']:.0f} MB (after imports {result['baseline_rss_mb']:.0f} MB)")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
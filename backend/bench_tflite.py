@@ -0,0 +1,129 @@
+import argparse
+import itertools
+import json
+import os
+import time
+import numpy as np
+
+from cd import (MODEL_DIR, MODEL_VARIANTS, PROFILES_PATH, ExecutionProfile, PooledInterpreter, decode_image,
+                profile_spec)
+from convert_models import image_paths
+
+# Benchmark the execution profiles of one crop model: every converted
+# variant (float, fp16, int8) x thread count x XNNPACK on/off, on a
+# held-out image set. Reports single-image latency (p50/p95), batched
+# throughput and top-1 agreement with the float model run on the plain
+# builtin kernels, then picks the fastest profile whose agreement stays
+# within --max-disagreement.
+#
+#   python bench_tflite.py --crop rice --images heldout/rice
+#   python bench_tflite.py --crop rice --images heldout/rice --threads 1 4 --write-profile
+
+REFERENCE = ExecutionProfile(variant="float", threads=1, xnnpack=False)
+
+def load_images(paths, input_size):
+    height, width = input_size
+    images = np.empty((len(paths), height, width, 3), dtype=np.float32)
+    for row, path in enumerate(paths):
+        with open(path, 'rb') as f:
+            decode_image(f.read(), input_size, out=images[row])
+    return images
+
+def predict_all(interpreter, images, batch):
+    return np.concatenate([interpreter.predict(images[start:start + batch]) for start in range(0, len(images), batch)])
+
+def measure(path, profile, images, reference, batch):
+    interpreter = PooledInterpreter(path, profile=profile)
+    interpreter.predict(images[:1])  # warm-up (and tensor allocation)
+    latencies = []
+    for row in range(len(images)):
+        started = time.perf_counter()
+        interpreter.predict(images[row:row + 1])
+        latencies.append((time.perf_counter() - started) * 1000)
+    predict_all(interpreter, images[:batch], batch)
+    started = time.perf_counter()
+    predictions = predict_all(interpreter, images, batch)
+    throughput = len(images) / (time.perf_counter() - started)
+    return {
+        **profile_spec(profile),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "images_per_s": round(throughput, 1),
+        "top1_agreement": round(float(np.mean(predictions.argmax(axis=1) == reference)), 4),
+        "model_mb": round(os.path.getsize(path) / 1e6, 2),
+    }
+
+# Fastest profile (by p50 latency or by throughput) that keeps accuracy
+def choose(results, max_disagreement, optimize):
+    eligible = [result for result in results if result["top1_agreement"] >= 1 - max_disagreement]
+    if not eligible:
+        return None
+    if optimize == "throughput":
+        return max(eligible, key=lambda result: result["images_per_s"])
+    return min(eligible, key=lambda result: result["p50_ms"])
+
+def write_profile(path, crop, result):
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = json.load(f)
+    profiles[crop] = {key: result[key] for key in ("variant", "threads", "xnnpack")}
+    with open(path + '.tmp', 'w') as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--crop', required=True)
+    parser.add_argument('--images', required=True, help="directory of held-out images")
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--variants', nargs='+', choices=list(MODEL_VARIANTS), default=list(MODEL_VARIANTS))
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument('--xnnpack', nargs='+', choices=['on', 'off'], default=['on', 'off'])
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--max-disagreement', type=float, default=0.01,
+                        help="largest acceptable fraction of top-1 predictions that differ from the float model")
+    parser.add_argument('--optimize', choices=['latency', 'throughput'], default='latency')
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--write-profile', action='store_true', help=f"store the chosen profile in {PROFILES_PATH}")
+    args = parser.parse_args()
+
+    crop = args.crop.lower()
+    paths = image_paths(args.images, args.limit)
+    if not paths:
+        parser.error(f"No images found in {args.images}")
+    models = {variant: os.path.join(args.model_dir, crop + suffix) for variant, suffix in MODEL_VARIANTS.items()
+              if variant in args.variants and os.path.exists(os.path.join(args.model_dir, crop + suffix))}
+    if "float" not in models:
+        parser.error(f"{crop}{MODEL_VARIANTS['float']} not found in {args.model_dir}")
+
+    reference_model = PooledInterpreter(models["float"], profile=REFERENCE)
+    images = load_images(paths, reference_model.input_size)
+    reference = predict_all(reference_model, images, args.batch).argmax(axis=1)
+    del reference_model
+
+    results = []
+    print(f"{len(images)} images; agreement is top-1 vs float on builtin kernels")
+    print(f"{'variant':>7} {'threads':>7} {'xnnpack':>7} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'agree':>6} {'MB':>6}")
+    for (variant, path), threads, xnnpack in itertools.product(models.items(), args.threads, args.xnnpack):
+        result = measure(path, ExecutionProfile(variant, threads, xnnpack == 'on'), images, reference, args.batch)
+        results.append(result)
+        print(f"{variant:>7} {threads:>7} {xnnpack:>7} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+              f"{result['images_per_s']:>8.1f} {result['top1_agreement']:>6.3f} {result['model_mb']:>6.2f}")
+
+    chosen = choose(results, args.max_disagreement, args.optimize)
+    if chosen is None:
+        print("No profile keeps top-1 agreement within the limit")
+    else:
+        print(f"Fastest ({args.optimize}) within {args.max_disagreement:.1%} disagreement: "
+              f"{json.dumps({key: chosen[key] for key in ('variant', 'threads', 'xnnpack')})}")
+        if args.write_profile:
+            write_profile(PROFILES_PATH, crop, chosen)
+            print(f"Wrote {PROFILES_PATH}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"crop": crop, "images": len(images), "results": results, "chosen": chosen}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
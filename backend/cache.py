@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Thread-safe in-memory LRU cache with hit/miss counters
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard_where(self, predicate):
+        # Drop every entry whose key matches predicate; returns how many went
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+# LRU cache whose entries also expire `ttl` seconds after they were set
+class TTLCache(LRUCache):
+    def __init__(self, maxsize=1024, ttl=300.0, clock=time.monotonic):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.clock = clock
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        super().set(key, (self.clock() + (self.ttl if ttl is None else ttl), value))
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(ttl=self.ttl, expirations=self.expirations)
+        return stats
+
+# Persistent cache tier in a single SQLite file so entries survive restarts.
+# Values must be JSON-serializable. Each entry carries a `tag` and `version`
+# so a whole group (e.g. all results of one model) can be invalidated when
+# its version changes.
+class SQLiteCache:
+    def __init__(self, path, maxsize=100000):
+        self.path = path
+        self.maxsize = maxsize
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, tag TEXT, version TEXT, value TEXT, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_tag ON cache (tag, version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key, value, tag=None, version=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, tag, version, value, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, tag, version, json.dumps(value), time.time()),
+            )
+            # Evict least recently used rows beyond the size bound (checked every 100 writes)
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,),
+                )
+            self._conn.commit()
+
+    def purge_stale(self, tag, version):
+        # Remove entries of `tag` written under any version other than `version`
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM cache WHERE tag = ? AND version IS NOT ?", (tag, version)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "size": size,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -1,14 +1,15 @@
 import ee
+import os
 import requests
 from datetime import datetime, timedelta
+from chat_context import HTTP_TIMEOUT, ChatContext, http_session
+from earth_engine import ensure_earth_engine
+from intents import MessageParser, load_locations
+from metrics import register_cache, register_queue
 
-# Initialize Earth Engine
-try:
-    ee.Initialize()
-except Exception as e:
-    print(f"Error initializing Earth Engine: {e}")
-    ee.Authenticate()
-    ee.Initialize()
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'https://api.open-meteo.com/v1/forecast')
+# HTTP stand-in for the Earth Engine farm sample (e.g. stub_services.py); unset uses Earth Engine
+SATELLITE_CONTEXT_URL = os.environ.get('SATELLITE_CONTEXT_URL')
 
 # Expanded knowledge base
 CROP_DATA = {
@@ -35,6 +36,9 @@ GOV_SCHEMES = {
 
 # Analyze farm data using Earth Engine
 def analyze_farm(location, start_date, end_date):
+    if SATELLITE_CONTEXT_URL:
+        return fetch_farm_sample(location, start_date, end_date)
+    ensure_earth_engine()
     area = ee.Geometry.Rectangle([location['lon'] - 0.1, location['lat'] - 0.1,
                                   location['lon'] + 0.1, location['lat'] + 0.1])
     sentinel2 = ee.ImageCollection("COPERNICUS/S2") \
@@ -52,23 +56,51 @@ def analyze_farm(location, start_date, end_date):
         .sample(region=area, scale=10).first().getInfo()['properties']
     return sample, None
 
-# Fetch weather data (current + 7-day forecast) from Open-Meteo
+# Farm sample (NDVI, NDWI, SoilMoisture) from the HTTP stand-in service
+def fetch_farm_sample(location, start_date, end_date):
+    response = http_session.get(SATELLITE_CONTEXT_URL, params={
+        "lat": location['lat'], "lon": location['lon'], "start": start_date, "end": end_date,
+    }, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    if data.get("error"):
+        return None, data["error"]
+    return data, None
+
+WEATHER_FALLBACK = ({"temp": 25, "precip": 0, "soil_moisture": 10}, {"temp": 25, "precip": 0})
+
+# Fetch weather data (current + 7-day forecast) from Open-Meteo; raises on failure
+def fetch_weather(location):
+    response = http_session.get(WEATHER_API_URL, params={
+        "latitude": location['lat'], "longitude": location['lon'],
+        "hourly": "temperature_2m,precipitation,soil_moisture_0_1cm",
+        "past_days": 30, "forecast_days": 7,
+    }, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()["hourly"]
+    current = {
+        "temp": data["temperature_2m"][-1],
+        "precip": sum(data["precipitation"][-24:]) / 24,  # Last 24h average
+        "soil_moisture": data["soil_moisture_0_1cm"][-1]
+    }
+    # Forecast: Average next 7 days
+    future_temp = sum(data["temperature_2m"][-168:]) / 168  # Last 168 hours = 7 days
+    future_precip = sum(data["precipitation"][-168:]) / 7  # Total precip over 7 days
+    forecast = {"temp": future_temp, "precip": future_precip}
+    return current, forecast
+
+# Weather with the default values when Open-Meteo can't be reached
 def get_weather(location):
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={location['lat']}&longitude={location['lon']}&hourly=temperature_2m,precipitation,soil_moisture_0_1cm&past_days=30&forecast_days=7"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()["hourly"]
-        current = {
-            "temp": data["temperature_2m"][-1],
-            "precip": sum(data["precipitation"][-24:]) / 24,  # Last 24h average
-            "soil_moisture": data["soil_moisture_0_1cm"][-1]
-        }
-        # Forecast: Average next 7 days
-        future_temp = sum(data["temperature_2m"][-168:]) / 168  # Last 168 hours = 7 days
-        future_precip = sum(data["precipitation"][-168:]) / 7  # Total precip over 7 days
-        forecast = {"temp": future_temp, "precip": future_precip}
-        return current, forecast
-    return {"temp": 25, "precip": 0, "soil_moisture": 10}, {"temp": 25, "precip": 0}  # Fallback
+    try:
+        return fetch_weather(location)
+    except requests.RequestException:
+        return WEATHER_FALLBACK  # Fallback
+
+# Cached satellite and weather context, fetched concurrently
+chat_context = ChatContext(analyze_farm, fetch_weather, WEATHER_FALLBACK)
+register_cache('chat_satellite', chat_context.satellite_cache.stats)
+register_cache('chat_weather', chat_context.weather_cache.stats)
+register_queue('chat_in_flight', lambda: chat_context.stats()["in_flight"])
 
 # Generate recommendations
 def generate_recommendations(farm_data, current_weather, forecast_weather, crop_type="unknown"):
@@ -126,13 +158,27 @@ def generate_recommendations(farm_data, current_weather, forecast_weather, crop_
     # Yield Tips
     recs.append(f"To improve {crop_type} yield: {crop_info['yield_tips']}")
     # Government Schemes
-    if "water" in " ".join(recs).lower():
+    text = " ".join(recs).lower()
+    if "water" in text:
         recs.append(GOV_SCHEMES["irrigation"])
-    if "fertilizer" in " ".join(recs).lower():
+    if "fertilizer" in text:
         recs.append(GOV_SCHEMES["fertilizer"])
     recs.append(GOV_SCHEMES["general"])
     return recs
 
+# Known places; CHAT_LOCATIONS_CSV (name,lat,lon) can add more, e.g. villages
+LOCATIONS = {"pune": (18.5, 73.8), "nashik": (20.0, 73.8), "mumbai": (19.07, 72.87),
+             "delhi": (28.61, 77.21), "bangalore": (12.97, 77.59)}
+if os.environ.get('CHAT_LOCATIONS_CSV'):
+    LOCATIONS.update(load_locations(os.environ['CHAT_LOCATIONS_CSV']))
+
+# Words the chatbot reacts to
+KEYWORDS = ("advice", "farm", "weather", "rain", "soil", "pest", "bug", "scheme", "subsidy",
+            "yield", "improve", "resource", "manage", "latitude", "longitude")
+
+# Built once: location, crop and keywords come out of one pass over a message
+message_parser = MessageParser(LOCATIONS, CROP_DATA, KEYWORDS)
+
 # Chatbot logic
 def chatbot(user_input):
     user_input = user_input.lower().strip()
@@ -140,54 +186,49 @@ def chatbot(user_input):
     crop_type = "unknown"
     end_date = datetime.now().strftime('%Y-%m-%d')
     start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    parsed = message_parser.parse(user_input)
+    keywords = parsed.keywords
     # Parse location
-    locations = {"pune": (18.5, 73.8), "nashik": (20.0, 73.8), "mumbai": (19.07, 72.87),
-                 "delhi": (28.61, 77.21), "bangalore": (12.97, 77.59)}
-    for city, (lat, lon) in locations.items():
-        if city in user_input:
-            location = {'lat': lat, 'lon': lon}
-            break
-    if "latitude" in user_input or "longitude" in user_input:
+    if parsed.location:
+        lat, lon = parsed.location
+        location = {'lat': lat, 'lon': lon}
+    if keywords & {"latitude", "longitude"}:
         try:
             lat, lon = map(float, [s for s in user_input.split() if s.replace('.', '').isdigit()][:2])
             location = {'lat': lat, 'lon': lon}
         except:
             pass
     # Parse crop type
-    for crop in CROP_DATA.keys():
-        if crop in user_input:
-            crop_type = crop
-            break
-    # Fetch data
-    farm_data, error = analyze_farm(location, start_date, end_date)
+    if parsed.crop:
+        crop_type = parsed.crop
+    # Fetch data (satellite and weather concurrently, cached per location and day)
+    farm_data, error, current_weather, forecast_weather = chat_context.fetch(location, start_date, end_date)
     if error:
         return error
-    current_weather, forecast_weather = get_weather(location)
     # Handle queries
     response = [f"For your {crop_type} farm at {location['lat']}°N, {location['lon']}°E:"]
-    if "advice" in user_input or "farm" in user_input or not any(
-            k in user_input for k in ["weather", "soil", "pest", "scheme", "yield"]):
+    if keywords & {"advice", "farm"} or not keywords & {"weather", "soil", "pest", "scheme", "yield"}:
         recs = generate_recommendations(farm_data, current_weather, forecast_weather, crop_type)
         response.extend(recs)
-    if "weather" in user_input or "rain" in user_input:
+    if keywords & {"weather", "rain"}:
         response.append(
             f"Now: Temp {current_weather['temp']:.1f}°C, Rain {current_weather['precip']:.1f} mm (last 24h).")
         response.append(
             f"Next 7 days: Avg Temp {forecast_weather['temp']:.1f}°C, Avg Rain {forecast_weather['precip']:.1f} mm/day.")
-    if "soil" in user_input:
+    if "soil" in keywords:
         for key, (min_val, max_val, advice) in SOIL_GUIDE.items():
             if min_val <= farm_data['SoilMoisture'] < max_val:
                 response.append(f"Soil: {advice} (Moisture: {farm_data['SoilMoisture']:.1f}%)")
                 break
-    if "pest" in user_input or "bug" in user_input:
+    if keywords & {"pest", "bug"}:
         if crop_type != "unknown":
             response.append(
                 f"Watch for {crop_type} pests: {', '.join([f'{k} ({v})' for k, v in CROP_DATA[crop_type]['pests'].items()])}.")
-    if "scheme" in user_input or "subsidy" in user_input:
+    if keywords & {"scheme", "subsidy"}:
         response.extend(GOV_SCHEMES.values())
-    if "yield" in user_input or "improve" in user_input:
+    if keywords & {"yield", "improve"}:
         response.append(f"To boost {crop_type} yield: {CROP_DATA[crop_type]['yield_tips']}")
-    if "resource" in user_input or "manage" in user_input:
+    if keywords & {"resource", "manage"}:
         response.append(
             f"Manage {crop_type}: Use {CROP_DATA[crop_type]['water_need']} mm/season water, apply fertilizer only when needed, rotate crops.")
     if not response[1:]:
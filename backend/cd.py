@@ -1,13 +1,76 @@
+import hashlib
+import io
+import json
 import os
+import queue
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from PIL import Image
 import numpy as np
-import tensorflow as tf
+from cache import LRUCache, SQLiteCache
+from startup import startup_timer
+from metrics import observe_stage, register_cache, register_queue, timed
 
-# Configure upload folder and allowed extensions
-UPLOAD_FOLDER = 'uploads'
-MODEL_DIR = 'crop_disease_models'  # Directory containing .tflite models
+# TensorFlow is imported on first model load (see load_tensorflow)
+tf = None
+
+# Configure model folder and allowed extensions
+MODEL_DIR = os.environ.get('CD_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crop_disease_models'))  # Directory containing .tflite models
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
+# Execution profiles per crop model: which converted variant of
+# <crop>.tflite to load (see convert_models.py), the interpreter thread
+# count (None lets TFLite decide) and whether the XNNPACK delegate is used.
+# Profiles come from a JSON file, e.g.
+#   {"default": {"threads": 2}, "rice": {"variant": "int8", "threads": 4, "xnnpack": true}}
+# bench_tflite.py measures the options and can write the chosen profile.
+ExecutionProfile = namedtuple("ExecutionProfile", ["variant", "threads", "xnnpack"])
+DEFAULT_PROFILE = ExecutionProfile(variant="float", threads=None, xnnpack=True)
+MODEL_VARIANTS = {"float": ".tflite", "fp16": ".fp16.tflite", "int8": ".int8.tflite"}
+PROFILES_PATH = os.environ.get('CD_PROFILES', os.path.join(MODEL_DIR, 'profiles.json'))
+
+# Interpreter pool settings (ready interpreters kept per crop model)
+POOL_SIZE = int(os.environ.get('CD_POOL_SIZE', 2))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('CD_POOL_ACQUIRE_TIMEOUT', 30))
+
+# Micro-batching settings (a window of 0 sends every request straight to the model)
+BATCH_WINDOW_MS = float(os.environ.get('CD_BATCH_WINDOW_MS', 10))
+MAX_BATCH_SIZE = int(os.environ.get('CD_MAX_BATCH_SIZE', 16))
+BATCH_RESULT_TIMEOUT = float(os.environ.get('CD_BATCH_RESULT_TIMEOUT', 30))
+
+# Multi-image upload limits and decode parallelism
+MAX_UPLOAD_IMAGES = int(os.environ.get('CD_MAX_UPLOAD_IMAGES', 200))
+MAX_ZIP_BYTES = int(os.environ.get('CD_MAX_ZIP_BYTES', 200 * 1024 * 1024))
+PREPROCESS_WORKERS = int(os.environ.get('CD_PREPROCESS_WORKERS', 4))
+
+# Prediction result cache (set CD_RESULT_CACHE_PATH to a SQLite file to keep results across restarts)
+RESULT_CACHE_SIZE = int(os.environ.get('CD_RESULT_CACHE_SIZE', 4096))
+RESULT_CACHE_PATH = os.environ.get('CD_RESULT_CACHE_PATH')
+
+# Map the predicted class to a disease name (example mapping)
+CLASSES = {
+    "rice": ['Bacterial_leaf_blight', 'Brown_spot', 'Leaf_smut'],
+    "wheat": ['Rust', 'Powdery_mildew', 'Septoria_leaf_blotch'],
+    "corn": ['Northern_leaf_blight', 'Gray_leaf_spot', 'Common_rust']
+}
+
+# Recommendation for each disease
+RECOMMENDATIONS = {
+    "Bacterial_leaf_blight": "Apply copper-based fungicides and ensure proper drainage.",
+    "Brown_spot": "Remove infected leaves and use fungicides like Mancozeb.",
+    "Leaf_smut": "Use resistant varieties and practice crop rotation.",
+    "Rust": "Apply systemic fungicides and monitor moisture levels.",
+    "Powdery_mildew": "Use sulfur-based fungicides and improve air circulation.",
+    "Septoria_leaf_blotch": "Apply fungicides early and rotate crops.",
+    "Northern_leaf_blight": "Use resistant hybrids and manage residue.",
+    "Gray_leaf_spot": "Apply strobilurin fungicides and reduce plant stress.",
+    "Common_rust": "Use fungicides and select resistant varieties."
+}
+
 # Helper function to check allowed file extensions
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -20,6 +83,473 @@ def preprocess_image(image_path, target_size=(224, 224)):
     img_array = np.expand_dims(img_array, axis=0).astype(np.float32)  # Add batch dimension
     return img_array
 
+# Decode an in-memory image straight into a float32 model input buffer.
+# target_size is the model's (height, width); `out` may be a preallocated
+# (height, width, 3) float32 array (e.g. one row of a batch) to write into.
+def decode_image(data, target_size=(224, 224), out=None):
+    height, width = target_size
+    if out is None:
+        out = np.empty((1, height, width, 3), dtype=np.float32)
+    with Image.open(io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data) as img:
+        with timed('cd', 'decode'):
+            img.draft('RGB', (width, height))  # JPEG only: decode at 1/2, 1/4 or 1/8 scale when large enough
+            img = img.convert('RGB')
+        with timed('cd', 'preprocess'):
+            if img.size != (width, height):
+                img = img.resize((width, height))
+            np.divide(np.asarray(img), np.float32(255.0), out=out[0] if out.ndim == 4 else out, casting='unsafe')
+    return out
+
+# Function to turn model output rows into disease/confidence/recommendation results
+def postprocess_predictions(predictions, crop_type):
+    labels = CLASSES[crop_type.lower()]
+    results = []
+    with timed('cd', 'postprocess'):
+        for row in np.asarray(predictions):
+            predicted_disease = labels[int(np.argmax(row))]
+            results.append({
+                "disease": predicted_disease,
+                "confidence": round(float(np.max(row)) * 100, 2),  # Confidence score as percentage
+                "recommendation": RECOMMENDATIONS.get(predicted_disease, "Consult an expert for further guidance."),
+            })
+    return results
+
+# Batch sizes are rounded up to a power of two so the interpreter only
+# reallocates its tensors for a handful of shapes
+def batch_bucket(n):
+    bucket = 1
+    while bucket < n:
+        bucket *= 2
+    return bucket
+
+# Import TensorFlow once, on first use, and record how long it took
+def load_tensorflow():
+    global tf
+    if tf is None:
+        with startup_timer.stage('cd.tensorflow_import'):
+            import tensorflow
+        tf = tensorflow
+    return tf
+
+# ExecutionProfile from a profiles-file entry, filling gaps from `base`
+def parse_profile(spec, base=DEFAULT_PROFILE):
+    unknown = set(spec) - {"variant", "threads", "xnnpack"}
+    if unknown:
+        raise ValueError(f"Unknown profile settings: {', '.join(sorted(unknown))}")
+    profile = base._replace(**spec)
+    if profile.variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant '{profile.variant}'")
+    if profile.threads is not None and int(profile.threads) < 1:
+        raise ValueError("threads must be at least 1")
+    return profile._replace(threads=None if profile.threads is None else int(profile.threads),
+                            xnnpack=bool(profile.xnnpack))
+
+# {crop or "default": ExecutionProfile} from a profiles file (empty if there is none)
+def load_profiles(path=PROFILES_PATH):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        specs = json.load(f)
+    default = parse_profile(specs.get("default", {}))
+    profiles = {crop.lower(): parse_profile(spec, default) for crop, spec in specs.items() if crop != "default"}
+    profiles["default"] = default
+    return profiles
+
+def profile_spec(profile):
+    return {"variant": profile.variant, "threads": profile.threads, "xnnpack": profile.xnnpack}
+
+# A loaded interpreter with its tensor details resolved once
+class PooledInterpreter:
+    def __init__(self, model_path, version=None, profile=DEFAULT_PROFILE):
+        self.version = version
+        self.profile = profile
+        lite = load_tensorflow().lite
+        # The default resolver applies XNNPACK; the other one runs the plain builtin kernels
+        resolver = (lite.experimental.OpResolverType.AUTO if profile.xnnpack
+                    else lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+        self.interpreter = lite.Interpreter(
+            model_path=model_path,
+            num_threads=profile.threads,
+            experimental_op_resolver_type=resolver,
+        )
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.batch_size = int(self.input_details[0]['shape'][0])
+
+    @property
+    def input_size(self):
+        shape = self.input_details[0]['shape']
+        return (shape[1], shape[2])
+
+    def _resize(self, batch_size):
+        shape = [batch_size, *self.input_details[0]['shape'][1:]]
+        self.interpreter.resize_tensor_input(self.input_details[0]['index'], shape)
+        self.interpreter.allocate_tensors()
+        self.batch_size = batch_size
+
+    def predict(self, img_array):
+        # Run a (possibly multi-image) batch, padding it up to the bucket size
+        count = img_array.shape[0]
+        bucket = batch_bucket(count)
+        if bucket != self.batch_size:
+            self._resize(bucket)
+        if bucket != count:
+            padding = np.zeros((bucket - count, *img_array.shape[1:]), dtype=img_array.dtype)
+            img_array = np.concatenate([img_array, padding])
+        self.interpreter.set_tensor(self.input_details[0]['index'], quantize(img_array, self.input_details[0]))
+        with timed('cd', 'invoke'):
+            self.interpreter.invoke()
+        return dequantize(self.interpreter.get_tensor(self.output_details[0]['index'])[:count], self.output_details[0])
+
+# Models converted with integer inputs/outputs take and return quantized
+# tensors; float tensors pass through unchanged
+def quantize(array, details):
+    dtype = details['dtype']
+    if np.issubdtype(dtype, np.floating):
+        return array.astype(dtype, copy=False)
+    scale, zero_point = details['quantization']
+    limits = np.iinfo(dtype)
+    return np.clip(np.round(array / scale + zero_point), limits.min, limits.max).astype(dtype)
+
+def dequantize(array, details):
+    if np.issubdtype(details['dtype'], np.floating):
+        return array
+    scale, zero_point = details['quantization']
+    return (array.astype(np.float32) - zero_point) * scale
+
+# Process-wide registry of TFLite interpreters, keyed by crop type.
+# Each crop gets up to `pool_size` interpreters, built lazily on first use
+# (or eagerly via warm_up), and a thread checks one out exclusively for the
+# duration of an inference so interpreters are never shared across threads.
+class InterpreterPool:
+    def __init__(self, model_dir=MODEL_DIR, pool_size=POOL_SIZE, acquire_timeout=POOL_ACQUIRE_TIMEOUT, profiles=None):
+        self.model_dir = model_dir
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self.profiles = load_profiles() if profiles is None else profiles
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._created = {}
+        self._load_times = {}
+        self._input_sizes = {}
+        self._model_files = {}
+
+    def profile(self, crop_type):
+        return self.profiles.get(crop_type.lower(), self.profiles.get("default", DEFAULT_PROFILE))
+
+    # The profile's model variant, or the float model if that variant hasn't been converted
+    def model_path(self, crop_type):
+        crop = crop_type.lower()
+        path = os.path.join(self.model_dir, crop + MODEL_VARIANTS[self.profile(crop).variant])
+        if not os.path.exists(path):
+            return os.path.join(self.model_dir, crop + MODEL_VARIANTS["float"])
+        return path
+
+    # Cheap fingerprint of the model file; changes whenever the file is replaced
+    def model_version(self, crop_type):
+        try:
+            stat = os.stat(self.model_path(crop_type))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Model file not found for crop type '{crop_type}'.")
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def available_crops(self):
+        if not os.path.isdir(self.model_dir):
+            return []
+        # Converted variants (<crop>.int8.tflite, ...) belong to their float model
+        return sorted(name[:-len('.tflite')] for name in os.listdir(self.model_dir)
+                      if name.endswith('.tflite') and '.' not in name[:-len('.tflite')])
+
+    def _load(self, crop):
+        version = self.model_version(crop)
+        started = time.perf_counter()
+        path = self.model_path(crop)
+        pooled = PooledInterpreter(path, version, self.profile(crop))
+        elapsed = time.perf_counter() - started
+        observe_stage('cd', 'model_load', elapsed)
+        with self._lock:
+            self._load_times.setdefault(crop, []).append(elapsed)
+            self._input_sizes[crop] = pooled.input_size
+            self._model_files[crop] = os.path.basename(path)
+        return pooled
+
+    def _reserve(self, crop):
+        # Returns the idle queue and whether the caller should build a new interpreter
+        with self._lock:
+            idle = self._idle.setdefault(crop, queue.LifoQueue())
+            build = idle.empty() and self._created.get(crop, 0) < self.pool_size
+            if build:
+                self._created[crop] = self._created.get(crop, 0) + 1
+        return idle, build
+
+    def _checkout(self, crop):
+        idle, build = self._reserve(crop)
+        if not build:
+            try:
+                pooled = idle.get(timeout=self.acquire_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No interpreter available for crop type '{crop}'.")
+            # Replace interpreters built from a model file that has since changed
+            try:
+                if pooled.version == self.model_version(crop):
+                    return idle, pooled
+                return idle, self._load(crop)
+            except Exception:
+                idle.put(pooled)
+                raise
+        try:
+            return idle, self._load(crop)
+        except Exception:
+            with self._lock:
+                self._created[crop] -= 1
+            raise
+
+    @contextmanager
+    def acquire(self, crop_type):
+        idle, pooled = self._checkout(crop_type.lower())
+        try:
+            yield pooled
+        finally:
+            idle.put(pooled)
+
+    def input_size(self, crop_type):
+        crop = crop_type.lower()
+        if crop not in self._input_sizes:
+            with self.acquire(crop) as pooled:
+                return pooled.input_size
+        return self._input_sizes[crop]
+
+    def warm_up(self, crop_types=None):
+        """
+        Fill the pool for each crop (all models in model_dir by default) and
+        return the time spent loading, in seconds, per crop.
+        """
+        report = {}
+        for crop in (crop_types or self.available_crops()):
+            crop = crop.lower()
+            started = time.perf_counter()
+            while True:
+                idle, build = self._reserve(crop)
+                if not build:
+                    break
+                try:
+                    idle.put(self._load(crop))
+                except Exception:
+                    with self._lock:
+                        self._created[crop] -= 1
+                    raise
+            report[crop] = round(time.perf_counter() - started, 4)
+        return report
+
+    def stats(self):
+        with self._lock:
+            return {
+                crop: {
+                    "interpreters": self._created.get(crop, 0),
+                    "idle": self._idle[crop].qsize(),
+                    "loads": len(self._load_times.get(crop, [])),
+                    "load_seconds": round(sum(self._load_times.get(crop, [])), 4),
+                    "model_file": self._model_files.get(crop),
+                    "profile": profile_spec(self.profile(crop)),
+                }
+                for crop in self._idle
+            }
+
+interpreter_pool = InterpreterPool()
+
+# FIFO of pending requests that can hand an item back to the front
+class PendingQueue(queue.Queue):
+    def put_front(self, item):
+        with self.not_empty:
+            self.queue.appendleft(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+# Collects concurrent requests for the same crop into one interpreter call.
+# Each crop gets one worker per pooled interpreter; a worker blocks for the
+# first request, then keeps collecting for at most `window_ms` (or until
+# a batch would exceed `max_batch_size` images), runs the stacked batch once and
+# hands every caller back its own rows.
+class MicroBatcher:
+    def __init__(self, pool, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE):
+        self.pool = pool
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._queues = {}
+        self.batches_run = 0
+        self.images_run = 0
+
+    def _queue_for(self, crop):
+        with self._lock:
+            pending = self._queues.get(crop)
+            if pending is None:
+                pending = self._queues[crop] = PendingQueue()
+                for i in range(self.pool.pool_size):
+                    threading.Thread(target=self._worker, args=(crop, pending),
+                                     name=f"cd-batcher-{crop}-{i}", daemon=True).start()
+        return pending
+
+    def submit(self, crop_type, img_array):
+        future = Future()
+        self._queue_for(crop_type.lower()).put((img_array, future))
+        return future
+
+    def predict(self, crop_type, img_array, timeout=BATCH_RESULT_TIMEOUT):
+        return self.submit(crop_type, img_array).result(timeout=timeout)
+
+    def _collect(self, pending):
+        batch, size = [], 0
+        deadline = None
+        while size < self.max_batch_size:
+            try:
+                if deadline is None:
+                    item = pending.get()
+                    deadline = time.monotonic() + self.window
+                else:
+                    item = pending.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            # An item that would overflow the batch waits at the head of the
+            # queue for the next one; only a first item may be larger on its own
+            if batch and size + item[0].shape[0] > self.max_batch_size:
+                pending.put_front(item)
+                break
+            # Callers that gave up (cancelled futures) are dropped here
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+                size += item[0].shape[0]
+        return batch
+
+    def _worker(self, crop, pending):
+        while True:
+            batch = self._collect(pending)
+            if not batch:
+                continue
+            try:
+                with self.pool.acquire(crop) as pooled:
+                    predictions = pooled.predict(np.concatenate([img_array for img_array, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self.batches_run += 1
+                self.images_run += len(predictions)
+            offset = 0
+            for img_array, future in batch:
+                future.set_result(predictions[offset:offset + img_array.shape[0]])
+                offset += img_array.shape[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches_run,
+                "images": self.images_run,
+                "mean_batch_size": round(self.images_run / self.batches_run, 2) if self.batches_run else 0,
+                "queued": {crop: pending.qsize() for crop, pending in self._queues.items()},
+            }
+
+micro_batcher = MicroBatcher(interpreter_pool)
+register_queue('cd_batcher', lambda: sum(micro_batcher.stats()["queued"].values()))
+
+# Run the model on preprocessed images, through the batcher when it is enabled
+def run_inference(crop_type, img_array):
+    if micro_batcher.window > 0:
+        return micro_batcher.predict(crop_type, img_array)
+    with interpreter_pool.acquire(crop_type) as pooled:
+        return pooled.predict(img_array)
+
+# Run several image batches, letting the batcher spread them across interpreters
+def run_inference_many(crop_type, img_arrays):
+    if micro_batcher.window > 0:
+        futures = [micro_batcher.submit(crop_type, img_array) for img_array in img_arrays]
+        return [future.result(timeout=BATCH_RESULT_TIMEOUT) for future in futures]
+    return [run_inference(crop_type, img_array) for img_array in img_arrays]
+
+# Prediction results keyed by a hash of the image bytes, the crop and the
+# model file version. A memory LRU sits in front of an optional SQLite tier.
+# The first lookup after a crop's model file changes drops that crop's
+# stale entries from both tiers; other crops are untouched.
+class PredictionCache:
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, path=RESULT_CACHE_PATH):
+        self.memory = LRUCache(maxsize)
+        self.disk = SQLiteCache(path) if path else None
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def _check_version(self, crop, version):
+        with self._lock:
+            previous = self._versions.get(crop)
+            self._versions[crop] = version
+        if previous != version:
+            current = f"{crop}:{version}:"
+            self.memory.discard_where(lambda key: key.startswith(f"{crop}:") and not key.startswith(current))
+            if self.disk is not None:
+                self.disk.purge_stale(crop, version)
+
+    def lookup(self, data, crop_type, version):
+        # Returns (key, cached result or None)
+        crop = crop_type.lower()
+        self._check_version(crop, version)
+        key = f"{crop}:{version}:{hashlib.blake2b(data, digest_size=16).hexdigest()}"
+        result = self.memory.get(key)
+        if result is None and self.disk is not None:
+            result = self.disk.get(key)
+            if result is not None:
+                self.memory.set(key, result)
+        return key, (dict(result) if result is not None else None)
+
+    def store(self, key, crop_type, version, result):
+        self.memory.set(key, result)
+        if self.disk is not None:
+            self.disk.set(key, result, tag=crop_type.lower(), version=version)
+
+    def stats(self):
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+prediction_cache = PredictionCache()
+register_cache('cd_predictions', prediction_cache.memory.stats)
+if prediction_cache.disk is not None:
+    register_cache('cd_predictions_disk', prediction_cache.disk.stats)
+
+preprocess_executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix='cd-preprocess')
+
+# Expand uploaded files (zip archives included) into (filename, bytes) pairs
+def expand_uploads(files):
+    images = []
+    for file in files:
+        if file.filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(file.stream) as archive:
+                members = [info for info in archive.infolist() if not info.is_dir() and allowed_file(info.filename)]
+                if sum(info.file_size for info in members) > MAX_ZIP_BYTES:
+                    raise ValueError("Zip archive is too large")
+                images.extend((info.filename, archive.read(info)) for info in members)
+        else:
+            images.append((file.filename, file.read()))
+        if len(images) > MAX_UPLOAD_IMAGES:
+            raise ValueError(f"Too many images (maximum is {MAX_UPLOAD_IMAGES})")
+    return images
+
+# Plot-level aggregate of per-image results
+def summarize_results(results):
+    analyzed = [result for result in results if "disease" in result]
+    disease_counts = {}
+    for result in analyzed:
+        disease_counts[result["disease"]] = disease_counts.get(result["disease"], 0) + 1
+    return {
+        "images": len(results),
+        "analyzed": len(analyzed),
+        "failed": len(results) - len(analyzed),
+        "disease_counts": disease_counts,
+        "most_common_disease": max(disease_counts, key=disease_counts.get) if disease_counts else None,
+        "mean_confidence": round(sum(result["confidence"] for result in analyzed) / len(analyzed), 2) if analyzed else None,
+    }
+
 # Main function to analyze crop disease
 def analyze_crop_disease(file, crop_type):
     try:
@@ -27,74 +557,78 @@ def analyze_crop_disease(file, crop_type):
         if not allowed_file(file.filename):
             raise ValueError("Invalid file type")
 
-        # Construct the path to the model file
-        model_filename = f"{crop_type.lower()}.tflite"
-        MODEL_PATH = os.path.join(MODEL_DIR, model_filename)
+        # Read the upload into memory; a re-upload of the same photo is served from cache
+        data = file.read()
+        version = interpreter_pool.model_version(crop_type)
+        key, cached = prediction_cache.lookup(data, crop_type, version)
+        if cached is not None:
+            return cached
 
-        # Ensure the upload folder exists
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        filename = file.filename
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # Decode the image at the model's input size
+        img_array = decode_image(data, interpreter_pool.input_size(crop_type))
 
-        # Check if the model file exists
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"Model file not found for crop type '{crop_type}'.")
+        # Perform inference and post-process the predictions
+        predictions = run_inference(crop_type, img_array)
+        result = postprocess_predictions(predictions, crop_type)[0]
+        prediction_cache.store(key, crop_type, version, result)
+        return result
 
-        # Load the TensorFlow Lite model (disable XNNPACK)
-        interpreter = tf.lite.Interpreter(
-            model_path=MODEL_PATH,
-            experimental_delegates=None,  # Disable XNNPACK
-        )
-        interpreter.allocate_tensors()
+    except Exception as e:
+        raise Exception(f"Error during analysis: {str(e)}")
 
-        # Get input and output details
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
+# Analyze many images (or zip archives of images) of one crop in a single call
+def analyze_crop_disease_batch(files, crop_type):
+    try:
+        if crop_type.lower() not in CLASSES:
+            raise ValueError(f"Unsupported crop type '{crop_type}'.")
 
-        # Preprocess the image
-        img_array = preprocess_image(file_path, target_size=(input_details[0]['shape'][1], input_details[0]['shape'][2]))
+        images = expand_uploads(files)
+        if not images:
+            raise ValueError("No valid image files provided")
 
-        # Perform inference
-        interpreter.set_tensor(input_details[0]['index'], img_array)
-        interpreter.invoke()
-        predictions = interpreter.get_tensor(output_details[0]['index'])
+        # Serve images seen before from the result cache
+        version = interpreter_pool.model_version(crop_type)
+        results = [None] * len(images)
+        keys = [None] * len(images)
+        for i, (filename, data) in enumerate(images):
+            if not allowed_file(filename):
+                results[i] = {"filename": filename, "error": "Invalid file type"}
+                continue
+            keys[i], cached = prediction_cache.lookup(data, crop_type, version)
+            if cached is not None:
+                results[i] = {"filename": filename, **cached}
+        pending = [i for i in range(len(images)) if results[i] is None]
 
-        # Post-process the predictions
-        predicted_class_index = np.argmax(predictions, axis=1)[0]  # Get the predicted class index
-        confidence = np.max(predictions) * 100  # Confidence score as percentage
+        # Decode the remaining images in parallel into one preallocated input buffer
+        height, width = interpreter_pool.input_size(crop_type)
+        batch = np.empty((len(pending), height, width, 3), dtype=np.float32)
 
-        # Map the predicted class to a disease name (example mapping)
-        classes = {
-            "rice": ['Bacterial_leaf_blight', 'Brown_spot', 'Leaf_smut'],
-            "wheat": ['Rust', 'Powdery_mildew', 'Septoria_leaf_blotch'],
-            "corn": ['Northern_leaf_blight', 'Gray_leaf_spot', 'Common_rust']
-        }
-        predicted_disease = classes[crop_type.lower()][predicted_class_index]
-
-        # Generate a recommendation based on the disease
-        recommendations = {
-            "Bacterial_leaf_blight": "Apply copper-based fungicides and ensure proper drainage.",
-            "Brown_spot": "Remove infected leaves and use fungicides like Mancozeb.",
-            "Leaf_smut": "Use resistant varieties and practice crop rotation.",
-            "Rust": "Apply systemic fungicides and monitor moisture levels.",
-            "Powdery_mildew": "Use sulfur-based fungicides and improve air circulation.",
-            "Septoria_leaf_blotch": "Apply fungicides early and rotate crops.",
-            "Northern_leaf_blight": "Use resistant hybrids and manage residue.",
-            "Gray_leaf_spot": "Apply strobilurin fungicides and reduce plant stress.",
-            "Common_rust": "Use fungicides and select resistant varieties."
-        }
-        recommendation = recommendations.get(predicted_disease, "Consult an expert for further guidance.")
+        def load(row):
+            decode_image(images[pending[row]][1], (height, width), out=batch[row])
+
+        futures = [preprocess_executor.submit(load, row) for row in range(len(pending))]
+        ready = []
+        for row, future in enumerate(futures):
+            try:
+                future.result()
+                ready.append(row)
+            except Exception as e:
+                results[pending[row]] = {"filename": images[pending[row]][0], "error": str(e)}
 
-        # Clean up the uploaded file
-        os.remove(file_path)
+        # Run the decoded images through the model in batches
+        chunks = [ready[start:start + MAX_BATCH_SIZE] for start in range(0, len(ready), MAX_BATCH_SIZE)]
+        all_predictions = run_inference_many(crop_type, [batch[chunk] for chunk in chunks])
+        for chunk, predictions in zip(chunks, all_predictions):
+            for row, result in zip(chunk, postprocess_predictions(predictions, crop_type)):
+                i = pending[row]
+                prediction_cache.store(keys[i], crop_type, version, result)
+                results[i] = {"filename": images[i][0], **result}
 
-        # Return the results
         return {
-            "disease": predicted_disease,
-            "confidence": round(confidence, 2),
-            "recommendation": recommendation,
+            "cropType": crop_type,
+            "results": results,
+            "summary": summarize_results(results),
         }
 
     except Exception as e:
-        raise Exception(f"Error during analysis: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error during batch analysis: {str(e)}")
@@ -0,0 +1,132 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from cache import LRUCache
+
+# Most points drawn per line in the PNG (two per horizontal pixel at 1200 px)
+PNG_MAX_POINTS = 2400
+# Most points per line in the client-side series
+SERIES_MAX_POINTS = int(os.environ.get('SAT_SERIES_MAX_POINTS', 500))
+# Rendered charts and series, keyed by a hash of the plotted data
+chart_cache = LRUCache(int(os.environ.get('SAT_CHART_CACHE_SIZE', 256)))
+
+_local = threading.local()
+
+# Indices of a min/max-per-bucket decimation of `values` down to about
+# `max_points`, always including the indices in `keep` (e.g. anomalies)
+def downsample(values, max_points, keep=None):
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    bucket_ids = np.repeat(np.arange(buckets), np.diff(edges))
+    # Sorted by (bucket, value), each bucket's first entry is its minimum and its last its maximum
+    order = np.lexsort((values, bucket_ids))
+    indices = [order[edges[:-1]], order[edges[1:] - 1]]
+    if keep is not None:
+        indices.append(np.asarray(keep, dtype=np.int64))
+    return np.unique(np.concatenate(indices))
+
+# The plotted columns as plain arrays: day numbers (days since 1970-01-01),
+# NDVI values and anomaly flags for the history and, optionally, the forecast
+def chart_data(ndvi_df, future_df=None):
+    def columns(df):
+        if df is None:
+            return np.empty(0, np.int64), np.empty(0), np.empty(0, bool)
+        days = df.index.values.astype('datetime64[D]').astype(np.int64)
+        return days, df['NDVI'].to_numpy(dtype=np.float64), df['anomaly'].to_numpy(dtype=bool)
+    return columns(ndvi_df) + columns(future_df)
+
+def data_key(kind, arrays, *extra):
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(b'|')
+    return f"{kind}:{':'.join(map(str, extra))}:{digest.hexdigest()}"
+
+# One figure per thread, built once and updated in place for every chart.
+# Uses the object-oriented Agg canvas, so no pyplot global state is touched.
+class NdviChart:
+    def __init__(self):
+        self.figure = Figure(figsize=(12, 6))
+        self.canvas = FigureCanvasAgg(self.figure)
+        axes = self.figure.add_subplot()
+        self.ndvi_line, = axes.plot([], [], label='NDVI', color='green', linewidth=2)
+        self.anomaly_points, = axes.plot([], [], 'o', color='red', label='Anomalies', zorder=5)
+        self.future_line, = axes.plot([], [], label='Future NDVI', color='blue', linestyle='--', linewidth=2)
+        self.future_points, = axes.plot([], [], 'o', color='orange', label='Future Anomalies', zorder=5)
+        axes.set_title('NDVI Time Series with Anomalies')
+        axes.set_xlabel('Date')
+        axes.set_ylabel('NDVI')
+        axes.grid(True)
+        axes.xaxis_date()
+        self.axes = axes
+
+    # PNG bytes for the arrays returned by chart_data
+    def render(self, days, ndvi, anomaly, future_days, future_ndvi, future_anomaly):
+        shown = downsample(ndvi, PNG_MAX_POINTS, np.flatnonzero(anomaly))
+        self.ndvi_line.set_data(days[shown], ndvi[shown])
+        self.anomaly_points.set_data(days[anomaly], ndvi[anomaly])
+        self.future_line.set_data(future_days, future_ndvi)
+        self.future_points.set_data(future_days[future_anomaly], future_ndvi[future_anomaly])
+
+        handles = [self.ndvi_line, self.anomaly_points]
+        if len(future_days):
+            handles += [self.future_line, self.future_points]
+        self.axes.legend(handles=handles)
+        self.axes.relim()
+        self.axes.autoscale_view()
+
+        buffer = io.BytesIO()
+        self.canvas.print_png(buffer)
+        return buffer.getvalue()
+
+def _chart():
+    chart = getattr(_local, 'chart', None)
+    if chart is None:
+        chart = _local.chart = NdviChart()
+    return chart
+
+# Base64 PNG of the NDVI history, its anomalies and the forecast
+def render_ndvi_png(ndvi_df, future_df=None):
+    arrays = chart_data(ndvi_df, future_df)
+    key = data_key('png', arrays)
+    image_base64 = chart_cache.get(key)
+    if image_base64 is None:
+        image_base64 = base64.b64encode(_chart().render(*arrays)).decode('utf-8')
+        chart_cache.set(key, image_base64)
+    return image_base64
+
+# Compact JSON-ready version of the chart for drawing on the client:
+# day offsets from `start`, NDVI rounded to 4 places and the positions of
+# anomalous points, with the history decimated to about max_points
+def ndvi_series(ndvi_df, future_df=None, max_points=SERIES_MAX_POINTS):
+    arrays = chart_data(ndvi_df, future_df)
+    key = data_key('series', arrays, max_points)
+    series = chart_cache.get(key)
+    if series is not None:
+        return series
+
+    days, ndvi, anomaly, future_days, future_ndvi, future_anomaly = arrays
+    start = int(days[0]) if len(days) else 0
+
+    def part(days, ndvi, anomaly, shown):
+        return {
+            "t": (days[shown] - start).tolist(),
+            "ndvi": np.round(ndvi[shown], 4).tolist(),
+            "anomaly": np.flatnonzero(anomaly[shown]).tolist(),
+        }
+
+    series = {
+        "start": str(np.datetime64(start, 'D')),
+        **part(days, ndvi, anomaly, downsample(ndvi, max_points, np.flatnonzero(anomaly))),
+        "future": part(future_days, future_ndvi, future_anomaly, np.arange(len(future_days))),
+    }
+    chart_cache.set(key, series)
+    return series
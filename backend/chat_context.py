@@ -0,0 +1,112 @@
+import datetime
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache import TTLCache
+
+# (connect, read) timeouts in seconds for outgoing HTTP calls
+HTTP_TIMEOUT = (
+    float(os.environ.get('CHAT_HTTP_CONNECT_TIMEOUT', 3.05)),
+    float(os.environ.get('CHAT_HTTP_READ_TIMEOUT', 10)),
+)
+# How long fetched context stays fresh, in seconds
+SATELLITE_TTL = float(os.environ.get('CHAT_SATELLITE_TTL', 6 * 3600))
+WEATHER_TTL = float(os.environ.get('CHAT_WEATHER_TTL', 15 * 60))
+# Decimal places lat/lon are rounded to in cache keys (2 places is about 1 km)
+KEY_PRECISION = int(os.environ.get('CHAT_CONTEXT_PRECISION', 2))
+CONTEXT_WORKERS = int(os.environ.get('CHAT_CONTEXT_WORKERS', 8))
+
+# One pooled session for all outgoing HTTP calls, so repeat requests to the
+# same host reuse keep-alive connections. Idempotent GETs are retried on
+# connection errors and gateway failures.
+def make_session(pool_maxsize=16, retries=2):
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=("GET",)),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http_session = make_session()
+
+def location_key(location, precision=KEY_PRECISION):
+    return round(location['lat'], precision), round(location['lon'], precision)
+
+# Satellite and weather context for the chatbot, each held in a TTL cache
+# keyed by rounded lat/lon and date. Misses for the two sources are fetched
+# concurrently, so a cold request costs the slower of the two, and
+# concurrent identical misses share a single fetch.
+#
+# `satellite(location, start_date, end_date)` returns (farm_data, error);
+# error results are not cached. `weather(location)` returns
+# (current, forecast) and raises on failure, in which case `weather_fallback`
+# is used for this request only.
+class ChatContext:
+    def __init__(self, satellite, weather, weather_fallback=None,
+                 satellite_ttl=SATELLITE_TTL, weather_ttl=WEATHER_TTL, workers=CONTEXT_WORKERS):
+        self.satellite = satellite
+        self.weather = weather
+        self.weather_fallback = weather_fallback
+        self.satellite_cache = TTLCache(1024, satellite_ttl)
+        self.weather_cache = TTLCache(1024, weather_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-context')
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    # Cached value for key, or a Future for it (joining an in-flight fetch if there is one)
+    def _lookup(self, cache, key, fetch, cacheable):
+        value = cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._executor.submit(self._fetch, cache, key, fetch, cacheable)
+        return future
+
+    def _fetch(self, cache, key, fetch, cacheable):
+        try:
+            value = fetch()
+            if cacheable(value):
+                cache.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    # (farm_data, error, current_weather, forecast_weather) for a location
+    def fetch(self, location, start_date, end_date):
+        place = location_key(location)
+        today = datetime.date.today().isoformat()
+        satellite = self._lookup(
+            self.satellite_cache, ('satellite',) + place + (str(end_date),),
+            lambda: self.satellite(location, start_date, end_date),
+            lambda result: result[1] is None,
+        )
+        weather = self._lookup(
+            self.weather_cache, ('weather',) + place + (today,),
+            lambda: self.weather(location),
+            lambda result: True,
+        )
+        if isinstance(weather, Future):
+            try:
+                weather = weather.result()
+            except Exception:
+                if self.weather_fallback is None:
+                    raise
+                weather = self.weather_fallback
+        farm_data, error = satellite.result() if isinstance(satellite, Future) else satellite
+        return farm_data, error, weather[0], weather[1]
+
+    def stats(self):
+        return {
+            "satellite": self.satellite_cache.stats(),
+            "weather": self.weather_cache.stats(),
+            "in_flight": len(self._inflight),
+        }
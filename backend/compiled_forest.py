@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import numpy as np
+
+# Array-backed evaluator for the IoT preprocessing pipeline and random
+# forests. compile_models() flattens the imputer/scaler into three vectors
+# and every tree of every model into shared node arrays, so scoring is a
+# fixed number of NumPy gathers over (rows x trees) with no per-tree Python
+# calls and no estimator objects in memory.
+#
+#   python compiled_forest.py compile   # writes models/compiled_models.npz
+#   python compiled_forest.py verify    # parity check against the pickles
+#
+# sklearn's trees compare the scaled feature, cast to float32, against a
+# float64 threshold. Thresholds are stored rounded down to float32, which
+# gives the same decision for every float32 input, so each tree lands on
+# the same leaf; only the order of the per-model averaging differs.
+
+# Rows walked together: (rows x trees) index arrays stay cache-sized
+ROW_CHUNK = 256
+PARITY_RTOL = 1e-9
+PARITY_ATOL = 1e-9
+
+class CompiledForest:
+    def __init__(self, fill, mean, scale, feature, threshold, children, value, roots, model_offsets, depth):
+        self.fill = fill
+        self.mean = mean
+        self.scale = scale
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.model_offsets = model_offsets
+        self.depth = int(depth)
+        self.tree_counts = np.diff(model_offsets).astype(np.float64)
+
+    @property
+    def n_models(self):
+        return len(self.model_offsets) - 1
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.fill, self.mean, self.scale, self.feature, self.threshold,
+                                              self.children, self.value, self.roots, self.model_offsets))
+
+    # Median imputation and standard scaling, as num_pipeline.transform does
+    def transform(self, features):
+        features = np.array(features, dtype=np.float64, ndmin=2)
+        missing = np.isnan(features)
+        if missing.any():
+            features[missing] = np.take(self.fill, np.nonzero(missing)[1])
+        features -= self.mean
+        features /= self.scale
+        return features
+
+    # (rows, models) predictions for already-transformed features
+    def predict_transformed(self, processed):
+        processed = np.asarray(processed, dtype=np.float32)
+        out = np.empty((len(processed), self.n_models), dtype=np.float64)
+        for start in range(0, len(processed), ROW_CHUNK):
+            chunk = processed[start:start + ROW_CHUNK]
+            leaves = self._leaf_values(chunk)
+            out[start:start + len(chunk)] = np.add.reduceat(leaves, self.model_offsets[:-1], axis=1) / self.tree_counts
+        return out
+
+    def predict(self, features):
+        return self.predict_transformed(self.transform(features))
+
+    # Walk every tree for every row in lockstep. Leaves point back at
+    # themselves, so rows that reach a leaf early just stay there. All the
+    # per-level arrays are preallocated and filled in place.
+    def _leaf_values(self, x):
+        flat = x.ravel()
+        row_offsets = (np.arange(len(x), dtype=np.int32) * x.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (len(x), len(self.roots))).copy()
+        index = np.empty(node.shape, dtype=np.int32)
+        values = np.empty(node.shape, dtype=np.float32)
+        thresholds = np.empty(node.shape, dtype=np.float32)
+        go_right = np.empty(node.shape, dtype=bool)
+        for _ in range(self.depth):
+            np.take(self.feature, node, out=index)
+            index += row_offsets
+            np.take(flat, index, out=values)
+            np.take(self.threshold, node, out=thresholds)
+            np.greater(values, thresholds, out=go_right)
+            node *= 2
+            node += go_right
+            np.take(self.children, node, out=node)
+        return self.value[node]
+
+    def save(self, path, fingerprint=""):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, fill=self.fill, mean=self.mean, scale=self.scale, feature=self.feature,
+                 threshold=self.threshold, children=self.children, value=self.value, roots=self.roots,
+                 model_offsets=self.model_offsets, depth=self.depth, fingerprint=fingerprint)
+        os.replace(tmp, path)
+
+    # The compiled models at `path`, or None if missing or built from other source files
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if fingerprint is not None and str(data['fingerprint']) != fingerprint:
+                return None
+            return cls(**{name: data[name] for name in (
+                'fill', 'mean', 'scale', 'feature', 'threshold', 'children', 'value', 'roots',
+                'model_offsets', 'depth')})
+
+# Identity of the pickled source files, stored with the compiled arrays so
+# a retrained model is never scored with stale ones
+def source_fingerprint(paths):
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+# Largest float32 values <= `values`: for any float32 x, x > t exactly when
+# x > float32_floor(t)
+def float32_floor(values):
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+# Flatten a SimpleImputer + StandardScaler pipeline and a list of
+# single-output forest regressors into one CompiledForest
+def compile_models(pipeline, models):
+    steps = dict(pipeline.steps)
+    imputer, scaler = steps['imputer'], steps['std_scaler']
+    n_features = len(imputer.statistics_)
+
+    features, thresholds, children, values, roots, offsets = [], [], [], [], [], [0]
+    base, depth = 0, 0
+    for model in models:
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            if tree.n_outputs != 1:
+                raise ValueError("Only single-output regressors can be compiled")
+            leaf = tree.children_left == -1
+            own = np.arange(tree.node_count, dtype=np.int32) + base
+            # Leaves test feature 0 and send every row back to themselves
+            features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(float32_floor(np.where(leaf, np.inf, tree.threshold)))
+            left = np.where(leaf, own, tree.children_left + base).astype(np.int32)
+            right = np.where(leaf, own, tree.children_right + base).astype(np.int32)
+            children.append(np.column_stack([left, right]).ravel())
+            values.append(tree.value[:, 0, 0].astype(np.float64))
+            roots.append(base)
+            base += tree.node_count
+            depth = max(depth, tree.max_depth)
+        offsets.append(len(roots))
+
+    if base >= np.iinfo(np.int32).max // 2:
+        raise ValueError("Too many tree nodes to compile")
+    return CompiledForest(
+        fill=np.asarray(imputer.statistics_, dtype=np.float64),
+        mean=np.asarray(scaler.mean_ if scaler.with_mean else np.zeros(n_features), dtype=np.float64),
+        scale=np.asarray(scaler.scale_ if scaler.with_std else np.ones(n_features), dtype=np.float64),
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        children=np.concatenate(children),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=np.int32),
+        model_offsets=np.array(offsets, dtype=np.intp),
+        depth=depth,
+    )
+
+# Largest absolute difference between compiled and sklearn predictions,
+# and whether every prediction is within tolerance
+def parity(compiled, pipeline, models, features):
+    expected = np.column_stack([model.predict(pipeline.transform(features)) for model in models])
+    actual = compiled.predict(features)
+    return float(np.max(np.abs(actual - expected))), bool(np.allclose(actual, expected, rtol=PARITY_RTOL, atol=PARITY_ATOL))
+
+def load_pickles(paths):
+    loaded = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            loaded.append(pickle.load(f))
+    return loaded
+
+# Rows to check parity on: simulated readings, random readings across the
+# simulator's ranges and a few with missing values
+def parity_features(rows, seed=0):
+    import iot
+    simulator = iot.FarmSimulator(n_farms=max(rows // 12, 1), seed=seed)
+    simulated = iot.simulated_features(simulator.run(12))
+    rng = np.random.default_rng(seed)
+    low, high = simulated.min(axis=0), simulated.max(axis=0)
+    spread = (high - low) * 0.25
+    uniform = rng.uniform(low - spread, high + spread, (rows, simulated.shape[1]))
+    uniform[rng.random(uniform.shape) < 0.02] = np.nan
+    return np.vstack([simulated, uniform])
+
+def main():
+    import iot
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['compile', 'verify'])
+    parser.add_argument('--out', default=iot.COMPILED_MODELS_PATH or os.path.join(iot.MODELS_DIR, 'compiled_models.npz'))
+    parser.add_argument('--rows', type=int, default=20000, help="rows to check parity on")
+    args = parser.parse_args()
+
+    sources = [iot.num_pipeline_path, iot.trained_model_1_path, iot.trained_model_2_path]
+    pipeline, *models = load_pickles(sources)
+    features = parity_features(args.rows)
+    if args.command == 'compile':
+        compiled = compile_models(pipeline, models)
+    else:
+        compiled = CompiledForest.load(args.out, source_fingerprint(sources))
+        if compiled is None:
+            sys.exit(f"{args.out} is missing or was compiled from different model files")
+
+    max_error, ok = parity(compiled, pipeline, models, features)
+    print(f"{len(features)} rows, {len(compiled.roots)} trees, {len(compiled.value)} nodes, "
+          f"depth {compiled.depth}, {compiled.nbytes / 1e6:.2f} MB; max |difference| {max_error:.3g}")
+    if not ok:
+        sys.exit("Compiled predictions differ from the pickled models")
+    if args.command == 'compile':
+        compiled.save(args.out, source_fingerprint(sources))
+        print(f"Wrote {args.out}")
+
+if __name__ == '__main__':
+    main()
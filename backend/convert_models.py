@@ -0,0 +1,78 @@
+import argparse
+import os
+
+from cd import MODEL_DIR, MODEL_VARIANTS, allowed_file, decode_image, load_tensorflow
+
+# Offline conversion of a crop disease model into the TFLite variants the
+# execution profiles can select: <crop>.tflite (float32), <crop>.fp16.tflite
+# (float16 weights) and <crop>.int8.tflite (int8 weights and activations,
+# calibrated on sample images; inputs and outputs stay float32).
+#
+#   python convert_models.py --crop rice --source rice.keras --calibration-images samples/rice
+#
+# TFLite files cannot be re-quantized, so the source is the trained Keras
+# model (.keras/.h5) or a SavedModel directory.
+
+CALIBRATION_SAMPLES = 200
+
+def load_converter(source):
+    tf = load_tensorflow()
+    if os.path.isdir(source):
+        return tf.lite.TFLiteConverter.from_saved_model(source), None
+    model = tf.keras.models.load_model(source, compile=False)
+    return tf.lite.TFLiteConverter.from_keras_model(model), tuple(model.input_shape[1:3])
+
+def image_paths(directory, limit):
+    paths = []
+    for root, _, names in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in sorted(names) if allowed_file(name))
+    return sorted(paths)[:limit]
+
+# Calibration inputs, decoded exactly as the API decodes uploads
+def representative_dataset(paths, input_size):
+    def generate():
+        for path in paths:
+            with open(path, 'rb') as f:
+                yield [decode_image(f.read(), input_size)]
+    return generate
+
+def convert(source, variant, input_size=None, calibration=None):
+    tf = load_tensorflow()
+    converter, model_input_size = load_converter(source)
+    if variant == "fp16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        if not calibration:
+            raise ValueError("int8 conversion needs calibration images (--calibration-images)")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(calibration, model_input_size or input_size)
+    return converter.convert()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--crop', required=True)
+    parser.add_argument('--source', required=True, help="Keras model file or SavedModel directory")
+    parser.add_argument('--variants', nargs='+', choices=list(MODEL_VARIANTS), default=list(MODEL_VARIANTS))
+    parser.add_argument('--calibration-images', help="directory of sample images for int8 calibration")
+    parser.add_argument('--calibration-samples', type=int, default=CALIBRATION_SAMPLES)
+    parser.add_argument('--input-size', type=int, nargs=2, default=(224, 224), metavar=('HEIGHT', 'WIDTH'),
+                        help="model input size, for SavedModel sources")
+    parser.add_argument('--out-dir', default=MODEL_DIR)
+    args = parser.parse_args()
+
+    calibration = image_paths(args.calibration_images, args.calibration_samples) if args.calibration_images else None
+    if calibration is not None and not calibration:
+        parser.error(f"No images found in {args.calibration_images}")
+    os.makedirs(args.out_dir, exist_ok=True)
+    for variant in args.variants:
+        model = convert(args.source, variant, tuple(args.input_size), calibration)
+        path = os.path.join(args.out_dir, args.crop.lower() + MODEL_VARIANTS[variant])
+        with open(path + '.tmp', 'wb') as f:
+            f.write(model)
+        # Replaced in one step so the interpreter pool never sees a partial file
+        os.replace(path + '.tmp', path)
+        print(f"{variant:>5}: {path} ({len(model) / 1e6:.2f} MB)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import os
+import threading
+import ee
+from startup import startup_timer
+
+_initialized = False
+_lock = threading.Lock()
+
+# Initialize Earth Engine on first use instead of at import time. The
+# interactive ee.Authenticate() fallback only runs when EE_INTERACTIVE_AUTH=1,
+# so a server without credentials fails the request instead of blocking.
+def ensure_earth_engine():
+    global _initialized
+    if _initialized:
+        return
+    with _lock:
+        if _initialized:
+            return
+        with startup_timer.stage('earth_engine.initialize'):
+            try:
+                ee.Initialize()
+            except Exception as e:
+                if os.environ.get('EE_INTERACTIVE_AUTH') != '1':
+                    raise
+                print(f"Error initializing Earth Engine: {e}")
+                ee.Authenticate()
+                ee.Initialize()
+        _initialized = True
@@ -0,0 +1,18 @@
+import os
+
+# gunicorn -c gunicorn.conf.py main_app:app
+#
+# With preload_app the app (and anything listed in PRELOAD, e.g.
+# PRELOAD=iot,cd,sat,chat) is imported once in the master process, and
+# forked workers share those pages copy-on-write, so recycling a worker
+# costs a fork rather than a fresh import of TensorFlow/sklearn/pandas.
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+
+# TFLite interpreters are built per worker after the fork (CD_WARMUP=1)
+def post_fork(server, worker):
+    if os.environ.get('CD_WARMUP') == '1':
+        from cd import interpreter_pool
+        server.log.info(f"Worker {worker.pid} crop disease warm-up (seconds per crop): {interpreter_pool.warm_up()}")
@@ -0,0 +1,76 @@
+import csv
+import re
+from collections import namedtuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+ParsedMessage = namedtuple("ParsedMessage", ["location", "location_name", "crop", "keywords"])
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+# Phrase lookup over token sequences: each name is indexed under its first
+# token, so matching a message is one pass over its tokens with a dict
+# lookup per token, however many names are loaded. When several names
+# match, the one added first wins (like scanning the original lists in
+# order).
+class Gazetteer:
+    def __init__(self):
+        self._index = {}
+        self._size = 0
+
+    def add(self, name, value):
+        tokens = tuple(tokenize(name))
+        if not tokens:
+            return
+        self._index.setdefault(tokens[0], []).append((tokens, value, self._size))
+        self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    # (name, value) of the highest-priority name occurring in `tokens`, or None
+    def find(self, tokens):
+        best = None
+        for i, token in enumerate(tokens):
+            for phrase, value, rank in self._index.get(token, ()):
+                if tokens[i:i + len(phrase)] == phrase and (best is None or rank < best[2]):
+                    best = (" ".join(phrase), value, rank)
+        return best[:2] if best else None
+
+# Extracts location, crop and intent keywords from a chat message in a
+# single tokenization. Keywords also match words they start ("pests",
+# "rainfall", "farming"), as the substring checks they replace did.
+class MessageParser:
+    def __init__(self, locations, crops, keywords):
+        self.locations = Gazetteer()
+        for name, coords in locations.items():
+            self.locations.add(name, coords)
+        self.crops = Gazetteer()
+        for crop in crops:
+            self.crops.add(crop, crop)
+        self.keywords = frozenset(keywords)
+        self._keyword_lengths = sorted({len(keyword) for keyword in self.keywords})
+
+    def parse(self, message):
+        tokens = tuple(tokenize(message))
+        location = self.locations.find(tokens)
+        crop = self.crops.find(tokens)
+        keywords = set()
+        for token in tokens:
+            for length in self._keyword_lengths:
+                if length > len(token):
+                    break
+                if token[:length] in self.keywords:
+                    keywords.add(token[:length])
+        return ParsedMessage(
+            location=location[1] if location else None,
+            location_name=location[0] if location else None,
+            crop=crop[1] if crop else None,
+            keywords=keywords,
+        )
+
+# Extra place names from a CSV with name, lat and lon columns
+def load_locations(path):
+    with open(path, newline='') as f:
+        return {row['name'].strip().lower(): (float(row['lat']), float(row['lon'])) for row in csv.DictReader(f)}
@@ -2,96 +2,312 @@ import numpy as np
 from datetime import datetime
 import pickle
 import os
+import threading
+import time
+from startup import startup_timer
+from metrics import timed
+from compiled_forest import CompiledForest, source_fingerprint
+from iot_store import DAY, INTERVALS, ReadingStore, parse_time
 
-# Initial state variables (starting from 2004)
-current_year = 2004
-current_month = 1
+# Initial state (simulated farms start from January 2004)
+START_YEAR = 2004
+START_MONTH = 1
 
 # Climate change factors (gradual warming, shifting rainfall)
 temp_increase_per_year = 0.02  # Small temperature increase each year
 rainfall_variability = 0.97  # Slight decrease in rainfall over years
 
-# Load the pipeline and models
-num_pipeline_path = os.path.join('models', 'num_pipeline.pkl')
-trained_model_1_path = os.path.join('models', 'trained_model_1.pkl')
-trained_model_2_path = os.path.join('models', 'trained_model_2.pkl')
+# Feature order expected by the pipeline and both models
+FEATURE_COLUMNS = [
+    "Year",
+    "Month",
+    "Temperature_C",
+    "Rainfall_mm",
+    "Humidity_pct",
+    "Soil_Moisture_pct",
+    "NDVI_Mean",
+    "Soil_pH",
+    "Soil_EC_dS_m",
+]
 
-# Load the pipeline and models
-with open(num_pipeline_path, 'rb') as f:
-    pipeline = pickle.load(f)
+# Pipeline and model files (next to this module, not the working directory)
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+num_pipeline_path = os.path.join(MODELS_DIR, 'num_pipeline.pkl')
+trained_model_1_path = os.path.join(MODELS_DIR, 'trained_model_1.pkl')
+trained_model_2_path = os.path.join(MODELS_DIR, 'trained_model_2.pkl')
+# Array-backed pipeline + forests built by `python compiled_forest.py compile`.
+# Used instead of the pickles when present and built from the same files;
+# set IOT_COMPILED_MODELS to an empty string to always use the pickles.
+COMPILED_MODELS_PATH = os.environ.get('IOT_COMPILED_MODELS', os.path.join(MODELS_DIR, 'compiled_models.npz'))
+# The compiled forests win on small batches (one API reading: ~30x); sklearn's
+# native tree walk is faster for bulk scoring, so larger batches load and
+# use the pickles
+COMPILED_MAX_ROWS = int(os.environ.get('IOT_COMPILED_MAX_ROWS', 256))
+# Batches of at least IOT_LOCALITY_MIN_ROWS are scored in locality order:
+# rows sorted by a Z-order code over the features the forests rely on most,
+# so consecutive rows take similar paths through each tree and the tree
+# walk mispredicts far fewer branches (~30% faster at 100k rows).
+# Predictions come back in the original row order.
+LOCALITY_MIN_ROWS = int(os.environ.get('IOT_LOCALITY_MIN_ROWS', 4096))
+LOCALITY_FEATURES = 4
+LOCALITY_BITS = 8
 
-with open(trained_model_1_path, 'rb') as f:
-    water_model = pickle.load(f)
+# Prediction columns added to each reading
+PREDICTION_COLUMNS = ["Water_Needed_liters_ha_day", "Fertilizer_Needed_kg_ha"]
 
-with open(trained_model_2_path, 'rb') as f:
-    fertilizer_model = pickle.load(f)
+# Local history of /api/iot-data readings (see iot_store.py); set
+# IOT_STORE_DIR to an empty string to keep no history
+IOT_STORE_DIR = os.environ.get('IOT_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'iot_history'))
+# Farm id the simulated readings are stored under
+IOT_FARM_ID = os.environ.get('IOT_FARM_ID', 'default')
+# Most raw readings one /api/iot-history response returns
+HISTORY_MAX_ROWS = int(os.environ.get('IOT_HISTORY_MAX_ROWS', 10000))
+reading_store = ReadingStore(IOT_STORE_DIR, FEATURE_COLUMNS + PREDICTION_COLUMNS) if IOT_STORE_DIR else None
 
-# Function to simulate realistic IoT sensor data
-def generate_sensor_data():
-    global current_year, current_month
+# Loaded on first use: compiled_models by load_models(), the pickled
+# pipeline and models by load_sklearn_models()
+compiled_models = None
+_compiled_checked = False
+pipeline = None
+water_model = None
+fertilizer_model = None
+locality_features = None
+_models_lock = threading.Lock()
+
+# Load the models once, on first prediction (or preload): the compiled
+# models if they are current, otherwise the pickles
+def load_models():
+    global compiled_models, _compiled_checked
+    if not _compiled_checked:
+        with _models_lock:
+            if not _compiled_checked:
+                if COMPILED_MODELS_PATH:
+                    with startup_timer.stage('iot.compiled_models'):
+                        compiled_models = CompiledForest.load(COMPILED_MODELS_PATH, source_fingerprint(
+                            [num_pipeline_path, trained_model_1_path, trained_model_2_path]))
+                _compiled_checked = True
+    if compiled_models is None:
+        load_sklearn_models()
+
+# Load the pickled pipeline and models once
+def load_sklearn_models():
+    global pipeline, water_model, fertilizer_model, locality_features
+    if fertilizer_model is not None:
+        return
+    with _models_lock:
+        if fertilizer_model is not None:
+            return
+        with startup_timer.stage('iot.models'):
+            with open(num_pipeline_path, 'rb') as f:
+                loaded_pipeline = pickle.load(f)
+
+            with open(trained_model_1_path, 'rb') as f:
+                loaded_water_model = pickle.load(f)
+
+            with open(trained_model_2_path, 'rb') as f:
+                loaded_fertilizer_model = pickle.load(f)
+
+        # Importance weighted by tree count, which is what the walk costs
+        importance = sum(model.feature_importances_ * len(model.estimators_)
+                         for model in (loaded_water_model, loaded_fertilizer_model))
+        locality_features = np.argsort(-importance)[:LOCALITY_FEATURES]
+        pipeline, water_model = loaded_pipeline, loaded_water_model
+        fertilizer_model = loaded_fertilizer_model
+
+# Row order that groups similar readings: a Z-order (Morton) code over the
+# locality features of scaled readings, quantized across +/-4 std
+def locality_order(processed):
+    levels = 1 << LOCALITY_BITS
+    cells = [np.clip((processed[:, feature] + 4) * (levels / 8), 0, levels - 1).astype(np.uint64)
+             for feature in locality_features]
+    code = np.zeros(len(processed), dtype=np.uint64)
+    for bit in range(LOCALITY_BITS - 1, -1, -1):
+        for cell in cells:
+            code <<= np.uint64(1)
+            code |= (cell >> np.uint64(bit)) & np.uint64(1)
+    return np.argsort(code, kind='stable')
+
+# Vectorized simulator for a fleet of virtual farms. Each farm's calendar
+# (year/month) lives in an array, so one call generates readings for every
+# farm, or for every farm over many months, from a single seeded Generator.
+# The same seed, fleet size and call sequence always give the same readings.
+class FarmSimulator:
+    def __init__(self, n_farms=1, seed=None, start_year=START_YEAR, start_month=START_MONTH):
+        self.n_farms = n_farms
+        self.year = np.full(n_farms, start_year, dtype=np.int64)
+        self.month = np.full(n_farms, start_month, dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    # Draw one reading per entry of `year` (any shape)
+    def _sample(self, year):
+        rng = self.rng
+        years_elapsed = year - START_YEAR
+
+        # Generate climate-related variables with trends
+        temperature = rng.normal(20 + years_elapsed * temp_increase_per_year, 3)  # Slight warming
+        rainfall = rng.normal(100 * (rainfall_variability ** years_elapsed), 30)  # Decreasing rainfall
+        humidity = rng.normal(60, 10, size=year.shape)  # Humidity around 60%
+        soil_moisture = np.clip(rng.normal(50 + 0.3 * rainfall - 0.1 * temperature, 10), 10, 90)
+        ndvi = np.clip(rng.normal(0.4 + 0.005 * soil_moisture - 0.002 * temperature, 0.1), 0, 1)
+
+        # Soil pH (more neutral when moisture is high, acidic when rainfall is excessive)
+        soil_pH = np.clip(rng.normal(6.5 - 0.02 * rainfall + 0.01 * soil_moisture, 0.2), 5.5, 7.5)
 
-    # Generate climate-related variables with trends
-    temperature = np.random.normal(20 + (current_year - 2004) * temp_increase_per_year, 3)  # Slight warming
-    rainfall = np.random.normal(100 * (rainfall_variability ** (current_year - 2004)), 30)  # Decreasing rainfall
-    humidity = np.random.normal(60, 10)  # Humidity around 60%
-    soil_moisture = np.clip(np.random.normal(50 + 0.3 * rainfall - 0.1 * temperature, 10), 10, 90)
-    ndvi = np.clip(np.random.normal(0.4 + 0.005 * soil_moisture - 0.002 * temperature, 0.1), 0, 1)
+        # Soil Electrical Conductivity (EC) - Higher in dry conditions due to salt accumulation
+        soil_EC = np.clip(rng.normal(0.5 + 0.01 * temperature - 0.02 * soil_moisture, 0.1), 0.1, 1.5)
 
-    # Soil pH (more neutral when moisture is high, acidic when rainfall is excessive)
-    soil_pH = np.clip(np.random.normal(6.5 - 0.02 * rainfall + 0.01 * soil_moisture, 0.2), 5.5, 7.5)
+        return {
+            "Temperature_C": temperature,
+            "Rainfall_mm": rainfall,
+            "Humidity_pct": humidity,
+            "Soil_Moisture_pct": soil_moisture,
+            "NDVI_Mean": ndvi,
+            "Soil_pH": soil_pH,
+            "Soil_EC_dS_m": soil_EC,
+        }
 
-    # Soil Electrical Conductivity (EC) - Higher in dry conditions due to salt accumulation
-    soil_EC = np.clip(np.random.normal(0.5 + 0.01 * temperature - 0.02 * soil_moisture, 0.1), 0.1, 1.5)
+    # Generate `months` consecutive readings for every farm.
+    # Returns a dict of (months, n_farms) arrays keyed like FEATURE_COLUMNS.
+    # Readings are drawn with the climate of the month being left and
+    # stamped with the month the farm advances to.
+    def run(self, months=1):
+        with self._lock:
+            elapsed = (self.month - 1)[np.newaxis, :] + np.arange(months)[:, np.newaxis]
+            sample_year = self.year[np.newaxis, :] + elapsed // 12
+            readings = self._sample(sample_year)
+            elapsed += 1
+            year = self.year[np.newaxis, :] + elapsed // 12
+            month = elapsed % 12 + 1
+            self.year, self.month = year[-1].copy(), month[-1].copy()
+        readings["Year"] = year
+        readings["Month"] = month
+        return readings
 
-    # Increment month and year
-    current_month += 1
-    if current_month > 12:
-        current_month = 1
-        current_year += 1
+    # Advance every farm by one month; returns a dict of (n_farms,) arrays
+    def step(self):
+        return {column: values[0] for column, values in self.run(1).items()}
+
+# Stack simulator output into an (n, 9) feature array for score_readings
+def simulated_features(readings):
+    return np.stack([np.asarray(readings[column], dtype=np.float64) for column in FEATURE_COLUMNS], axis=-1).reshape(-1, len(FEATURE_COLUMNS))
+
+# Single virtual farm behind /api/iot-data
+default_simulator = FarmSimulator(n_farms=1)
+
+# Function to simulate realistic IoT sensor data
+def generate_sensor_data():
+    readings = default_simulator.step()
 
     # Add timestamp
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     # Return simulated data
     return {
-        "Year": current_year,
-        "Month": current_month,
-        "Temperature_C": round(float(temperature), 2),
-        "Rainfall_mm": round(float(rainfall), 2),
-        "Humidity_pct": round(float(humidity), 2),
-        "Soil_Moisture_pct": round(float(soil_moisture), 2),
-        "NDVI_Mean": round(float(ndvi), 4),
-        "Soil_pH": round(float(soil_pH), 2),
-        "Soil_EC_dS_m": round(float(soil_EC), 2),
+        "Year": int(readings["Year"][0]),
+        "Month": int(readings["Month"][0]),
+        "Temperature_C": round(float(readings["Temperature_C"][0]), 2),
+        "Rainfall_mm": round(float(readings["Rainfall_mm"][0]), 2),
+        "Humidity_pct": round(float(readings["Humidity_pct"][0]), 2),
+        "Soil_Moisture_pct": round(float(readings["Soil_Moisture_pct"][0]), 2),
+        "NDVI_Mean": round(float(readings["NDVI_Mean"][0]), 4),
+        "Soil_pH": round(float(readings["Soil_pH"][0]), 2),
+        "Soil_EC_dS_m": round(float(readings["Soil_EC_dS_m"][0]), 2),
         "Timestamp": timestamp
     }
 
+# Predict water and fertilizer needs for an (n, 9) array of readings.
+# The pipeline runs once and both models read the same contiguous array
+# (with compiled models, both forests are walked in the same pass).
+def predict_requirements(features):
+    load_models()
+    features = np.ascontiguousarray(features, dtype=np.float64)
+    if features.ndim == 1:
+        features = features.reshape(1, -1)
+    if compiled_models is not None and len(features) <= COMPILED_MAX_ROWS:
+        with timed('iot', 'transform'):
+            processed_data = compiled_models.transform(features)
+        with timed('iot', 'predict'):
+            predictions = compiled_models.predict_transformed(processed_data)
+        return predictions[:, 0], predictions[:, 1]
+    load_sklearn_models()
+    with timed('iot', 'transform'):
+        # float32 is what the trees compare; converting once saves a copy per model
+        processed_data = np.ascontiguousarray(pipeline.transform(features), dtype=np.float32)
+    with timed('iot', 'predict'):
+        if len(processed_data) < LOCALITY_MIN_ROWS:
+            return water_model.predict(processed_data), fertilizer_model.predict(processed_data)
+        order = locality_order(processed_data)
+        processed_data = processed_data[order]
+        water_needed, fertilizer_needed = np.empty(len(order)), np.empty(len(order))
+        water_needed[order] = water_model.predict(processed_data)
+        fertilizer_needed[order] = fertilizer_model.predict(processed_data)
+        return water_needed, fertilizer_needed
+
+# Build the feature array from reading dicts (or pass an (n, 9) array through)
+def readings_to_features(readings):
+    if isinstance(readings, np.ndarray):
+        return readings
+    return np.array([[reading[column] for column in FEATURE_COLUMNS] for reading in readings], dtype=np.float64)
+
+# Bulk API: score many sensor readings in one vectorized call
+def score_readings(readings):
+    water_needed, fertilizer_needed = predict_requirements(readings_to_features(readings))
+    return np.round(water_needed, 2), np.round(fertilizer_needed, 2)
+
 # Function to get IoT data with predictions
 def get_iot_data():
     sensor_data = generate_sensor_data()
 
-    # Prepare data for prediction
-    input_data = [
-        sensor_data["Year"],
-        sensor_data["Month"],
-        sensor_data["Temperature_C"],
-        sensor_data["Rainfall_mm"],
-        sensor_data["Humidity_pct"],
-        sensor_data["Soil_Moisture_pct"],
-        sensor_data["NDVI_Mean"],
-        sensor_data["Soil_pH"],
-        sensor_data["Soil_EC_dS_m"]
-    ]
-
-    # Preprocess data using the pipeline
-    processed_data = pipeline.transform([input_data])
-
     # Predict water and fertilizer requirements
-    water_needed = round(water_model.predict(processed_data)[0], 2)
-    fertilizer_needed = round(fertilizer_model.predict(processed_data)[0], 2)
+    water_needed, fertilizer_needed = score_readings([sensor_data])
 
     # Add predictions to the response
-    sensor_data["Water_Needed_liters_ha_day"] = water_needed
-    sensor_data["Fertilizer_Needed_kg_ha"] = fertilizer_needed
+    sensor_data["Water_Needed_liters_ha_day"] = float(water_needed[0])
+    sensor_data["Fertilizer_Needed_kg_ha"] = float(fertilizer_needed[0])
+
+    if reading_store is not None:
+        reading_store.append_reading(IOT_FARM_ID, sensor_data, int(time.time()))
+
+    return sensor_data
+
+# Stored values as JSON-ready lists, with missing values as null
+def json_values(values):
+    return [None if value != value else value for value in np.round(np.asarray(values, dtype=np.float64), 4).tolist()]
 
-    return sensor_data
\ No newline at end of file
+# Stored readings for /api/iot-history. `params` is the query string:
+#   farm      farm id (default IOT_FARM_ID)
+#   start/end epoch seconds or ISO 8601 (default: the last 24 hours)
+#   interval  "raw" (default), "hour" or "day"
+#   columns   comma-separated column names (default: all)
+#   limit     raw readings to return, newest first (at most HISTORY_MAX_ROWS)
+def iot_history(params):
+    if reading_store is None:
+        raise ValueError("Reading history is disabled (IOT_STORE_DIR is empty).")
+    farm = params.get('farm') or IOT_FARM_ID
+    # end is exclusive, so the default includes readings from this second
+    end = parse_time(params['end']) if params.get('end') else int(time.time()) + 1
+    start = parse_time(params['start']) if params.get('start') else end - DAY
+    interval = params.get('interval') or 'raw'
+    if interval != 'raw' and interval not in INTERVALS:
+        raise ValueError(f"interval must be one of raw, {', '.join(INTERVALS)}.")
+    columns = [name.strip() for name in (params.get('columns') or '').split(',') if name.strip()]
+    if interval == 'raw':
+        try:
+            limit = int(params.get('limit') or HISTORY_MAX_ROWS)
+        except ValueError:
+            raise ValueError("limit must be an integer.")
+        if limit < 1:
+            raise ValueError("limit must be at least 1.")
+        limit = min(limit, HISTORY_MAX_ROWS)
+        times, values, truncated = reading_store.query(farm, start, end, columns, limit)
+        return {
+            "farm": farm, "interval": interval, "start": start, "end": end, "time": times.tolist(),
+            "values": {name: json_values(column) for name, column in values.items()}, "truncated": truncated,
+        }
+    summary = reading_store.aggregate(farm, start, end, interval, columns)
+    result = {"farm": farm, "interval": interval, "start": start, "end": end, "time": summary["time"].tolist(),
+              "count": {name: column.tolist() for name, column in summary["count"].items()}}
+    for statistic in ("mean", "min", "max"):
+        result[statistic] = {name: json_values(column) for name, column in summary[statistic].items()}
+    return result
\ No newline at end of file
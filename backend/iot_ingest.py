@@ -0,0 +1,256 @@
+import io
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import iot
+from iot_store import validate_farm
+from metrics import registry, timed
+
+# Bulk ingestion of gateway readings for /api/iot-ingest. A batch arrives as
+# newline-delimited JSON, CSV (header row of column names) or an .npz
+# archive of NumPy columns (np.savez, one 1-D array per column), is parsed
+# straight into columns, validated with NumPy range masks, scored through
+# both models in one pass and optionally appended to the reading store.
+#
+# Every reading needs a "time" (or "Timestamp") column: epoch seconds or
+# ISO 8601 (UTC unless an offset is given). Year and Month default to the
+# reading's time; missing sensor values are imputed by the pipeline like
+# any other missing value. Rows with an unparseable or out-of-range value
+# are rejected and reported, and the rest of the batch is still accepted.
+# Readings from years the models weren't trained on are stored as they are
+# and scored with Year clamped to the training years.
+
+INGEST_MAX_ROWS = int(os.environ.get('IOT_INGEST_MAX_ROWS', 500000))
+INGEST_MAX_BYTES = int(os.environ.get('IOT_INGEST_MAX_BYTES', 64 * 1024 * 1024))
+# Readings stamped further ahead than this are rejected as clock errors
+INGEST_MAX_FUTURE_SECONDS = int(os.environ.get('IOT_INGEST_MAX_FUTURE_SECONDS', 86400))
+# Rejected rows listed individually in a response
+INGEST_MAX_REJECTIONS = 100
+# Years covered by the models' training data (the forests' Year splits run
+# from 2004.5 to 2022.5); other years are scored as the nearest of them
+TRAINED_YEARS = (int(os.environ.get('IOT_INGEST_MIN_YEAR', 2004)), int(os.environ.get('IOT_INGEST_MAX_YEAR', 2023)))
+
+# Accepted (inclusive) range of each feature
+VALID_RANGES = {
+    # Reading times start at 1970; anything past 2100 is a typo or a clock fault
+    "Year": (1970, 2100),
+    "Month": (1, 12),
+    "Temperature_C": (-50, 60),
+    "Rainfall_mm": (0, 2000),
+    "Humidity_pct": (0, 100),
+    "Soil_Moisture_pct": (0, 100),
+    "NDVI_Mean": (-1, 1),
+    "Soil_pH": (0, 14),
+    "Soil_EC_dS_m": (0, 50),
+}
+SENSOR_COLUMNS = [column for column in iot.FEATURE_COLUMNS if column not in ("Year", "Month")]
+TIME_COLUMNS = ("time", "Timestamp")
+
+CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/jsonlines": "ndjson",
+    "text/csv": "csv",
+    "application/x-npz": "npz",
+    "application/octet-stream": "npz",
+}
+
+ingested_readings = registry.counter(
+    "iot_ingested_readings_total", "Readings received by /api/iot-ingest, by outcome.", ("outcome",))
+
+# Newline-delimited JSON objects, parsed as one JSON array
+def parse_ndjson(body):
+    lines = [line for line in body.split(b'\n') if line.strip()]
+    try:
+        rows = json.loads(b'[' + b','.join(lines) + b']')
+    except ValueError:
+        for number, line in enumerate(lines, 1):
+            try:
+                json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Line {number} is not valid JSON: {e}")
+        raise
+    if not all(isinstance(row, dict) for row in rows):
+        raise ValueError("Every line must be a JSON object.")
+    names = set().union(*rows) if rows else set()
+    return {name: [row.get(name) for row in rows] for name in names}, len(rows)
+
+def parse_csv(body):
+    try:
+        frame = pd.read_csv(io.BytesIO(body), skipinitialspace=True)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+        raise ValueError(f"Invalid CSV: {e}")
+    return {str(name).strip(): frame[name].to_numpy() for name in frame.columns}, len(frame)
+
+# np.savez archive of equal-length 1-D columns; pickled objects are refused
+def parse_npz(body):
+    try:
+        with np.load(io.BytesIO(body), allow_pickle=False) as archive:
+            columns = {name: archive[name] for name in archive.files}
+    except Exception as e:
+        raise ValueError(f"Invalid .npz payload: {e}")
+    lengths = {len(values) if values.ndim == 1 else -1 for values in columns.values()}
+    if len(lengths) > 1 or -1 in lengths:
+        raise ValueError("Every .npz column must be a 1-D array of the same length.")
+    return columns, lengths.pop() if lengths else 0
+
+PARSERS = {"ndjson": parse_ndjson, "csv": parse_csv, "npz": parse_npz}
+
+# Column encoder for gateways and benchmarks: {name: 1-D array} -> .npz bytes
+def encode_npz(columns):
+    buffer = io.BytesIO()
+    np.savez(buffer, **{name: np.asarray(values) for name, values in columns.items()})
+    return buffer.getvalue()
+
+def ingest_format(content_type, requested=None):
+    if requested:
+        if requested not in PARSERS:
+            raise ValueError(f"format must be one of {', '.join(PARSERS)}.")
+        return requested
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    if media_type not in CONTENT_TYPES:
+        raise ValueError("Send application/x-ndjson, text/csv or application/x-npz, or pass format=ndjson|csv|npz.")
+    return CONTENT_TYPES[media_type]
+
+# Float values of a column and a mask of entries that are present but not
+# numbers. None, NaN and empty strings are missing, not invalid.
+def numeric_column(values):
+    try:
+        return np.asarray(values, dtype=np.float64), None
+    except (TypeError, ValueError):
+        series = pd.Series(np.asarray(values, dtype=object))
+        numbers = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+        missing = (series.isna() | (series.astype(str).str.strip() == '')).to_numpy()
+        return numbers, np.isnan(numbers) & ~missing
+
+# Epoch seconds of each reading time and a mask of times that are
+# unparseable, before 1970 or after `latest`. The bounds are checked on the
+# float values, before the cast to int64 could overflow.
+def parse_times(values, latest):
+    numbers = numeric_column(values)[0].copy()
+    text = np.isnan(numbers)
+    if text.any():
+        parsed = pd.to_datetime(pd.Series(np.asarray(values, dtype=object)[text]), utc=True,
+                                errors='coerce', format='ISO8601')
+        numbers[text] = (parsed - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        invalid = ~np.isfinite(numbers) | (numbers < 0) | (numbers > latest)
+    return np.where(invalid, 0, numbers).astype(np.int64), invalid
+
+# Validate parsed columns. Returns the epoch-second times and (n, 9)
+# features of accepted rows, their row numbers and a mask of rejected rows
+# per reason.
+def validate_readings(columns, n, now=None):
+    time_columns = [name for name in TIME_COLUMNS if name in columns]
+    if not time_columns:
+        raise ValueError("Readings need a 'time' column (epoch seconds or ISO 8601).")
+    if not any(name in columns for name in SENSOR_COLUMNS):
+        raise ValueError(f"Readings have none of the sensor columns: {', '.join(SENSOR_COLUMNS)}.")
+    now = time.time() if now is None else now
+
+    rejected = {}
+    latest = now + INGEST_MAX_FUTURE_SECONDS
+    times, rejected["time"] = parse_times(columns[time_columns[0]], latest)
+    # Rows may use either time column name
+    for name in time_columns[1:]:
+        other, other_invalid = parse_times(columns[name], latest)
+        times = np.where(rejected["time"], other, times)
+        rejected["time"] &= other_invalid
+    months = times.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    # Rows without a valid time are already rejected; leave their calendar unset
+    calendar = {"Year": np.where(rejected["time"], np.nan, months // 12 + 1970),
+                "Month": np.where(rejected["time"], np.nan, months % 12 + 1)}
+
+    features = np.empty((n, len(iot.FEATURE_COLUMNS)), dtype=np.float64)
+    for i, name in enumerate(iot.FEATURE_COLUMNS):
+        not_numeric = None
+        if name in columns:
+            values, not_numeric = numeric_column(columns[name])
+        else:
+            values = np.full(n, np.nan)
+        if name in calendar:
+            values = np.where(np.isnan(values), calendar[name], values)
+        low, high = VALID_RANGES[name]
+        # NaN compares false on both sides, so missing values pass
+        bad = (values < low) | (values > high)
+        if not_numeric is not None:
+            bad |= not_numeric
+        if bad.any():
+            rejected[name] = bad
+        features[:, i] = values
+    sensors = [iot.FEATURE_COLUMNS.index(name) for name in SENSOR_COLUMNS]
+    rejected["no_sensor_values"] = np.isnan(features[:, sensors]).all(axis=1)
+
+    rejected = {reason: mask for reason, mask in rejected.items() if mask.any()}
+    accepted = ~np.logical_or.reduce(list(rejected.values())) if rejected else np.ones(n, dtype=bool)
+    rows = np.flatnonzero(accepted)
+    return times[rows], features[rows], rows, rejected
+
+def flag(value, default):
+    if value is None or value == '':
+        return default
+    return str(value).lower() in ('1', 'true', 'yes')
+
+# Ingest one uploaded batch. `params` is the query string:
+#   format   ndjson, csv or npz (default: from the Content-Type)
+#   farm     farm id to store the readings under (default IOT_FARM_ID)
+#   store    append accepted readings and predictions to the reading store
+#            (default: on when the store is enabled)
+#   results  return per-row predictions (default: on)
+def ingest_readings(body, content_type=None, params=None):
+    params = params or {}
+    if len(body) > INGEST_MAX_BYTES:
+        raise ValueError(f"Payload is larger than {INGEST_MAX_BYTES} bytes.")
+    source = ingest_format(content_type, params.get('format'))
+    farm = validate_farm(params.get('farm') or iot.IOT_FARM_ID)
+    store = flag(params.get('store'), iot.reading_store is not None)
+    if store and iot.reading_store is None:
+        raise ValueError("Reading history is disabled (IOT_STORE_DIR is empty).")
+
+    with timed('iot_ingest', 'parse'):
+        columns, n = PARSERS[source](body)
+    if n > INGEST_MAX_ROWS:
+        raise ValueError(f"At most {INGEST_MAX_ROWS} readings per request.")
+    with timed('iot_ingest', 'validate'):
+        times, features, rows, rejected = validate_readings(columns, n)
+    year = features[:, iot.FEATURE_COLUMNS.index("Year")]
+    extrapolated = (year < TRAINED_YEARS[0]) | (year > TRAINED_YEARS[1])
+    if len(rows):
+        model_input = features.copy()
+        model_input[:, iot.FEATURE_COLUMNS.index("Year")] = np.clip(year, *TRAINED_YEARS)
+        water_needed, fertilizer_needed = iot.score_readings(model_input)
+    else:
+        water_needed, fertilizer_needed = np.empty(0), np.empty(0)
+    if store and len(rows):
+        with timed('iot_ingest', 'store'):
+            values = {name: features[:, i] for i, name in enumerate(iot.FEATURE_COLUMNS)}
+            values.update(zip(iot.PREDICTION_COLUMNS, (water_needed, fertilizer_needed)))
+            iot.reading_store.append(farm, times, values)
+    ingested_readings.inc("accepted", amount=len(rows))
+    ingested_readings.inc("rejected", amount=n - len(rows))
+
+    response = {
+        "farm": farm,
+        "format": source,
+        "received": n,
+        "accepted": len(rows),
+        "rejected": n - len(rows),
+        "stored": len(rows) if store else 0,
+        # Accepted rows scored with Year clamped to TRAINED_YEARS
+        "extrapolated": int(extrapolated.sum()),
+        "rejected_by_reason": {reason: int(mask.sum()) for reason, mask in rejected.items()},
+        "rejections": [
+            {"row": int(row), "reasons": [reason for reason, mask in rejected.items() if mask[row]]}
+            for row in np.flatnonzero(np.logical_or.reduce(list(rejected.values())))[:INGEST_MAX_REJECTIONS]
+        ] if rejected else [],
+    }
+    if flag(params.get('results'), True):
+        response["results"] = {
+            "row": rows.tolist(),
+            iot.PREDICTION_COLUMNS[0]: water_needed.tolist(),
+            iot.PREDICTION_COLUMNS[1]: fertilizer_needed.tolist(),
+            "extrapolated": extrapolated.tolist(),
+        }
+    return response
@@ -0,0 +1,363 @@
+import datetime
+import fcntl
+import json
+import math
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+from metrics import timed
+
+# Append-only columnar store for IoT readings, partitioned by farm and by
+# calendar month (UTC):
+#
+#   <root>/<farm>/<YYYY-MM>/time.i8       int64 epoch seconds, ascending
+#   <root>/<farm>/<YYYY-MM>/<column>.f4   float32 values, one file per column
+#   <root>/<farm>/<YYYY-MM>/meta.json     column names and sort state
+#   <root>/<farm>/<YYYY-MM>/hourly.npz    hourly count/sum/min/max rollup
+#   <root>/<farm>/<YYYY-MM>.lock          flock held while using the segment
+#
+# Every append, read and compaction holds the segment's lock file, so
+# gunicorn workers (or any other processes) sharing the store see whole
+# appends and the current sort state.
+# Appends write the value columns first and the time column last, so the
+# row count (size of time.i8 / 8) only ever covers complete rows. A range
+# query binary-searches the memory-mapped time column of each month it
+# touches and reads just the matching slice of each column. Aggregates are
+# built from the hourly rollups, which are extended incrementally as rows
+# arrive, so an hourly or daily summary of a year reads ~9k rollup rows
+# instead of ~500k readings.
+
+HOUR = 3600
+DAY = 86400
+INTERVALS = {"hour": HOUR, "day": DAY}
+FARM_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Segment directories, including one left renamed by an interrupted compaction
+SEGMENT_DIR = re.compile(r'^(\d{4}-\d{2})(\.old)?$')
+# 10000-01-01T00:00:00Z; month keys of later times aren't YYYY-MM
+MAX_TIME = 253402300800
+
+# Epoch seconds from an int/float, a numeric string or an ISO 8601 date or
+# datetime (naive values are UTC), from 1970 to the end of year 9999
+def parse_time(value):
+    try:
+        seconds = float(value if isinstance(value, (int, float, np.integer, np.floating)) else str(value).strip())
+    except OverflowError:
+        seconds = float('inf')
+    except ValueError:
+        text = str(value).strip()
+        try:
+            parsed = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"Invalid time {text!r}: expected epoch seconds or an ISO 8601 date/time.")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        seconds = parsed.timestamp()
+    # Checked before the int cast, which overflows on inf or huge values
+    if not (math.isfinite(seconds) and 0 <= seconds < MAX_TIME):
+        raise ValueError(f"Time {value!r} is out of range: expected 1970 to 9999.")
+    return int(seconds)
+
+def validate_farm(farm):
+    if not FARM_ID.match(str(farm)):
+        raise ValueError("farm must be 1-64 letters, digits, '_' or '-'.")
+    return str(farm)
+
+# Month key ('YYYY-MM') of each epoch-second timestamp
+def month_keys(times):
+    return np.datetime_as_string(np.asarray(times, dtype='datetime64[s]').astype('datetime64[M]'))
+
+# Hourly count/sum/min/max per column for time-sorted rows. Missing (NaN)
+# values are left out of every statistic of their column.
+def rollup(times, values):
+    hours = times // HOUR * HOUR
+    starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+    present = ~np.isnan(values)
+    return {
+        "hour": hours[starts],
+        "count": np.add.reduceat(present, starts, axis=0).astype(np.int64),
+        "sum": np.add.reduceat(np.where(present, values, 0).astype(np.float64), starts, axis=0),
+        "min": np.fmin.reduceat(values, starts, axis=0),
+        "max": np.fmax.reduceat(values, starts, axis=0),
+    }
+
+# Merge rollups of consecutive row ranges; adjacent groups with the same
+# bucket start are combined
+def merge_rollups(parts, width=HOUR):
+    parts = [part for part in parts if len(part["hour"])]
+    if not parts:
+        return None
+    buckets = np.concatenate([part["hour"] for part in parts]) // width * width
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    return {
+        "hour": buckets[starts],
+        "count": np.add.reduceat(np.concatenate([part["count"] for part in parts]), starts, axis=0),
+        "sum": np.add.reduceat(np.concatenate([part["sum"] for part in parts]), starts, axis=0),
+        "min": np.fmin.reduceat(np.concatenate([part["min"] for part in parts]), starts, axis=0),
+        "max": np.fmax.reduceat(np.concatenate([part["max"] for part in parts]), starts, axis=0),
+    }
+
+class Segment:
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.meta = {"columns": list(columns), "sorted": True, "generation": 0}
+
+    # Hold the segment's lock for an append, read or compaction. The sort
+    # state is reloaded under the lock, since another process may have
+    # appended out of order or compacted since we last looked.
+    @contextmanager
+    def locked(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Finish or undo an interrupted compaction
+                if not os.path.isdir(self.path) and os.path.isdir(self.path + '.old'):
+                    os.rename(self.path + '.old', self.path)
+                shutil.rmtree(self.path + '.compact', ignore_errors=True)
+                shutil.rmtree(self.path + '.old', ignore_errors=True)
+                self.meta = self._load_meta()
+                yield self
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _file(self, column):
+        return os.path.join(self.path, 'time.i8' if column is None else column + '.f4')
+
+    def _load_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return {"columns": list(self.columns), "sorted": True, "generation": 0}
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta.setdefault("generation", 0)
+        if meta["columns"] != list(self.columns):
+            raise ValueError(f"{self.path} holds columns {meta['columns']}, expected {list(self.columns)}")
+        return meta
+
+    def _save_meta(self):
+        with open(os.path.join(self.path, 'meta.json.tmp'), 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(os.path.join(self.path, 'meta.json.tmp'), os.path.join(self.path, 'meta.json'))
+
+    @property
+    def rows(self):
+        try:
+            return os.path.getsize(self._file(None)) // 8
+        except FileNotFoundError:
+            return 0
+
+    def times(self):
+        rows = self.rows
+        if not rows:
+            return np.empty(0, np.int64)
+        return np.memmap(self._file(None), dtype=np.int64, mode='r', shape=(rows,))
+
+    def last_time(self):
+        rows = self.rows
+        if not rows:
+            return None
+        with open(self._file(None), 'rb') as f:
+            f.seek((rows - 1) * 8)
+            return int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+    # Rows [start, stop) of the named columns as an (n, len(names)) float32 array
+    def read(self, start, stop, names=None):
+        names = self.columns if names is None else names
+        out = np.empty((stop - start, len(names)), dtype=np.float32)
+        for i, name in enumerate(names):
+            out[:, i] = np.fromfile(self._file(name), dtype=np.float32, count=stop - start, offset=start * 4)
+        return out
+
+    # Append rows: `times` (n,) int64 and `values` (n, columns) float32
+    def append(self, times, values):
+        os.makedirs(self.path, exist_ok=True)
+        rows = self.rows
+        last = self.last_time()
+        if self.meta["sorted"] and ((last is not None and times[0] < last) or np.any(times[1:] < times[:-1])):
+            self.meta["sorted"] = False
+            self._save_meta()
+        elif not os.path.exists(os.path.join(self.path, 'meta.json')):
+            self._save_meta()
+        for i, name in enumerate(self.columns):
+            with open(self._file(name), 'ab') as f:
+                # Drop any values left over from an append that never committed
+                f.truncate(rows * 4)
+                f.write(np.ascontiguousarray(values[:, i]).tobytes())
+        with open(self._file(None), 'ab') as f:
+            f.truncate(rows * 8)
+            f.write(times.tobytes())
+
+    # Rewrite an out-of-order segment sorted by time (with the lock held).
+    # The sorted copy is built next to the segment and swapped in with two
+    # renames; its generation number tells cached rollups it has changed.
+    def compact(self):
+        rows = self.rows
+        times = np.array(self.times())
+        values = self.read(0, rows)
+        order = np.argsort(times, kind='stable')
+        staging = Segment(self.path + '.compact', self.columns)
+        staging.meta["generation"] = self.meta["generation"] + 1
+        staging.append(times[order], values[order])
+        os.rename(self.path, self.path + '.old')
+        os.rename(staging.path, self.path)
+        shutil.rmtree(self.path + '.old')
+        self.meta = self._load_meta()
+
+    # Hourly rollup covering every row (with the lock held). The rollup
+    # records the generation and how many rows it covers; rows appended
+    # since are rolled up and merged on.
+    def hourly(self, cached=None):
+        rows = self.rows
+        generation = self.meta["generation"]
+        if cached is None or int(cached["generation"]) != generation:
+            cached = None
+            rollup_path = os.path.join(self.path, 'hourly.npz')
+            if os.path.exists(rollup_path):
+                with np.load(rollup_path) as data:
+                    if 'generation' in data.files and int(data['generation']) == generation:
+                        cached = {name: data[name] for name in data.files}
+        if cached is not None and int(cached["rows"]) == rows:
+            return cached
+        covered = int(cached["rows"]) if cached is not None and int(cached["rows"]) < rows else 0
+        times = np.asarray(self.times()[covered:])
+        tail = rollup(times, self.read(covered, rows))
+        result = merge_rollups([cached, tail] if covered else [tail])
+        result["rows"] = np.int64(rows)
+        result["generation"] = np.int64(generation)
+        with open(os.path.join(self.path, 'hourly.npz.tmp'), 'wb') as f:
+            np.savez(f, **result)
+        os.replace(os.path.join(self.path, 'hourly.npz.tmp'), os.path.join(self.path, 'hourly.npz'))
+        return result
+
+class ReadingStore:
+    def __init__(self, root, columns):
+        self.root = root
+        self.columns = list(columns)
+        self._segments = {}
+        self._rollups = {}
+        self._lock = threading.RLock()
+
+    def _segment(self, farm, month):
+        key = (farm, month)
+        segment = self._segments.get(key)
+        if segment is None:
+            segment = self._segments[key] = Segment(os.path.join(self.root, farm, month), self.columns)
+        return segment
+
+    # Month segments of `farm` overlapping [start, end), oldest first
+    def _segments_between(self, farm, start, end):
+        farm_dir = os.path.join(self.root, farm)
+        if not os.path.isdir(farm_dir) or end <= start:
+            return []
+        first, last = month_keys([start, end - 1])
+        matches = (SEGMENT_DIR.match(name) for name in os.listdir(farm_dir))
+        months = sorted({match.group(1) for match in matches if match and first <= match.group(1) <= last})
+        return [self._segment(farm, month) for month in months]
+
+    # Lock a segment for reading, compacting it first if an append (from any
+    # process) left it out of order
+    @contextmanager
+    def _reading(self, segment):
+        with segment.locked():
+            if segment.rows and not segment.meta["sorted"]:
+                segment.compact()
+            yield segment
+
+    def farms(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if FARM_ID.match(name))
+
+    # Append readings for one farm. `times` are epoch seconds; `values` maps
+    # column names to arrays (columns not given are stored as NaN).
+    def append(self, farm, times, values):
+        farm = validate_farm(farm)
+        times = np.asarray(times, dtype=np.int64).reshape(-1)
+        if not len(times):
+            return 0
+        table = np.full((len(times), len(self.columns)), np.nan, dtype=np.float32)
+        for i, name in enumerate(self.columns):
+            if name in values:
+                table[:, i] = values[name]
+        months = times.astype('datetime64[s]').astype('datetime64[M]')
+        with timed('iot_store', 'append'), self._lock:
+            if months.min() == months.max():
+                with self._segment(farm, str(months[0])).locked() as segment:
+                    segment.append(times, table)
+            else:
+                for month in np.unique(months):
+                    rows = months == month
+                    with self._segment(farm, str(month)).locked() as segment:
+                        segment.append(times[rows], table[rows])
+        return len(times)
+
+    def append_reading(self, farm, reading, timestamp):
+        return self.append(farm, [timestamp], {name: [reading.get(name, np.nan)] for name in self.columns})
+
+    # Readings with start <= time < end. With `limit`, only the newest
+    # `limit` rows are returned. Returns (times, {column: values}, truncated).
+    def query(self, farm, start, end, columns=None, limit=None):
+        farm = validate_farm(farm)
+        names = self._column_names(columns)
+        with timed('iot_store', 'query'), self._lock:
+            # Newest month first, so only the rows within `limit` are read;
+            # older months just count their matches
+            total, returned, time_parts, value_parts = 0, 0, [], []
+            for segment in reversed(self._segments_between(farm, start, end)):
+                with self._reading(segment):
+                    times = segment.times()
+                    first, hi = (int(i) for i in np.searchsorted(times, [start, end], side='left'))
+                    total += max(hi - first, 0)
+                    lo = first if limit is None else max(first, hi - max(limit - returned, 0))
+                    if hi > lo:
+                        time_parts.insert(0, np.array(times[lo:hi]))
+                        value_parts.insert(0, segment.read(lo, hi, names))
+                        returned += hi - lo
+        times = np.concatenate(time_parts) if time_parts else np.empty(0, np.int64)
+        values = np.concatenate(value_parts) if value_parts else np.empty((0, len(names)), np.float32)
+        return times, {name: values[:, i] for i, name in enumerate(names)}, total > len(times)
+
+    # Per-bucket count, mean, min and max for interval "hour" or "day"
+    # (UTC-aligned buckets). start and end are widened to whole buckets.
+    def aggregate(self, farm, start, end, interval="hour", columns=None):
+        farm = validate_farm(farm)
+        if interval not in INTERVALS:
+            raise ValueError(f"interval must be one of {', '.join(INTERVALS)}.")
+        width = INTERVALS[interval]
+        names = self._column_names(columns)
+        index = [self.columns.index(name) for name in names]
+        start, end = start // width * width, -(-end // width) * width
+        with timed('iot_store', 'aggregate'), self._lock:
+            parts = []
+            for segment in self._segments_between(farm, start, end):
+                with self._reading(segment):
+                    if not segment.rows:
+                        continue
+                    hourly = self._rollups[segment.path] = segment.hourly(self._rollups.get(segment.path))
+                lo, hi = np.searchsorted(hourly["hour"], [start, end], side='left')
+                parts.append({name: hourly[name][lo:hi] for name in ("hour", "count", "sum", "min", "max")})
+        merged = merge_rollups(parts, width)
+        if merged is None:
+            return {"time": np.empty(0, np.int64), "count": {}, "mean": {}, "min": {}, "max": {}}
+        count = merged["count"][:, index]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = merged["sum"][:, index] / count
+        return {
+            "time": merged["hour"],
+            "count": {name: count[:, i] for i, name in enumerate(names)},
+            "mean": {name: mean[:, i] for i, name in enumerate(names)},
+            "min": {name: merged["min"][:, j] for name, j in zip(names, index)},
+            "max": {name: merged["max"][:, j] for name, j in zip(names, index)},
+        }
+
+    def _column_names(self, columns):
+        if not columns:
+            return list(self.columns)
+        unknown = [name for name in columns if name not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}.")
+        return list(columns)
@@ -0,0 +1,120 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+from stub_services import start_stub_server
+
+# Load test for the API: fires --requests calls at one route with
+# --concurrency clients and reports throughput, p50/p99 latency and status
+# codes (429 = shed by the ASGI app's per-route limits).
+#
+#   python loadtest.py --url http://localhost:5000 --route chat
+#
+# --compare starts the Flask app (threaded dev server) and the ASGI app
+# (uvicorn) side by side, pointed at the local stub services, and runs the
+# same load against both:
+#
+#   python loadtest.py --compare --route chat --stub-latency 0.3 --concurrency 32
+
+ROUTES = {
+    "chat": ("POST", "/api/chat", {"message": "Give me farm advice for rice in pune"}),
+    "iot": ("GET", "/api/iot-data", None),
+    "satellite": ("POST", "/api/analyze-satellite", {"coords": "76.5,13.2,77.5,14.0", "format": "series"}),
+}
+
+def run_load(base_url, route, total, concurrency, timeout=60):
+    method, path, body = ROUTES[route]
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def call(_):
+        started = time.perf_counter()
+        try:
+            status = session.request(method, base_url + path, json=body, timeout=timeout).status_code
+        except requests.RequestException:
+            status = "error"
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, status in results if status == 200]) * 1000
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "requests_per_s": round(total / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1) if len(latencies) else None,
+        "statuses": statuses,
+    }
+
+def wait_until_up(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        try:
+            requests.get(base_url + "/api/startup-report", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{base_url} did not come up")
+
+def start_servers(flask_port, asgi_port, env):
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        "flask": [sys.executable, "-c", f"from main_app import app; app.run(port={flask_port}, threaded=True)"],
+        "asgi": [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", str(asgi_port), "--log-level", "warning"],
+    }
+    return {
+        name: subprocess.Popen(command, cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for name, command in commands.items()
+    }
+
+def print_result(label, result):
+    print(f"{label:>6}: {result['requests_per_s']:8.1f} req/s  p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  {result['statuses']}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default="http://localhost:5000")
+    parser.add_argument('--route', choices=ROUTES, default="chat")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--compare', action='store_true', help="start Flask and ASGI servers and test both")
+    parser.add_argument('--stub-latency', type=float, default=0.3, help="seconds per stub service call (--compare)")
+    parser.add_argument('--flask-port', type=int, default=5101)
+    parser.add_argument('--asgi-port', type=int, default=5102)
+    args = parser.parse_args()
+
+    if not args.compare:
+        print_result(args.route, run_load(args.url, args.route, args.requests, args.concurrency))
+        return
+
+    stub = start_stub_server(latency=args.stub_latency)
+    # Short TTLs so most chat requests reach the (slow) stub services
+    env = {**os.environ, **stub.environment(), "CHAT_SATELLITE_TTL": "0", "CHAT_WEATHER_TTL": "0"}
+    servers = start_servers(args.flask_port, args.asgi_port, env)
+    try:
+        for name, port in (("flask", args.flask_port), ("asgi", args.asgi_port)):
+            base_url = f"http://127.0.0.1:{port}"
+            wait_until_up(base_url, servers[name])
+            run_load(base_url, args.route, min(args.concurrency, 8), args.concurrency)  # warm-up
+            print_result(name, run_load(base_url, args.route, args.requests, args.concurrency))
+    finally:
+        for process in servers.values():
+            process.terminate()
+        for process in servers.values():
+            process.wait()
+        stub.shutdown()
+
+if __name__ == '__main__':
+    main()
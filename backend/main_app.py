@@ -1,14 +1,55 @@
-from iot import get_iot_data
-from cd import analyze_crop_disease
-# from cb import chatbot
-# from sat import analyze_satellite_logic
-from flask import Flask, jsonify, request
+import json
+import os
+import time
+from startup import lazy_module, preload, startup_report
+from iot import get_iot_data, iot_history
+from iot_ingest import INGEST_MAX_BYTES, ingest_readings
+from stream import TickBroadcaster
+from metrics import (CONTENT_TYPE, PROFILE_HEADER, finish_profile, load_profile, profiling_requested, record_error,
+                     record_request, registry, start_profile)
+from cd import analyze_crop_disease, analyze_crop_disease_batch, interpreter_pool, micro_batcher, prediction_cache
+# cb (chatbot) and sat (satellite analysis) pull in Earth Engine, pandas,
+# sklearn and matplotlib, so they are imported on first use of their routes
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable Cross-Origin Resource Sharing (CORS)
 
+# Optionally load heavy subsystems up front, e.g. PRELOAD=iot,cd,sat,chat
+# (with gunicorn's preload_app the loaded pages are shared by all workers)
+if os.environ.get('PRELOAD'):
+    print(f"Startup report: {preload(os.environ['PRELOAD'].split(','))}")
+
+# One shared producer generates and scores an IoT reading per tick for all stream clients
+IOT_STREAM_INTERVAL = float(os.environ.get('IOT_STREAM_INTERVAL', 5))
+IOT_STREAM_KEEPALIVE = 15
+iot_broadcaster = TickBroadcaster(get_iot_data, interval=IOT_STREAM_INTERVAL, name='iot-stream')
+registry.gauge("iot_stream_subscribers", "Open IoT stream connections.", lambda: iot_broadcaster.stats()["subscribers"])
+
+# Per-route latency for every request; with PROFILE_TOKEN set, a request
+# carrying "X-Profile: <token>" is also run under the sampling profiler and
+# its collapsed stacks are kept for /debug/profile/<id> (see X-Profile-Id)
+@app.before_request
+def start_request_metrics():
+    g.started = time.perf_counter()
+    g.profile = start_profile() if profiling_requested(request.headers.get(PROFILE_HEADER)) else None
+
+@app.after_request
+def finish_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    record_request(route, request.method, response.status_code, time.perf_counter() - g.started)
+    if g.profile is not None:
+        finish_profile(*g.profile)
+        response.headers['X-Profile-Id'] = g.profile[0]
+    return response
+
+# Count and log an exception caught by a route handler
+def report_error(error):
+    record_error(request.url_rule.rule if request.url_rule is not None else "unmatched", error)
+    app.logger.exception("Error handling %s %s", request.method, request.path)
+
 # Route for IoT Data
 @app.route('/api/analyze-crop-disease', methods=['POST'])
 def analyze_crop():
@@ -31,8 +72,38 @@ def analyze_crop():
         return jsonify(result), 200
 
     except Exception as e:
+        report_error(e)
         return jsonify({"error": str(e)}), 500
 
+# Route for analyzing many images of one plot at once
+@app.route('/api/analyze-crop-disease/batch', methods=['POST'])
+def analyze_crop_batch():
+    try:
+        # Accept any number of 'files' (or 'file') parts, images or zip archives
+        files = request.files.getlist('files') + request.files.getlist('file')
+        if not files:
+            return jsonify({"error": "No files provided"}), 400
+
+        crop_type = request.form.get('cropType')
+        if not crop_type:
+            return jsonify({"error": "Crop type is required"}), 400
+
+        result = analyze_crop_disease_batch(files, crop_type)
+        return jsonify(result), 200
+
+    except Exception as e:
+        report_error(e)
+        return jsonify({"error": str(e)}), 500
+
+# Route for crop disease model pool, batching and cache counters
+@app.route('/api/analyze-crop-disease/stats', methods=['GET'])
+def analyze_crop_stats():
+    return jsonify({
+        "interpreters": interpreter_pool.stats(),
+        "batching": micro_batcher.stats(),
+        "cache": prediction_cache.stats(),
+    }), 200
+
 # Route for Crop Disease Analysis
 @app.route('/api/iot-data', methods=['GET'], endpoint='iot_data_endpoint')  # Explicit endpoint name
 def iot_data():
@@ -40,38 +111,109 @@ def iot_data():
         response = get_iot_data()
         return jsonify(response), 200
     except Exception as e:
+        report_error(e)
         return jsonify({"error": str(e)}), 500
 
+# Route for stored IoT readings: raw readings or hourly/daily aggregates
+@app.route('/api/iot-history', methods=['GET'])
+def iot_history_endpoint():
+    try:
+        return jsonify(iot_history(request.args)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        report_error(e)
+        return jsonify({"error": str(e)}), 500
+
+# Route for bulk gateway uploads: NDJSON, CSV or .npz columns, validated,
+# scored in one pass and stored
+@app.route('/api/iot-ingest', methods=['POST'])
+def iot_ingest_endpoint():
+    try:
+        if (request.content_length or 0) > INGEST_MAX_BYTES:
+            return jsonify({"error": f"Payload is larger than {INGEST_MAX_BYTES} bytes."}), 413
+        return jsonify(ingest_readings(request.get_data(), request.content_type, request.args)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        report_error(e)
+        return jsonify({"error": str(e)}), 500
+
+# Route for streaming IoT Data (Server-Sent Events)
+@app.route('/api/iot-stream', methods=['GET'])
+def iot_stream():
+    subscription = iot_broadcaster.subscribe()
+
+    def events():
+        try:
+            while True:
+                data = subscription.get(timeout=IOT_STREAM_KEEPALIVE)
+                if data is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"data: {json.dumps(data)}\n\n"
+        finally:
+            # Runs when the client disconnects
+            subscription.close()
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # Route for Chatbot Handling
-# @app.route('/api/chat', methods=['POST'])
-# def handle_chat():
-#     try:
-#         # Parse the JSON payload from the frontend
-#         data = request.json
-#         user_input = data.get("message", "").strip()
-#         if not user_input:
-#             return jsonify({"error": "Message cannot be empty."}), 400
-#         # Call the chatbot function to generate a response
-#         bot_response = chatbot(user_input)
-#         # Return the response as JSON
-#         return jsonify({"response": bot_response}), 200
-#     except Exception as e:
-#         # Handle unexpected errors gracefully
-#         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+@app.route('/api/chat', methods=['POST'])
+def handle_chat():
+    try:
+        # Parse the JSON payload from the frontend
+        data = request.json
+        user_input = data.get("message", "").strip()
+        if not user_input:
+            return jsonify({"error": "Message cannot be empty."}), 400
+        # Call the chatbot function to generate a response
+        bot_response = lazy_module('cb').chatbot(user_input)
+        # Return the response as JSON
+        return jsonify({"response": bot_response}), 200
+    except Exception as e:
+        # Handle unexpected errors gracefully
+        report_error(e)
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 # Route for Satellite Data Analysis
 @app.route('/api/analyze-satellite', methods=['POST'])
-# def analyze_satellite():
-#     try:
-#         # Parse the JSON payload from the frontend
-#         data = request.json
-#         result = analyze_satellite_logic(data)
-#         # Return the response as JSON
-#         return jsonify(result), 200
-#     except Exception as e:
-#         # Handle unexpected errors gracefully
-#         return jsonify({"error": str(e)}), 500
+def analyze_satellite():
+    try:
+        # Parse the JSON payload from the frontend
+        data = request.json
+        result = lazy_module('sat').analyze_satellite_logic(data)
+        # Return the response as JSON
+        return jsonify(result), 200
+    except Exception as e:
+        # Handle unexpected errors gracefully
+        report_error(e)
+        return jsonify({"error": str(e)}), 500
+
+# Route for the per-subsystem load time report
+@app.route('/api/startup-report', methods=['GET'])
+def startup_report_endpoint():
+    return jsonify(startup_report()), 200
+
+# Route for Prometheus metrics: request latency, stage timings, caches and queues
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+# Route for a profiled request's collapsed stacks (flamegraph input)
+@app.route('/debug/profile/<profile_id>', methods=['GET'])
+def profile_endpoint(profile_id):
+    if not profiling_requested(request.headers.get(PROFILE_HEADER)):
+        return jsonify({"error": "Profiling is not enabled"}), 403
+    stacks = load_profile(profile_id)
+    if stacks is None:
+        return jsonify({"error": "Unknown profile id"}), 404
+    return Response(stacks, content_type='text/plain; charset=utf-8')
 
 # Run the Flask app
 if __name__ == '__main__':
+    # Optionally load every crop disease model before the first request
+    if os.environ.get('CD_WARMUP') == '1':
+        print(f"Crop disease model warm-up (seconds per crop): {interpreter_pool.warm_up()}")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,291 @@
+import bisect
+import collections
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+
+# In-process metrics in the Prometheus text exposition format. Counters and
+# histograms are updated by the code being measured; gauges are read from
+# callbacks when /metrics is scraped, so queue depths and cache counters
+# cost nothing between scrapes.
+#
+# Metrics are per process: under gunicorn each worker keeps its own, and a
+# scrape of /metrics reports only the worker that answered it. Every sample
+# carries a worker="<pid>" label so series from different workers never
+# merge; sum over that label in queries for totals.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1.0):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, values, None, total) for values, total in self._values.items()]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for values, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((self.name + "_bucket", values, ("le", _format_value(bound)), cumulative))
+                samples.append((self.name + "_bucket", values, ("le", "+Inf"), count))
+                samples.append((self.name + "_sum", values, None, total))
+                samples.append((self.name + "_count", values, None, count))
+        return samples
+
+# Gauge whose values come from `read()`: a number, or a dict mapping label
+# value tuples to numbers. A failing callback is skipped for that scrape.
+class CallbackGauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, read, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.read = read
+
+    def samples(self):
+        try:
+            values = self.read()
+        except Exception:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, key, None, value) for key, value in values.items() if value is not None]
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Re-registering (e.g. a module imported twice) keeps the first metric
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read, labels=()):
+        with self._lock:
+            self._metrics[name] = CallbackGauge(name, help, read, labels)
+            return self._metrics[name]
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        # Read at scrape time, so forked workers report their own pid
+        worker = str(os.getpid())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            names = metric.labels + ("worker",)
+            for name, values, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(names, tuple(values) + (worker,), extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route, method and status.", ("route", "method", "status"))
+request_errors = registry.counter(
+    "http_request_errors_total", "Exceptions caught by route handlers, by exception type.", ("route", "exception"))
+stage_seconds = registry.histogram(
+    "stage_duration_seconds", "Time spent in each processing stage.", ("subsystem", "stage"))
+
+def record_request(route, method, status, seconds):
+    request_seconds.observe(seconds, route, method, str(status))
+
+def record_error(route, error):
+    request_errors.inc(route, type(error).__name__)
+
+# Time a block of work as one stage of a subsystem
+def timed(subsystem, stage):
+    return stage_seconds.time(subsystem, stage)
+
+def observe_stage(subsystem, stage, seconds):
+    stage_seconds.observe(seconds, subsystem, stage)
+
+# Caches and queues report through shared gauge families labelled by name.
+# Subsystems register a callback at import time: caches return an
+# LRUCache-style stats() dict, queues return their current depth.
+_caches = {}
+_queues = {}
+
+def register_cache(name, stats):
+    _caches[name] = stats
+
+def register_queue(name, depth):
+    _queues[name] = depth
+
+def _read_all(callbacks):
+    values = {}
+    for name, callback in list(callbacks.items()):
+        try:
+            values[name] = callback()
+        except Exception:
+            pass
+    return values
+
+def _cache_field(field):
+    def read():
+        return {(name,): stats[field] for name, stats in _read_all(_caches).items() if stats and field in stats}
+    return read
+
+for _field, _help in (("hits", "Cache hits."), ("misses", "Cache misses."), ("size", "Entries in the cache."),
+                      ("hit_rate", "Cache hits / lookups.")):
+    registry.gauge(f"cache_{_field}", _help, _cache_field(_field), ("cache",))
+
+registry.gauge("queue_depth", "Items waiting in a work queue.",
+               lambda: {(name,): depth for name, depth in _read_all(_queues).items() if depth is not None}, ("queue",))
+
+# Opt-in sampling profiler. While a profiled request runs, a background
+# thread records the stacks of the selected threads every `interval`
+# seconds; the result is kept as collapsed stacks ("frame;frame;frame N",
+# the input format of flamegraph tools) in PROFILE_DIR, shared by all
+# workers, so /debug/profile/<id> finds it whichever worker answers.
+PROFILE_HEADER = "X-Profile"
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'backend-profiles'))
+# Profiles kept on disk; older ones are removed as new ones are saved
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))
+PROFILE_ID = re.compile(r"^[0-9a-f]{12}$")
+
+# Whether a request's X-Profile header value turns profiling on. Profiling
+# is off unless PROFILE_TOKEN is set, and the header must carry the token.
+def profiling_requested(header_value):
+    return bool(PROFILE_TOKEN) and header_value == PROFILE_TOKEN
+
+class SamplingProfiler:
+    def __init__(self, thread_ids=None, interval=PROFILE_INTERVAL):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = traceback.extract_stack(frame)
+                self.stacks[";".join(f"{os.path.basename(entry.filename)}:{entry.name}" for entry in stack)] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+# Start profiling the current thread (or all threads) and return a profile id
+def start_profile(all_threads=False):
+    profiler = SamplingProfiler(None if all_threads else {threading.get_ident()}).start()
+    return uuid.uuid4().hex[:12], profiler
+
+# Save the collapsed stacks under the profile id (written to a temporary
+# file and renamed, so readers in other workers never see a partial one)
+def finish_profile(profile_id, profiler):
+    stacks = profiler.stop().collapsed()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, profile_id + '.txt')
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(stacks)
+    os.replace(tmp, path)
+    saved = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith('.txt')),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in saved[:-PROFILE_KEEP]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+# Collapsed stacks of a saved profile, or None if the id is unknown
+def load_profile(profile_id):
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, profile_id + '.txt')) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,155 @@
+import datetime
+import json
+import os
+import threading
+import time
+import zipfile
+import zlib
+import numpy as np
+import pandas as pd
+
+EPOCH = datetime.date(1970, 1, 1)
+
+def to_day(date):
+    # Date (or 'YYYY-MM-DD' string) -> days since 1970-01-01
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date[:10])
+    return (date - EPOCH).days
+
+def from_day(day):
+    return EPOCH + datetime.timedelta(days=int(day))
+
+# Interface for NDVI time-series sources. fetch() returns a DataFrame with
+# 'Date' ('YYYY-MM-DD') and 'NDVI' columns for observations over `bbox`
+# ([min_lon, min_lat, max_lon, max_lat]) from start_date (inclusive) to
+# end_date (exclusive), matching Earth Engine's filterDate.
+class NdviFetcher:
+    def fetch(self, bbox, start_date, end_date):
+        raise NotImplementedError
+
+# Deterministic local stand-in for Earth Engine: a seasonal NDVI curve plus
+# noise, one observation every `revisit_days`, optionally sleeping
+# `latency` seconds per call to mimic a remote round trip. The same bbox
+# and date always give the same value, so cached and fresh data agree.
+class FakeNdviFetcher(NdviFetcher):
+    def __init__(self, revisit_days=5, latency=0.0):
+        self.revisit_days = revisit_days
+        self.latency = latency
+        self.calls = []
+
+    def fetch(self, bbox, start_date, end_date):
+        self.calls.append((tuple(bbox), str(start_date), str(end_date)))
+        if self.latency:
+            time.sleep(self.latency)
+        start, end = to_day(start_date), to_day(end_date)
+        first = start + (-start) % self.revisit_days
+        days = np.arange(first, end, self.revisit_days)
+        seed = zlib.crc32(repr(tuple(round(v, 4) for v in bbox)).encode())
+        phase = (seed % 365) / 365 * 2 * np.pi
+        noise = np.sin(days * 12.9898 + seed) * 43758.5453 % 1 - 0.5
+        ndvi = 0.45 + 0.25 * np.sin(2 * np.pi * days / 365.25 + phase) + 0.05 * noise
+        return pd.DataFrame({
+            'Date': np.datetime_as_string(days.astype('datetime64[D]')),
+            'NDVI': ndvi.astype(np.float32),
+        })
+
+# Persistent, incremental NDVI time-series cache keyed by a quantized AOI.
+# Each AOI is stored as one .npz of two columns (int32 day numbers, float32
+# NDVI) plus the JSON metadata recording the date range already fetched.
+# A query fetches only what the cache is missing: dates after the newest
+# cached observation, and any range before the earliest fetched date.
+class NdviTimeSeriesCache:
+    def __init__(self, root, fetcher, precision=0.01):
+        self.root = root
+        self.fetcher = fetcher
+        self.precision = precision
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self.hits = 0
+        self.fetches = 0
+
+    # Snap the AOI outwards to the cache grid so nearby queries share an entry
+    def quantize(self, bbox):
+        p = self.precision
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return (
+            round(float(np.floor(min_lon / p)) * p, 6), round(float(np.floor(min_lat / p)) * p, 6),
+            round(float(np.ceil(max_lon / p)) * p, 6), round(float(np.ceil(max_lat / p)) * p, 6),
+        )
+
+    def _path(self, key):
+        return os.path.join(self.root, "_".join(f"{v:.4f}" for v in key) + '.npz')
+
+    def _lock_for(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    # Cached (days, ndvi, meta) of an entry; a missing, unreadable or
+    # inconsistent entry reads as empty and is fetched again
+    def _load(self, path):
+        empty = np.empty(0, np.int32), np.empty(0, np.float32), None
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                days, ndvi, meta = entry['days'], entry['ndvi'], json.loads(str(entry['meta']))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return empty
+        if days.ndim != 1 or days.shape != ndvi.shape:
+            return empty
+        return days, ndvi, meta
+
+    def _save(self, path, days, ndvi, meta):
+        os.makedirs(self.root, exist_ok=True)
+        # Columns and meta share one file, published with a single rename, so
+        # readers in other workers never mix old and new parts of an entry
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(f, days=np.asarray(days, np.int32), ndvi=np.asarray(ndvi, np.float32),
+                     meta=np.array(json.dumps(meta)))
+        os.replace(tmp, path)
+
+    def _fetch(self, key, start_day, end_day):
+        self.fetches += 1
+        df = self.fetcher.fetch(list(key), from_day(start_day).isoformat(), from_day(end_day).isoformat())
+        days = np.asarray(df['Date'], dtype='datetime64[D]').astype(np.int32)
+        return days, np.asarray(df['NDVI'], dtype=np.float32)
+
+    # NDVI observations for bbox between start_date (inclusive) and end_date (exclusive)
+    def get(self, bbox, start_date, end_date):
+        key = self.quantize(bbox)
+        path = self._path(key)
+        start_day, end_day = to_day(str(start_date)), to_day(str(end_date))
+        with self._lock_for(key):
+            days, ndvi, meta = self._load(path)
+            parts = [(np.asarray(days), np.asarray(ndvi))]
+            if meta is None:
+                parts.append(self._fetch(key, start_day, end_day))
+                meta = {"bbox": list(key), "fetched_from": start_day, "fetched_to": end_day}
+            else:
+                if start_day < meta["fetched_from"]:
+                    parts.append(self._fetch(key, start_day, meta["fetched_from"]))
+                    meta["fetched_from"] = start_day
+                if end_day > meta["fetched_to"]:
+                    # Only ask for dates after the newest observation we already hold
+                    newest = int(days[-1]) + 1 if len(days) else meta["fetched_from"]
+                    parts.append(self._fetch(key, newest, end_day))
+                    meta["fetched_to"] = end_day
+            if len(parts) > 1:
+                days = np.concatenate([part[0] for part in parts])
+                ndvi = np.concatenate([part[1] for part in parts])
+                # Sort by date and keep the latest value for each day
+                order = np.argsort(days, kind='stable')
+                days, ndvi = days[order], ndvi[order]
+                keep = np.append(days[1:] != days[:-1], True)
+                days, ndvi = days[keep], ndvi[keep]
+                self._save(path, days, ndvi, meta)
+            else:
+                self.hits += 1
+
+        window = (days >= start_day) & (days < end_day)
+        return pd.DataFrame({
+            'Date': np.datetime_as_string(np.asarray(days[window]).astype('datetime64[D]')),
+            'NDVI': np.asarray(ndvi[window], dtype=np.float64),
+        })
+
+    def stats(self):
+        return {"hits": self.hits, "fetches": self.fetches}
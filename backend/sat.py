@@ -2,36 +2,65 @@ import ee
 import datetime
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.impute import SimpleImputer
-import matplotlib.pyplot as plt
-import base64
-import io
-
-# Initialize Earth Engine
-try:
-    ee.Initialize()
-except Exception as e:
-    print(f"Error initializing Earth Engine: {e}")
-    ee.Authenticate()
-    ee.Initialize()
-
-# Function to get user-defined AOI
-def get_user_aoi(coords):
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from earth_engine import ensure_earth_engine
+from anomaly import AnomalyModelStore, score_future, score_series
+from charts import chart_cache, ndvi_series, render_ndvi_png
+from stress import load_bands, recommendations_from_zonal, summarize_counts, zonal_stress
+from ndvi_cache import NdviFetcher, NdviTimeSeriesCache
+from timing import StageTimer
+from metrics import register_cache, timed
+
+# Default AOI: Tumkur, Karnataka
+DEFAULT_BBOX = [76.5, 13.2, 77.5, 14.0]
+
+# Local NDVI time-series cache (set NDVI_CACHE_DIR to an empty string to disable)
+NDVI_CACHE_DIR = os.environ.get('NDVI_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ndvi_cache'))
+
+# Per-AOI anomaly models (set ANOMALY_MODEL_DIR to an empty string to fit per request)
+ANOMALY_MODEL_DIR = os.environ.get('ANOMALY_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anomaly_models'))
+anomaly_store = AnomalyModelStore(ANOMALY_MODEL_DIR) if ANOMALY_MODEL_DIR else None
+if anomaly_store is not None:
+    register_cache('sat_anomaly_models', lambda: anomaly_store.stats()["memory"])
+register_cache('sat_charts', chart_cache.stats)
+
+# Zonal stress statistics: hotspot grid size and reduction scale (metres)
+ZONAL_GRID = (int(os.environ.get('SAT_ZONAL_GRID', 8)),) * 2
+ZONAL_SCALE = int(os.environ.get('SAT_ZONAL_SCALE', 30))
+# Locally cached band arrays for stressMode "local", one <aoi_key>/ directory per AOI
+STRESS_BANDS_DIR = os.environ.get('STRESS_BANDS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stress_bands'))
+STRESS_MODES = ("samples", "zonal", "local")
+
+# Parse a user-defined "min_lon,min_lat,max_lon,max_lat" bounding box
+def parse_bbox(coords):
     if coords:
         try:
             coords = list(map(float, coords.split(",")))
             if len(coords) == 4:
-                return ee.Geometry.Rectangle(coords)
+                return coords
         except ValueError:
             pass
     # Default to Tumkur, Karnataka
-    return ee.Geometry.Rectangle([76.5, 13.2, 77.5, 14.0])
+    return list(DEFAULT_BBOX)
 
-# Fetch NDVI time series data
-def fetch_ndvi_data(aoi, years=3):
-    end_date = datetime.date.today()
-    start_date = end_date - datetime.timedelta(days=years * 365)
+# Function to get user-defined AOI
+def get_user_aoi(coords):
+    return ee.Geometry.Rectangle(parse_bbox(coords))
+
+# Evaluate an Earth Engine object, timing the round trip as stage getinfo_<name>
+def get_info(query, name):
+    with timed('sat', f'getinfo_{name}'):
+        return query.getInfo()
+
+# Server-side NDVI time series query: an ee.Dictionary with 'dates' and 'NDVI' lists
+def build_ndvi_query(aoi, years=3, start_date=None, end_date=None):
+    if end_date is None:
+        end_date = datetime.date.today()
+    if start_date is None:
+        start_date = end_date - datetime.timedelta(days=years * 365)
 
     collection = ee.ImageCollection("COPERNICUS/S2") \
         .filterBounds(aoi) \
@@ -56,10 +85,38 @@ def fetch_ndvi_data(aoi, years=3):
         })
 
     features = ndvi_collection.map(extract_data).filter(ee.Filter.notNull(['NDVI']))
-    dates = features.aggregate_array('date').getInfo()
-    ndvi_values = features.aggregate_array('NDVI').getInfo()
-
-    return pd.DataFrame({'Date': dates, 'NDVI': ndvi_values})
+    return ee.Dictionary({
+        'dates': features.aggregate_array('date'),
+        'NDVI': features.aggregate_array('NDVI'),
+    })
+
+def ndvi_frame(ndvi_info):
+    return pd.DataFrame({'Date': ndvi_info['dates'], 'NDVI': ndvi_info['NDVI']})
+
+# Fetch NDVI time series data (the last `years` years unless dates are given)
+def fetch_ndvi_data(aoi, years=3, start_date=None, end_date=None):
+    # Dates and values come back together in one round trip
+    return ndvi_frame(get_info(build_ndvi_query(aoi, years, start_date, end_date), 'ndvi'))
+
+# NDVI time-series source backed by Earth Engine
+class EarthEngineNdviFetcher(NdviFetcher):
+    def fetch(self, bbox, start_date, end_date):
+        ensure_earth_engine()
+        return fetch_ndvi_data(ee.Geometry.Rectangle(list(bbox)), start_date=start_date, end_date=end_date)
+
+ndvi_series_cache = NdviTimeSeriesCache(NDVI_CACHE_DIR, EarthEngineNdviFetcher()) if NDVI_CACHE_DIR else None
+if ndvi_series_cache is not None:
+    register_cache('sat_ndvi_series', lambda: {"hits": ndvi_series_cache.hits, "misses": ndvi_series_cache.fetches})
+
+# NDVI time series for a bounding box over the last `years` years,
+# served from the local cache when it is enabled
+def fetch_ndvi_series(bbox, years=3):
+    end_date = datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=years * 365)
+    if ndvi_series_cache is None:
+        ensure_earth_engine()
+        return fetch_ndvi_data(ee.Geometry.Rectangle(list(bbox)), start_date=start_date, end_date=end_date)
+    return ndvi_series_cache.get(bbox, start_date, end_date)
 
 # Preprocess NDVI data
 def preprocess_data(df):
@@ -69,28 +126,21 @@ def preprocess_data(df):
     df = df.resample('D').interpolate(method='linear', limit_direction='both')  # Fill missing values
     return df.dropna()
 
-# Detect anomalies in NDVI data
-def detect_anomalies(df):
-    df['rolling_mean'] = df['NDVI'].rolling(window=30).mean()
-    df['rolling_std'] = df['NDVI'].rolling(window=30).std()
-
-    # Z-score method
-    df['z_score'] = (df['NDVI'] - df['rolling_mean']) / df['rolling_std']
-    df['z_anomaly'] = df['z_score'].abs() > 2.5
-
-    # Handle missing values before passing to IsolationForest
-    imputer = SimpleImputer(strategy='mean')  # Replace NaN with column mean
-    features = imputer.fit_transform(df[['NDVI', 'rolling_mean', 'rolling_std']].values)
-
-    # Isolation Forest
-    clf = IsolationForest(contamination=0.05, random_state=42)
-    df['if_anomaly'] = clf.fit_predict(features) == -1
-
-    df['anomaly'] = df['z_anomaly'] | df['if_anomaly']
+# Cache/model key for an AOI (the NDVI cache's quantized bounding box)
+def aoi_key(bbox):
+    if ndvi_series_cache is not None:
+        bbox = ndvi_series_cache.quantize(bbox)
+    return "_".join(f"{v:.4f}" for v in bbox)
+
+# Detect anomalies in NDVI data (rolling z-score plus IsolationForest).
+# With an aoi_key the AOI's persisted model is reused until new
+# observations arrive.
+def detect_anomalies(df, aoi_key=None):
+    df, _ = score_series(df, anomaly_store, aoi_key)
     return df
 
-# Predict future anomalies
-def predict_future_anomalies(df, days=30):
+# Predict future anomalies (reusing the history's model when given)
+def predict_future_anomalies(df, days=30, model=None):
     last_date = df.index[-1]
     future_dates = pd.date_range(last_date + datetime.timedelta(days=1), periods=days, freq='D')
 
@@ -98,17 +148,16 @@ def predict_future_anomalies(df, days=30):
     rolling_mean = df['rolling_mean'].iloc[-30:].mean()
     rolling_std = df['rolling_std'].iloc[-30:].mean()
 
-    future_ndvi = np.random.normal(rolling_mean, rolling_std, size=len(future_dates))
+    # Seeded from the history, so the same data gives the same forecast (and chart)
+    seed = zlib.crc32(df['NDVI'].to_numpy(dtype=np.float64).tobytes() + str(last_date).encode())
+    future_ndvi = np.random.default_rng(seed).normal(rolling_mean, rolling_std, size=len(future_dates))
     future_df = pd.DataFrame({'Date': future_dates, 'NDVI': future_ndvi})
     future_df.set_index('Date', inplace=True)
 
-    # Handle missing values before passing to IsolationForest
-    imputer = SimpleImputer(strategy='mean')
-    future_features = imputer.fit_transform(future_df[['NDVI']].values)
-
-    # Predict anomalies
-    clf = IsolationForest(contamination=0.05, random_state=42)
-    future_df['anomaly'] = clf.fit_predict(future_features) == -1
+    # Score the forecast with the history's model instead of fitting a new one
+    if model is None:
+        _, model = score_series(df.copy())
+    future_df['anomaly'] = score_future(df['NDVI'].to_numpy(), future_ndvi, model)
 
     return future_df
 
@@ -117,14 +166,21 @@ def analyze_and_mark_problem_areas(aoi, start_date, end_date):
     """
     Fetch Sentinel-2 data, calculate NDVI, MSI, and NDWI, and classify stress areas.
     """
+    image_count, crop_stress, water_stress = build_stress_layers(aoi, start_date, end_date)
+
+    if get_info(image_count, 'image_count') == 0:
+        raise ValueError("No Sentinel-2 data found for the given date range and location.")
+
+    return crop_stress, water_stress
+
+# Server-side stress classification: (image count, CropStress, WaterStress),
+# nothing is evaluated until the caller asks for it
+def build_stress_layers(aoi, start_date, end_date):
     sentinel2_collection = ee.ImageCollection("COPERNICUS/S2") \
         .filterBounds(aoi) \
         .filterDate(start_date, end_date) \
         .sort('CLOUD_COVERAGE_ASSESSMENT')
-    
-    if sentinel2_collection.size().getInfo() == 0:
-        raise ValueError("No Sentinel-2 data found for the given date range and location.")
-    
+
     sentinel2 = sentinel2_collection.first()
 
     # Calculate NDVI, MSI, and NDWI
@@ -144,27 +200,33 @@ def analyze_and_mark_problem_areas(aoi, start_date, end_date):
 
     water_stress = ndwi.lt(-0.1).rename('WaterStress')  # Low NDWI indicates water stress
 
-    return crop_stress, water_stress
+    return sentinel2_collection.size(), crop_stress, water_stress
 
 # Generate recommendations based on raster data
 def generate_recommendations(crop_stress, water_stress, aoi):
     """
     Sample random points in the AOI and generate recommendations based on stress classifications.
     """
-    recommendations = []
-    
+    return recommendations_from_samples(get_info(build_stress_samples(crop_stress, water_stress, aoi), 'stress_samples'))
+
+# Server-side sample of the stress layers at random points in the AOI
+def build_stress_samples(crop_stress, water_stress, aoi):
     sample_points = ee.FeatureCollection.randomPoints(
         region=aoi,
         points=10,  # Number of random points
         seed=123  # Fixed seed for reproducibility
     )
-    
-    sampled_data = crop_stress.addBands(water_stress).sampleRegions(
+
+    return crop_stress.addBands(water_stress).sampleRegions(
         collection=sample_points,
         scale=100,  # Scale in meters
         geometries=True
-    ).getInfo()
-    
+    )
+
+# Turn sampled stress values into recommendations
+def recommendations_from_samples(sampled_data):
+    recommendations = []
+
     for feature in sampled_data['features']:
         coords = feature['geometry']['coordinates']
         lon, lat = coords[0], coords[1]
@@ -190,74 +252,180 @@ def generate_recommendations(crop_stress, water_stress, aoi):
     
     return recommendations
 
-# Plot NDVI data and anomalies
+# Plot NDVI data and anomalies (base64 PNG, cached by the plotted data)
 def plot_ndvi_graph(ndvi_df, future_df=None):
-    plt.figure(figsize=(12, 6))
-    plt.plot(ndvi_df.index, ndvi_df['NDVI'], label='NDVI', color='green', linewidth=2)
-
-    # Highlight anomalies
-    anomalies = ndvi_df[ndvi_df['anomaly']]
-    plt.scatter(anomalies.index, anomalies['NDVI'], color='red', label='Anomalies', zorder=5)
-
-    if future_df is not None:
-        plt.plot(future_df.index, future_df['NDVI'], label='Future NDVI', color='blue', linestyle='--', linewidth=2)
-
-        # Highlight future anomalies
-        future_anomalies = future_df[future_df['anomaly']]
-        plt.scatter(future_anomalies.index, future_anomalies['NDVI'], color='orange', label='Future Anomalies', zorder=5)
-
-    plt.title('NDVI Time Series with Anomalies')
-    plt.xlabel('Date')
-    plt.ylabel('NDVI')
-    plt.legend()
-    plt.grid(True)
+    return render_ndvi_png(ndvi_df, future_df)
+
+# Coarse grid of rectangles over bbox, row 0 along the northern edge
+def build_grid_cells(bbox, grid=ZONAL_GRID):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    rows, cols = grid
+    cell_width = (max_lon - min_lon) / cols
+    cell_height = (max_lat - min_lat) / rows
+    return ee.FeatureCollection([
+        ee.Feature(ee.Geometry.Rectangle([
+            min_lon + col * cell_width, max_lat - (row + 1) * cell_height,
+            min_lon + (col + 1) * cell_width, max_lat - row * cell_height,
+        ]), {'row': row, 'col': col})
+        for row in range(rows) for col in range(cols)
+    ])
+
+# Server-side zonal statistics: one reduceRegions pass computing the pixel
+# histogram of both stress bands in every grid cell. The AOI totals are the
+# sums over the cells, so nothing else has to be reduced.
+def build_zonal_query(crop_stress, water_stress, bbox, grid=ZONAL_GRID, scale=ZONAL_SCALE):
+    return crop_stress.addBands(water_stress).reduceRegions(
+        collection=build_grid_cells(bbox, grid),
+        reducer=ee.Reducer.frequencyHistogram(),
+        scale=scale,
+    )
 
-    # Save plot to a BytesIO buffer
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plt.close()
+# Per-cell class counts, in the layout of stress.stress_counts, from the
+# evaluated zonal query
+def zonal_counts(zonal_info, grid=ZONAL_GRID):
+    crop = np.zeros(grid + (3,))
+    water = np.zeros(grid + (2,))
+    for feature in zonal_info['features']:
+        properties = feature['properties']
+        row, col = properties['row'], properties['col']
+        for value, count in (properties.get('CropStress') or {}).items():
+            crop[row, col, int(float(value))] += count
+        for value, count in (properties.get('WaterStress') or {}).items():
+            water[row, col, int(float(value))] += count
+    return crop, water
+
+# Evaluate the image count and the stress query in a single getInfo: 10
+# random samples ("samples") or grid histograms ("zonal"). The query is
+# wrapped in ee.Algorithms.If so an empty collection yields nothing
+# instead of a server-side error.
+def fetch_stress_info(aoi, start_date, end_date, ndvi_query=None, stress_mode="samples", bbox=None):
+    image_count, crop_stress, water_stress = build_stress_layers(aoi, start_date, end_date)
+    query = {'image_count': image_count}
+    if stress_mode == "zonal":
+        zonal = build_zonal_query(crop_stress, water_stress, bbox)
+        query['zonal'] = ee.Algorithms.If(image_count.gt(0), zonal, None)
+    else:
+        samples = build_stress_samples(crop_stress, water_stress, aoi)
+        query['samples'] = ee.Algorithms.If(image_count.gt(0), samples, None)
+    if ndvi_query is not None:
+        query['ndvi'] = ndvi_query
+    return get_info(ee.Dictionary(query), 'stress_and_ndvi' if ndvi_query is not None else 'stress')
+
+# Run the remote part of the analysis with as few round trips as possible.
+# Without the NDVI cache everything is one combined getInfo; with it, the
+# cache lookup (which may itself call Earth Engine) and the stress query
+# are independent and run concurrently. In "local" stress mode only the
+# NDVI history is remote.
+def fetch_remote_data(bbox, aoi, start_date, end_date, timer, stress_mode="samples"):
+    if stress_mode == "local":
+        with timer.stage('ndvi_series'):
+            return fetch_ndvi_series(bbox), None
+
+    if ndvi_series_cache is None:
+        with timer.stage('earth_engine_query'):
+            info = fetch_stress_info(aoi, start_date, end_date, build_ndvi_query(aoi), stress_mode, bbox)
+        return ndvi_frame(info['ndvi']), info
+
+    def _run_timed(name, fn, *args):
+        with timer.stage(name):
+            return fn(*args)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        ndvi_future = executor.submit(_run_timed, 'ndvi_series', fetch_ndvi_series, bbox)
+        stress_future = executor.submit(
+            _run_timed, 'earth_engine_query', fetch_stress_info, aoi, start_date, end_date, None, stress_mode, bbox
+        )
+        return ndvi_future.result(), stress_future.result()
+
+# Validate the request and fetch its remote inputs (the I/O-bound half of
+# the analysis). Returns the state satellite_result needs.
+def fetch_satellite_inputs(data):
+    coords = data.get("coords", None)
+    start_date = data.get("startDate", "2023-01-01")
+    end_date = data.get("endDate", "2023-10-01")
+    # "png" (base64 image, the default) or "series" (compact JSON for client-side charts)
+    chart_format = data.get("format", "png")
+    # "samples" (10 random points, the default), "zonal" (area fractions and
+    # hotspot grid from Earth Engine) or "local" (the same from cached band arrays)
+    stress_mode = data.get("stressMode", "samples")
+
+    if not start_date or not end_date:
+        raise ValueError("Start date and end date are required.")
+    if chart_format not in ("png", "series"):
+        raise ValueError("format must be 'png' or 'series'.")
+    if stress_mode not in STRESS_MODES:
+        raise ValueError(f"stressMode must be one of {', '.join(STRESS_MODES)}.")
+
+    timer = StageTimer('sat')
+    started = time.perf_counter()
+    bbox = parse_bbox(coords)
+    # Local stress analysis only needs Earth Engine if the NDVI history isn't cached
+    aoi = None
+    if stress_mode != "local":
+        ensure_earth_engine()
+        aoi = ee.Geometry.Rectangle(bbox)
+
+    # Fetch NDVI history and crop/water stress samples
+    ndvi_df, stress_info = fetch_remote_data(bbox, aoi, start_date, end_date, timer, stress_mode)
+    if stress_info is not None and stress_info['image_count'] == 0:
+        raise ValueError("No Sentinel-2 data found for the given date range and location.")
 
-    # Encode image to base64
-    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return image_base64
+    return {
+        "bbox": bbox, "chart_format": chart_format, "stress_mode": stress_mode,
+        "ndvi_df": ndvi_df, "stress_info": stress_info, "timer": timer, "started": started,
+    }
+
+# Anomalies, forecast, stress statistics and chart from fetched inputs
+# (the CPU-bound half of the analysis)
+def satellite_result(inputs):
+    bbox, timer = inputs["bbox"], inputs["timer"]
+    stress_mode, stress_info = inputs["stress_mode"], inputs["stress_info"]
+
+    # Process NDVI data
+    with timer.stage('preprocess'):
+        ndvi_df = preprocess_data(inputs["ndvi_df"])
+    with timer.stage('anomaly_detection'):
+        ndvi_df, anomaly_model = score_series(ndvi_df, anomaly_store, aoi_key(bbox))
+
+    # Predict future anomalies
+    with timer.stage('forecast'):
+        future_df = predict_future_anomalies(ndvi_df, model=anomaly_model)
+
+    # Analyze crop and water stress
+    stress_stats = None
+    if stress_mode == "samples":
+        recommendations = recommendations_from_samples(stress_info['samples'])
+    else:
+        with timer.stage('stress_statistics'):
+            if stress_mode == "zonal":
+                stress_stats = summarize_counts(*zonal_counts(stress_info['zonal']), bbox)
+            else:
+                stress_stats = zonal_stress(load_bands(os.path.join(STRESS_BANDS_DIR, aoi_key(bbox))), bbox, ZONAL_GRID)
+        recommendations = recommendations_from_zonal(stress_stats)
+
+    # Plot NDVI graph, or return the (downsampled) series for the client to draw
+    chart = {}
+    with timer.stage('plot'):
+        if inputs["chart_format"] == "series":
+            chart["ndvi_series"] = ndvi_series(ndvi_df, future_df)
+        else:
+            chart["ndvi_plot"] = plot_ndvi_graph(ndvi_df, future_df)
+
+    # Filter future anomalies to only include dates where anomaly = True
+    future_anomalies = future_df[future_df['anomaly']].index.strftime('%Y-%m-%d').tolist()
+
+    # Return response
+    return {
+        **chart,
+        "future_anomalies": future_anomalies,
+        "recommendations": recommendations,
+        **({"stress_stats": stress_stats} if stress_stats is not None else {}),
+        "timings": {**timer.report(), "total": round(time.perf_counter() - inputs["started"], 4)},
+    }
 
 # Main function for satellite analysis
 def analyze_satellite_logic(data):
     try:
-        coords = data.get("coords", None)
-        start_date = data.get("startDate", "2023-01-01")
-        end_date = data.get("endDate", "2023-10-01")
-
-        if not start_date or not end_date:
-            raise ValueError("Start date and end date are required.")
-
-        aoi = get_user_aoi(coords)
-
-        # Fetch and process NDVI data
-        ndvi_df = fetch_ndvi_data(aoi)
-        ndvi_df = preprocess_data(ndvi_df)
-        ndvi_df = detect_anomalies(ndvi_df)
-
-        # Predict future anomalies
-        future_df = predict_future_anomalies(ndvi_df)
-
-        # Analyze crop and water stress
-        crop_stress, water_stress = analyze_and_mark_problem_areas(aoi, start_date, end_date)
-        recommendations = generate_recommendations(crop_stress, water_stress, aoi)
-
-        # Plot NDVI graph
-        image_base64 = plot_ndvi_graph(ndvi_df, future_df)
-
-        # Filter future anomalies to only include dates where anomaly = True
-        future_anomalies = future_df[future_df['anomaly']].index.strftime('%Y-%m-%d').tolist()
-
-        # Return response
-        return {
-            "ndvi_plot": image_base64,
-            "future_anomalies": future_anomalies,
-            "recommendations": recommendations
-        }
-
+        return satellite_result(fetch_satellite_inputs(data))
     except Exception as e:
-        raise Exception(f"Error during satellite analysis: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error during satellite analysis: {str(e)}")
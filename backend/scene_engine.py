@@ -0,0 +1,201 @@
+import argparse
+import json
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from stress import BANDS, crop_stress_classes, stress_indices, water_stress_mask
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:  # GeoTIFF input is optional; .npy bands need only NumPy
+    rasterio = None
+
+# Rows per tile, and threads working on tiles (NumPy releases the GIL in the index math)
+TILE_ROWS = int(os.environ.get('SCENE_TILE_ROWS', 256))
+WORKERS = int(os.environ.get('SCENE_WORKERS', os.cpu_count() or 1))
+
+# Output rasters and their on-disk dtypes. Indices are NaN and classes
+# NODATA_CLASS wherever any input band equals the nodata value.
+OUTPUTS = {
+    "NDVI": np.float16,
+    "MSI": np.float16,
+    "NDWI": np.float16,
+    "CropStress": np.uint8,
+    "WaterStress": np.uint8,
+}
+NODATA_CLASS = 255
+
+PAGE_SIZE = mmap.PAGESIZE
+
+# A .npy file mapped into memory. Tiles are read and written through
+# `array`; release() flushes a finished row range and drops its pages from
+# the process, so resident memory stays proportional to the tiles in
+# flight rather than to the scene.
+class MappedBand:
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        self._file = open(path, 'r+b' if writable else 'rb')
+        version = np.lib.format.read_magic(self._file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self._file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(self._file)
+        if fortran_order or len(shape) != 2:
+            raise ValueError(f"{path}: expected a 2-D C-ordered array")
+        self.offset = self._file.tell()
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        self.array = np.ndarray(shape, dtype, buffer=self._mmap, offset=self.offset)
+        self.shape = shape
+        self.row_bytes = shape[1] * dtype.itemsize
+
+    # New zero-filled .npy file of the given shape and dtype, mapped for writing
+    @classmethod
+    def create(cls, path, shape, dtype):
+        np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape).flush()
+        return cls(path, writable=True)
+
+    def read(self, rows):
+        return self.array[rows]
+
+    def release(self, rows):
+        start = self.offset + rows.start * self.row_bytes
+        end = self.offset + rows.stop * self.row_bytes
+        # Only whole pages inside the range, so neighbouring tiles are untouched
+        start = -(-start // PAGE_SIZE) * PAGE_SIZE
+        end = end // PAGE_SIZE * PAGE_SIZE
+        if end <= start:
+            return
+        if self.writable:
+            self._mmap.flush(start, end - start)
+        if hasattr(self._mmap, 'madvise'):
+            self._mmap.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    def close(self):
+        if self.writable:
+            self._mmap.flush()
+        self.array = None
+        self._mmap.close()
+        self._file.close()
+
+# A single-band GeoTIFF read tile by tile through rasterio. Dataset
+# handles are not thread-safe, so each thread opens its own.
+class GeoTiffBand:
+    def __init__(self, path):
+        if rasterio is None:
+            raise ImportError("rasterio is required to read GeoTIFF bands (pip install rasterio)")
+        self.path = path
+        self._local = threading.local()
+        with rasterio.open(path) as dataset:
+            self.shape = (dataset.height, dataset.width)
+
+    def _dataset(self):
+        dataset = getattr(self._local, 'dataset', None)
+        if dataset is None:
+            dataset = self._local.dataset = rasterio.open(self.path)
+        return dataset
+
+    def read(self, rows):
+        window = Window(0, rows.start, self.shape[1], rows.stop - rows.start)
+        return self._dataset().read(1, window=window)
+
+    def release(self, rows):
+        pass
+
+    def close(self):
+        pass
+
+def open_band(path):
+    if path.lower().endswith(('.tif', '.tiff')):
+        return GeoTiffBand(path)
+    return MappedBand(path)
+
+# Paths of B3, B4, B8 and B11 in a scene directory (.npy preferred over GeoTIFF)
+def find_bands(directory):
+    paths = {}
+    for name in BANDS:
+        for suffix in ('.npy', '.tif', '.tiff'):
+            path = os.path.join(directory, name + suffix)
+            if os.path.exists(path):
+                paths[name] = path
+                break
+        else:
+            raise FileNotFoundError(f"No {name} band (.npy or .tif) in {directory}")
+    return paths
+
+# Compute NDVI/MSI/NDWI and the crop and water stress classes for a whole
+# scene, tile by tile on a thread pool, writing each output to
+# <out_dir>/<name>.npy. Returns run statistics and stress class counts.
+def process_scene(band_paths, out_dir, tile_rows=TILE_ROWS, workers=WORKERS, nodata=0):
+    bands = {name: open_band(band_paths[name]) for name in BANDS}
+    shapes = {band.shape for band in bands.values()}
+    if len(shapes) != 1:
+        raise ValueError(f"Band shapes differ: {sorted(shapes)}")
+    shape = shapes.pop()
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = {
+        name: MappedBand.create(os.path.join(out_dir, f"{name}.npy"), shape, dtype)
+        for name, dtype in OUTPUTS.items()
+    }
+
+    def run_tile(top):
+        rows = slice(top, min(top + tile_rows, shape[0]))
+        b3, b4, b8, b11 = (bands[name].read(rows) for name in BANDS)
+        invalid = (b3 == nodata) | (b4 == nodata) | (b8 == nodata) | (b11 == nodata)
+        ndvi, msi, ndwi = stress_indices(b3, b4, b8, b11)
+        crop = crop_stress_classes(ndvi, msi)
+        water = water_stress_mask(ndwi)
+        for index in (ndvi, msi, ndwi):
+            index[invalid] = np.nan
+        crop[invalid] = NODATA_CLASS
+        water[invalid] = NODATA_CLASS
+
+        for name, values in (("NDVI", ndvi), ("MSI", msi), ("NDWI", ndwi), ("CropStress", crop), ("WaterStress", water)):
+            outputs[name].array[rows] = values
+            outputs[name].release(rows)
+        for band in bands.values():
+            band.release(rows)
+        return np.bincount(crop.ravel(), minlength=256), np.bincount(water.ravel(), minlength=256)
+
+    started = time.perf_counter()
+    crop_counts = np.zeros(256, dtype=np.int64)
+    water_counts = np.zeros(256, dtype=np.int64)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for crop, water in executor.map(run_tile, range(0, shape[0], tile_rows)):
+                crop_counts += crop
+                water_counts += water
+    finally:
+        for band in list(bands.values()) + list(outputs.values()):
+            band.close()
+    seconds = time.perf_counter() - started
+
+    input_bytes = sum(os.path.getsize(path) for path in band_paths.values())
+    return {
+        "shape": list(shape),
+        "tiles": -(-shape[0] // tile_rows),
+        "seconds": round(seconds, 3),
+        "input_mb_per_s": round(input_bytes / 1e6 / seconds, 1),
+        "megapixels_per_s": round(shape[0] * shape[1] / 1e6 / seconds, 1),
+        "outputs": {name: os.path.join(out_dir, f"{name}.npy") for name in OUTPUTS},
+        "crop_stress": {"none": int(crop_counts[0]), "moderate": int(crop_counts[1]), "severe": int(crop_counts[2])},
+        "water_stress": {"none": int(water_counts[0]), "stressed": int(water_counts[1])},
+        "nodata": int(crop_counts[NODATA_CLASS]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="NDVI/MSI/NDWI and stress classes for a downloaded scene")
+    parser.add_argument('scene', help="directory with B3, B4, B8 and B11 as .npy or GeoTIFF")
+    parser.add_argument('out', help="directory for the output .npy rasters")
+    parser.add_argument('--tile-rows', type=int, default=TILE_ROWS)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--nodata', type=float, default=0)
+    args = parser.parse_args()
+    print(json.dumps(process_scene(find_bands(args.scene), args.out, args.tile_rows, args.workers, args.nodata), indent=2))
+
+if __name__ == '__main__':
+    main()
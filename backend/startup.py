@@ -0,0 +1,67 @@
+import importlib
+import sys
+import threading
+import time
+from timing import StageTimer
+
+# Time spent loading each subsystem, whenever that happens (import, first
+# request or explicit preload)
+startup_timer = StageTimer('startup')
+process_started = time.time()
+_import_lock = threading.Lock()
+# Modules whose import has finished. sys.modules can't be the fast path:
+# a module is added there before its body runs, so another request would
+# see it half initialised.
+_loaded = {}
+
+# Import a heavy module on first use and record how long it took
+def lazy_module(name):
+    module = _loaded.get(name)
+    if module is not None:
+        return module
+    with _import_lock:
+        if name not in _loaded:
+            if name in sys.modules:
+                # Imported elsewhere; import_module waits if that is still running
+                _loaded[name] = importlib.import_module(name)
+            else:
+                with startup_timer.stage(f"{name}.import"):
+                    _loaded[name] = importlib.import_module(name)
+    return _loaded[name]
+
+# Loaders for each subsystem, used by preload()
+def _preload_iot():
+    lazy_module('iot').load_models()
+
+def _preload_cd():
+    lazy_module('cd').load_tensorflow()
+
+def _preload_sat():
+    lazy_module('sat')
+
+def _preload_chat():
+    lazy_module('cb')
+
+PRELOADERS = {
+    "iot": _preload_iot,
+    "cd": _preload_cd,
+    "sat": _preload_sat,
+    "chat": _preload_chat,
+}
+
+# Load the given subsystems now. Called before forking (e.g. gunicorn
+# preload_app) this lets workers share the loaded pages copy-on-write.
+def preload(subsystems=None):
+    for name in (subsystems or PRELOADERS):
+        name = name.strip()
+        if name:
+            PRELOADERS[name]()
+    return startup_report()
+
+def startup_report():
+    stages = startup_timer.report()
+    return {
+        "stages": stages,
+        "total_seconds": round(sum(stages.values()), 4),
+        "uptime_seconds": round(time.time() - process_started, 1),
+    }
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# One-slot mailbox for a single stream subscriber. Publishing into a full
+# mailbox replaces the waiting item, so a slow client always gets the most
+# recent tick next and never builds up a backlog. `notify`, if given, is
+# called on the publishing thread after each new item (e.g. to wake an
+# event loop).
+class Subscription:
+    def __init__(self, broadcaster, notify=None):
+        self._broadcaster = broadcaster
+        self._notify = notify
+        self._ready = threading.Condition()
+        self._item = None
+        self._pending = False
+        self.dropped = 0
+
+    def publish(self, item):
+        with self._ready:
+            if self._pending:
+                self.dropped += 1
+            self._item, self._pending = item, True
+            self._ready.notify()
+        if self._notify is not None:
+            self._notify()
+
+    # Next item, or None if nothing arrived within `timeout` seconds
+    def get(self, timeout=None):
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._pending, timeout):
+                return None
+            item, self._item, self._pending = self._item, None, False
+            return item
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+# Runs `produce` once per tick on a single background thread and fans the
+# result out to every subscriber, so the cost per tick is the same whether
+# one dashboard or a hundred are open. The thread only runs while there are
+# subscribers.
+class TickBroadcaster:
+    def __init__(self, produce, interval=5.0, name='tick-broadcaster'):
+        self.produce = produce
+        self.interval = interval
+        self.name = name
+        self.latest = None
+        self.ticks = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, notify=None):
+        subscription = Subscription(self, notify)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self.latest is not None:
+                subscription.publish(self.latest)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                item = self.produce()
+            except Exception as e:
+                item = {"error": str(e)}
+            with self._lock:
+                self.latest = item
+                self.ticks += 1
+                subscribers = list(self._subscribers)
+            # One failing subscriber must not stop the ticks for the others
+            for subscription in subscribers:
+                try:
+                    subscription.publish(item)
+                except Exception:
+                    logger.exception("Publishing to a %s subscriber failed", self.name)
+            next_tick += self.interval
+            time.sleep(max(next_tick - time.monotonic(), 0))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "ticks": self.ticks,
+                "dropped": sum(subscription.dropped for subscription in self._subscribers),
+            }
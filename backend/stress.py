@@ -0,0 +1,149 @@
+import os
+import numpy as np
+
+# Classification thresholds, the same as the Earth Engine expressions in sat.build_stress_layers
+SEVERE_NDVI, SEVERE_MSI = 0.5, 1.8
+MODERATE_NDVI, MODERATE_MSI = 0.7, 1.0
+WATER_NDWI = -0.1
+
+# A grid cell is a hotspot when at least this fraction of it is stressed
+HOTSPOT_FRACTION = float(os.environ.get('STRESS_HOTSPOT_FRACTION', 0.25))
+# Rows of the raster classified at a time by zonal_stress
+CHUNK_ROWS = int(os.environ.get('STRESS_CHUNK_ROWS', 512))
+
+CROP_CLASSES = ("none", "moderate", "severe")
+BANDS = ("B3", "B4", "B8", "B11")
+
+# NDVI, MSI and NDWI from green, red, NIR and SWIR1 (NaN where undefined)
+def stress_indices(b3, b4, b8, b11):
+    b3, b4, b8, b11 = (np.asarray(band, dtype=np.float32) for band in (b3, b4, b8, b11))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ndvi = (b8 - b4) / (b8 + b4)
+        msi = b11 / b8
+        ndwi = (b3 - b8) / (b3 + b8)
+    return ndvi, msi, ndwi
+
+# Crop stress classes (0 none, 1 moderate, 2 severe) from NDVI and MSI
+def crop_stress_classes(ndvi, msi):
+    classes = np.zeros(ndvi.shape, dtype=np.uint8)
+    classes[(ndvi < MODERATE_NDVI) & (msi > MODERATE_MSI)] = 1
+    classes[(ndvi < SEVERE_NDVI) & (msi > SEVERE_MSI)] = 2
+    return classes
+
+# Water stress mask (NDWI below the threshold)
+def water_stress_mask(ndwi):
+    return (ndwi < WATER_NDWI).astype(np.uint8)
+
+# Band arrays saved as B3.npy, B4.npy, B8.npy and B11.npy in `directory`,
+# memory-mapped so a full tile is never read into memory at once. All
+# bands must share one grid (resample the 20 m B11 to 10 m beforehand).
+def load_bands(directory):
+    bands = {}
+    for name in BANDS:
+        path = os.path.join(directory, f"{name}.npy")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing band file {path}")
+        bands[name] = np.load(path, mmap_mode='r')
+    shapes = {band.shape for band in bands.values()}
+    if len(shapes) != 1:
+        raise ValueError(f"Band shapes differ: {sorted(shapes)}")
+    return bands
+
+# Per-cell pixel counts for a grid over the raster: crop stress classes
+# (rows, cols, 3) and water stress (rows, cols, 2). The raster is
+# classified CHUNK_ROWS rows at a time; pixels equal to `nodata` in any
+# band are left out, like masked pixels in Earth Engine.
+def stress_counts(bands, grid=(8, 8), chunk_rows=CHUNK_ROWS, nodata=0):
+    height, width = bands["B8"].shape
+    grid_rows, grid_cols = grid
+    cell_of_row = (np.arange(height) * grid_rows // height).astype(np.int32)
+    cell_of_col = (np.arange(width) * grid_cols // width).astype(np.int32)
+    cells = grid_rows * grid_cols
+    crop = np.zeros(cells * 3, dtype=np.int64)
+    water = np.zeros(cells * 2, dtype=np.int64)
+
+    for top in range(0, height, chunk_rows):
+        rows = slice(top, min(top + chunk_rows, height))
+        b3, b4, b8, b11 = (np.asarray(bands[name][rows], dtype=np.float32) for name in BANDS)
+        valid = (b3 != nodata) & (b4 != nodata) & (b8 != nodata) & (b11 != nodata)
+        cell = (cell_of_row[rows, None] * grid_cols + cell_of_col[None, :])[valid]
+        ndvi, msi, ndwi = stress_indices(b3, b4, b8, b11)
+        crop += np.bincount(cell * 3 + crop_stress_classes(ndvi, msi)[valid], minlength=cells * 3)
+        water += np.bincount(cell * 2 + water_stress_mask(ndwi)[valid], minlength=cells * 2)
+
+    return crop.reshape(grid_rows, grid_cols, 3), water.reshape(grid_rows, grid_cols, 2)
+
+# Area fractions, a stressed-fraction grid and hotspot cells from per-cell
+# counts. Row 0 of the grid is the northern edge of `bbox`
+# ([min_lon, min_lat, max_lon, max_lat]), as in an image.
+def summarize_counts(crop, water, bbox):
+    grid_rows, grid_cols = crop.shape[:2]
+    min_lon, min_lat, max_lon, max_lat = bbox
+    cell_width = (max_lon - min_lon) / grid_cols
+    cell_height = (max_lat - min_lat) / grid_rows
+
+    total_crop = crop.sum(axis=(0, 1))
+    total_water = water.sum(axis=(0, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cell_crop = np.nan_to_num(crop / crop.sum(axis=2, keepdims=True))
+        cell_water = np.nan_to_num(water[..., 1] / water.sum(axis=2))
+    crop_stressed = cell_crop[..., 1] + cell_crop[..., 2]
+
+    hotspots = []
+    for row, col in zip(*np.nonzero((crop_stressed >= HOTSPOT_FRACTION) | (cell_water >= HOTSPOT_FRACTION))):
+        hotspots.append({
+            "row": int(row),
+            "col": int(col),
+            "latitude": round(float(max_lat - (row + 0.5) * cell_height), 6),
+            "longitude": round(float(min_lon + (col + 0.5) * cell_width), 6),
+            "moderate": round(float(cell_crop[row, col, 1]), 4),
+            "severe": round(float(cell_crop[row, col, 2]), 4),
+            "water": round(float(cell_water[row, col]), 4),
+        })
+    hotspots.sort(key=lambda cell: -(cell["moderate"] + cell["severe"] + cell["water"]))
+
+    return {
+        "pixels": int(total_crop.sum()),
+        "crop_stress": {
+            name: round(float(count / total_crop.sum()), 4) if total_crop.sum() else 0.0
+            for name, count in zip(CROP_CLASSES, total_crop)
+        },
+        "water_stress": round(float(total_water[1] / total_water.sum()), 4) if total_water.sum() else 0.0,
+        "grid": {
+            "rows": grid_rows,
+            "cols": grid_cols,
+            "crop_stress": np.round(crop_stressed, 4).tolist(),
+            "water_stress": np.round(cell_water, 4).tolist(),
+        },
+        "hotspots": hotspots,
+    }
+
+# Zonal stress statistics for a locally cached tile covering `bbox`
+def zonal_stress(bands, bbox, grid=(8, 8), chunk_rows=CHUNK_ROWS):
+    crop, water = stress_counts(bands, grid, chunk_rows)
+    return summarize_counts(crop, water, bbox)
+
+# Recommendations for the hotspot cells, in the format of
+# sat.recommendations_from_samples plus the stressed share of the cell
+def recommendations_from_zonal(stats):
+    recommendations = []
+    for cell in stats["hotspots"]:
+        crop_fraction = cell["moderate"] + cell["severe"]
+        if crop_fraction >= HOTSPOT_FRACTION:
+            severity = "severe" if cell["severe"] >= cell["moderate"] else "moderate"
+            recommendations.append({
+                "type": f"Crop Stress ({severity})",
+                "latitude": cell["latitude"],
+                "longitude": cell["longitude"],
+                "area_fraction": round(crop_fraction, 4),
+                "recommendation": "Apply irrigation and fertilizers to improve crop health."
+            })
+        if cell["water"] >= HOTSPOT_FRACTION:
+            recommendations.append({
+                "type": "Water Stress",
+                "latitude": cell["latitude"],
+                "longitude": cell["longitude"],
+                "area_fraction": cell["water"],
+                "recommendation": "Increase irrigation and monitor soil moisture levels."
+            })
+    return recommendations
@@ -0,0 +1,124 @@
+import argparse
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-ins for the chatbot's remote services, for tests and
+# benchmarks without network access or Earth Engine credentials:
+#
+#   /v1/forecast  Open-Meteo style hourly forecast (WEATHER_API_URL)
+#   /satellite    farm sample with NDVI, NDWI and SoilMoisture (SATELLITE_CONTEXT_URL)
+#
+# Responses are deterministic in lat/lon and each request sleeps for the
+# configured latency to mimic a remote round trip.
+#
+#   python stub_services.py --port 8765 --latency 0.5
+
+# Hours in a forecast response (30 past days + 7 forecast days, as requested by cb.py)
+FORECAST_HOURS = 37 * 24
+
+def forecast_payload(lat, lon):
+    phase = (lat * 7 + lon * 3) % 24
+    temperature = [round(27 + 6 * math.sin(2 * math.pi * (hour + phase) / 24), 1) for hour in range(FORECAST_HOURS)]
+    precipitation = [round(max(0.0, 2 * math.sin(hour / 17 + lat)), 2) for hour in range(FORECAST_HOURS)]
+    soil_moisture = [round(0.2 + 0.05 * math.sin(hour / 50 + lon), 3) for hour in range(FORECAST_HOURS)]
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "hourly": {
+            "temperature_2m": temperature,
+            "precipitation": precipitation,
+            "soil_moisture_0_1cm": soil_moisture,
+        },
+    }
+
+def satellite_payload(lat, lon):
+    return {
+        "NDVI": round(0.45 + 0.2 * math.sin(lat + lon), 4),
+        "NDWI": round(0.05 * math.cos(lat - lon), 4),
+        "SoilMoisture": round(6.5 + 0.5 * math.sin(lat * lon), 2),
+    }
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled sessions can reuse connections
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        routes = {"/v1/forecast": ("latitude", "longitude", forecast_payload), "/satellite": ("lat", "lon", satellite_payload)}
+        if url.path not in routes:
+            self.send_json(404, {"error": "not found"})
+            return
+        lat_name, lon_name, payload = routes[url.path]
+        try:
+            lat, lon = float(query[lat_name]), float(query[lon_name])
+        except (KeyError, ValueError):
+            self.send_json(400, {"error": f"{lat_name} and {lon_name} are required"})
+            return
+        self.server.count(url.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_json(200, payload(lat, lon))
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # Environment variables that point cb.py at this server
+    def environment(self):
+        return {
+            "WEATHER_API_URL": f"{self.base_url}/v1/forecast",
+            "SATELLITE_CONTEXT_URL": f"{self.base_url}/satellite",
+        }
+
+# Start a stub server on a background thread (port 0 picks a free port)
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0):
+    server = StubServer((host, port), latency)
+    threading.Thread(target=server.serve_forever, name="stub-services", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-ins for the weather and satellite services")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds to sleep per request")
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), args.latency)
+    for name, value in server.environment().items():
+        print(f"export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
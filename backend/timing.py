@@ -0,0 +1,32 @@
+import threading
+import time
+from contextlib import contextmanager
+from metrics import observe_stage
+
+# Accumulates wall-clock seconds per named stage. One instance can be shared
+# across threads; stages keep the order in which they were first recorded.
+# With a `subsystem`, every stage is also recorded in the process-wide
+# stage_duration_seconds histogram served at /metrics.
+class StageTimer:
+    def __init__(self, subsystem=None):
+        self.subsystem = subsystem
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._stages[name] = self._stages.get(name, 0.0) + seconds
+        if self.subsystem is not None:
+            observe_stage(self.subsystem, name, seconds)
+
+    def report(self, digits=4):
+        with self._lock:
+            return {name: round(seconds, digits) for name, seconds in self._stages.items()}
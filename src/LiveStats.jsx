@@ -11,28 +11,32 @@ const LiveStats = () => {
   const [error, setError] = useState(null);
 
   useEffect(() => {
+    const handleData = (data) => {
+      const newData = {
+        timestamp: data.Timestamp,
+        soil_moisture: data.Soil_Moisture_pct,
+        temperature: data.Temperature_C,
+        humidity: data.Humidity_pct,
+        rainfall: data.Rainfall_mm,
+        ndvi: data.NDVI_Mean,
+        soil_ph: data.Soil_pH,
+        soil_ec: data.Soil_EC_dS_m,
+      };
+      const newRecommendations = {
+        water_needed: data.Water_Needed_liters_ha_day,
+        fertilizer_needed: data.Fertilizer_Needed_kg_ha,
+      };
+
+      setSensorData((prevData) => [...prevData, newData].slice(-10));
+      setRecommendations(newRecommendations);
+    };
+
     const fetchData = async () => {
       setLoading(true);
       setError(null);
       try {
         const response = await axios.get("http://localhost:5000/api/iot-data");
-        const newData = {
-          timestamp: response.data.Timestamp,
-          soil_moisture: response.data.Soil_Moisture_pct,
-          temperature: response.data.Temperature_C,
-          humidity: response.data.Humidity_pct,
-          rainfall: response.data.Rainfall_mm,
-          ndvi: response.data.NDVI_Mean,
-          soil_ph: response.data.Soil_pH,
-          soil_ec: response.data.Soil_EC_dS_m,
-        };
-        const newRecommendations = {
-          water_needed: response.data.Water_Needed_liters_ha_day,
-          fertilizer_needed: response.data.Fertilizer_Needed_kg_ha,
-        };
-
-        setSensorData((prevData) => [...prevData, newData].slice(-10));
-        setRecommendations(newRecommendations);
+        handleData(response.data);
       } catch (err) {
         setError("Error fetching IoT data. Please try again.");
       } finally {
@@ -40,9 +44,42 @@ const LiveStats = () => {
       }
     };
 
-    const interval = setInterval(fetchData, 5000);
-    fetchData();
-    return () => clearInterval(interval);
+    // Fall back to polling every 5 seconds when the stream is unavailable
+    let interval = null;
+    const startPolling = () => {
+      if (!interval) {
+        fetchData();
+        interval = setInterval(fetchData, 5000);
+      }
+    };
+
+    if (!window.EventSource) {
+      startPolling();
+      return () => clearInterval(interval);
+    }
+
+    // Receive readings pushed by the server instead of polling
+    setLoading(true);
+    const source = new EventSource("http://localhost:5000/api/iot-stream");
+    source.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      setLoading(false);
+      if (data.error) {
+        setError("Error fetching IoT data. Please try again.");
+        return;
+      }
+      setError(null);
+      handleData(data);
+    };
+    source.onerror = () => {
+      source.close();
+      startPolling();
+    };
+
+    return () => {
+      source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
   return (
@@ -1,11 +1,34 @@
 import React, { useState } from "react";
+import { ComposedChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from "recharts";
 import Header from "./Header";
 
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+// Turn the compact NDVI series from the backend into chart rows
+const seriesToRows = (series) => {
+  const start = Date.parse(series.start);
+  const toDate = (t) => new Date(start + t * DAY_MS).toISOString().slice(0, 10);
+  const historyAnomalies = new Set(series.anomaly);
+  const futureAnomalies = new Set(series.future.anomaly);
+  const history = series.t.map((t, i) => ({
+    date: toDate(t),
+    ndvi: series.ndvi[i],
+    anomaly: historyAnomalies.has(i) ? series.ndvi[i] : null,
+  }));
+  const future = series.future.t.map((t, i) => ({
+    date: toDate(t),
+    future: series.future.ndvi[i],
+    futureAnomaly: futureAnomalies.has(i) ? series.future.ndvi[i] : null,
+  }));
+  return history.concat(future);
+};
+
 const SatelliteData = () => {
   const [coords, setCoords] = useState("");
   const [startDate, setStartDate] = useState("2023-01-01");
   const [endDate, setEndDate] = useState("2023-10-01");
   const [ndviPlot, setNdviPlot] = useState(""); // Base64 image of NDVI plot
+  const [ndviRows, setNdviRows] = useState([]); // NDVI series drawn client-side
   const [futureAnomalies, setFutureAnomalies] = useState([]); // Future anomaly dates
   const [recommendations, setRecommendations] = useState([]); // Recommendations
   const [loading, setLoading] = useState(false);
@@ -20,7 +43,7 @@ const SatelliteData = () => {
       const response = await fetch("http://localhost:5000/api/analyze-satellite", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ coords, startDate, endDate }),
+        body: JSON.stringify({ coords, startDate, endDate, format: "series" }),
       });
 
       if (!response.ok) {
@@ -31,6 +54,7 @@ const SatelliteData = () => {
       const data = await response.json();
       console.log("API Response:", data); // Debug log
 
+      setNdviRows(data.ndvi_series ? seriesToRows(data.ndvi_series) : []); // NDVI series
       setNdviPlot(data.ndvi_plot || ""); // Base64 image of NDVI plot
       setFutureAnomalies(data.future_anomalies || []); // Future anomaly dates
       setRecommendations(data.recommendations || []); // Recommendations
@@ -132,7 +156,32 @@ const SatelliteData = () => {
         {error && <p style={{ color: "red", marginTop: "10px", textAlign: "center" }}>{error}</p>}
 
         {/* NDVI Plot */}
-        {ndviPlot ? (
+        {ndviRows.length > 0 ? (
+          <div style={{ marginTop: "20px" }}>
+            <h2>NDVI Time Series with Anomalies</h2>
+            <ResponsiveContainer width="100%" height={400}>
+              <ComposedChart data={ndviRows}>
+                <CartesianGrid strokeDasharray="3 3" stroke="rgba(255, 255, 255, 0.3)" />
+                <XAxis dataKey="date" stroke="#ffffff" minTickGap={40} />
+                <YAxis stroke="#ffffff" domain={["auto", "auto"]} />
+                <Tooltip
+                  contentStyle={{
+                    backgroundColor: "rgba(0, 0, 0, 0.7)",
+                    border: "none",
+                    borderRadius: "5px",
+                  }}
+                  itemStyle={{ color: "#ffffff" }}
+                />
+                <Legend />
+                <Line type="monotone" dataKey="ndvi" stroke="#008000" strokeWidth={2} dot={false} isAnimationActive={false} name="NDVI" />
+                {/* Points only: no stroke, and recharts draws no dot where the value is null */}
+                <Line dataKey="anomaly" stroke="none" dot={{ r: 4, fill: "#ff0000", stroke: "#ff0000" }} legendType="circle" isAnimationActive={false} name="Anomalies" />
+                <Line type="monotone" dataKey="future" stroke="#0000ff" strokeWidth={2} strokeDasharray="6 4" dot={false} isAnimationActive={false} name="Future NDVI" />
+                <Line dataKey="futureAnomaly" stroke="none" dot={{ r: 4, fill: "#ffa500", stroke: "#ffa500" }} legendType="circle" isAnimationActive={false} name="Future Anomalies" />
+              </ComposedChart>
+            </ResponsiveContainer>
+          </div>
+        ) : ndviPlot ? (
           <div style={{ marginTop: "20px" }}>
             <h2>NDVI Time Series with Anomalies</h2>
             <img src={`data:image/png;base64,${ndviPlot}`} alt="NDVI Plot" style={{ width: "100%", height: "auto" }} />